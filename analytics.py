@@ -0,0 +1,230 @@
+# analytics.py
+# Sales aggregates and order history export.
+#
+# SalesAggregates is updated once per confirmed order and keeps everything
+# /sales shows already summed: units and revenue per item and per category,
+# the best sellers in each category, and hourly and daily rollups for recent
+# history. Answering a query never walks the order history.
+#
+# The export functions turn batches of orders into CSV or JSON-lines text one
+# chunk at a time, so the full history is never held in memory. From the
+# command line:
+#   python analytics.py export --db market.db --format csv > orders.csv
+import argparse
+import csv
+import io
+import json
+import sqlite3
+import sys
+import time
+from datetime import datetime, timezone
+
+from catalog import to_cents
+from storage import iter_order_batches
+
+HOUR = 3600
+DAY = 86400
+TOP_ITEMS = 5
+
+
+def _subtotal(line: dict) -> int:
+    # What the line sold for, in cents, after any discount
+    return to_cents(line["price"]) * line["quantity"] - to_cents(line.get("discount", 0))
+
+
+class _Totals:
+    __slots__ = ("orders", "units", "revenue_cents")
+
+    def __init__(self):
+        self.orders = 0
+        self.units = 0
+        self.revenue_cents = 0
+
+    def add(self, orders, units, revenue_cents):
+        self.orders += orders
+        self.units += units
+        self.revenue_cents += revenue_cents
+
+
+class SalesAggregates:
+    def __init__(self, retain_hours: int = 24 * 14, retain_days: int = 366):
+        self.retain_hours = retain_hours
+        self.retain_days = retain_days
+        self.totals = _Totals()
+        # item id -> [units, revenue cents]; names and categories as last seen
+        self.items = {}
+        self.item_names = {}
+        self.item_categories = {}
+        self.categories = {}
+        # category -> item ids with the most units sold, best first
+        self.best_sellers = {}
+        # bucket number (time // size) -> _Totals
+        self.hours = {}
+        self.days = {}
+        self.last_order_at = None
+        # False until history from before this process started has been replayed
+        self.ready = False
+        # Set if that replay failed; totals then only cover orders since startup
+        self.replay_error = None
+
+    async def replay(self, batches):
+        """Add past orders from an async iterable of order batches."""
+        async for orders in batches:
+            for order in orders:
+                self.record(order["created_at"], order["lines"])
+        self.ready = True
+
+    def record(self, created_at: float, lines: list):
+        """Add one order. lines are receipt lines (id, category, name, price,
+        quantity and, if discounted, discount)."""
+        units = 0
+        revenue = 0
+        seen = set()
+        for line in lines:
+            item_id = line["id"]
+            quantity = line["quantity"]
+            subtotal = _subtotal(line)
+            units += quantity
+            revenue += subtotal
+
+            entry = self.items.get(item_id)
+            if entry is None:
+                entry = self.items[item_id] = [0, 0]
+            entry[0] += quantity
+            entry[1] += subtotal
+            self.item_names[item_id] = line["name"]
+            category = self.item_categories[item_id] = line["category"]
+
+            totals = self.categories.get(category)
+            if totals is None:
+                totals = self.categories[category] = _Totals()
+            totals.add(0 if category in seen else 1, quantity, subtotal)
+            seen.add(category)
+            self._rank(category, item_id)
+
+        self.totals.add(1, units, revenue)
+        self._bucket(self.hours, created_at // HOUR, self.retain_hours).add(1, units, revenue)
+        self._bucket(self.days, created_at // DAY, self.retain_days).add(1, units, revenue)
+        if self.last_order_at is None or created_at > self.last_order_at:
+            self.last_order_at = created_at
+
+    def _rank(self, category, item_id):
+        # Units only ever go up, so an item can only move towards the front
+        top = self.best_sellers.setdefault(category, [])
+        units = self.items[item_id][0]
+        if item_id not in top:
+            if len(top) >= TOP_ITEMS and units <= self.items[top[-1]][0]:
+                return
+            top.append(item_id)
+        top.sort(key=lambda i: -self.items[i][0])
+        del top[TOP_ITEMS:]
+
+    def _bucket(self, buckets, number, retain):
+        number = int(number)
+        bucket = buckets.get(number)
+        if bucket is None:
+            bucket = buckets[number] = _Totals()
+            # A new bucket is started at most once per period; drop the expired ones then
+            cutoff = max(buckets) - retain
+            for old in [n for n in buckets if n <= cutoff]:
+                del buckets[old]
+        return bucket
+
+    def window(self, hours: int, now: float = None) -> _Totals:
+        """Totals over the last `hours` hourly buckets, including the current one."""
+        current = int((time.time() if now is None else now) // HOUR)
+        totals = _Totals()
+        for number in range(current - hours + 1, current + 1):
+            bucket = self.hours.get(number)
+            if bucket is not None:
+                totals.add(bucket.orders, bucket.units, bucket.revenue_cents)
+        return totals
+
+    def busiest_hour(self, hours: int = 24, now: float = None):
+        """(hour start timestamp, _Totals) with the most revenue in the window, or None."""
+        current = int((time.time() if now is None else now) // HOUR)
+        best = None
+        for number in range(current - hours + 1, current + 1):
+            bucket = self.hours.get(number)
+            if bucket is not None and (best is None or bucket.revenue_cents > best[1].revenue_cents):
+                best = (number * HOUR, bucket)
+        return best
+
+    def category_revenue(self) -> dict:
+        return {name: totals.revenue_cents for name, totals in self.categories.items()}
+
+
+# --- export ---
+
+CSV_COLUMNS = (
+    "order_id", "user_id", "created_at", "item_id", "category", "name", "price", "quantity", "discount", "subtotal",
+)
+FORMATS = ("csv", "jsonl")
+
+
+def _iso(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat(timespec="seconds")
+
+
+def _amount(cents: int):
+    return cents // 100 if cents % 100 == 0 else cents / 100
+
+
+def encode_batch(orders: list, fmt: str, header: bool = False) -> str:
+    """One chunk of export text for a batch of orders (dicts with id, user_id,
+    created_at, total and lines). CSV has one row per order line; JSONL one
+    object per order."""
+    if fmt == "jsonl":
+        return "".join(
+            json.dumps(dict(order, created_at=_iso(order["created_at"])), separators=(",", ":")) + "\n"
+            for order in orders
+        )
+    if fmt != "csv":
+        raise ValueError(f"Unknown export format {fmt!r}")
+    out = io.StringIO()
+    writer = csv.writer(out)
+    if header:
+        writer.writerow(CSV_COLUMNS)
+    for order in orders:
+        created_at = _iso(order["created_at"])
+        for line in order["lines"]:
+            writer.writerow((
+                order["id"], order["user_id"], created_at, line["id"], line["category"], line["name"],
+                line["price"], line["quantity"], line.get("discount", 0), _amount(_subtotal(line)),
+            ))
+    return out.getvalue()
+
+
+async def export_chunks(batches, fmt: str):
+    """Async generator of export text from an async iterable of order batches."""
+    first = True
+    async for orders in batches:
+        yield encode_batch(orders, fmt, header=first)
+        first = False
+    if first and fmt == "csv":
+        yield encode_batch([], fmt, header=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Market order history tools.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export", help="write the order history to stdout")
+    export.add_argument("--db", default="market.db")
+    export.add_argument("--format", choices=FORMATS, default="csv")
+    export.add_argument("--batch", type=int, default=1000)
+    args = parser.parse_args(argv)
+
+    conn = sqlite3.connect(f"file:{args.db}?mode=ro", uri=True)
+    try:
+        first = True
+        for orders in iter_order_batches(conn, args.batch):
+            sys.stdout.write(encode_batch(orders, args.format, header=first))
+            first = False
+        if first and args.format == "csv":
+            sys.stdout.write(encode_batch([], "csv", header=True))
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+# benchmarks/bench_interactions.py
+# Offline benchmark of the market flow.
+#
+# Drives /market -> category -> items -> quantities -> view cart -> confirm
+# through the real handlers with fake interactions, for N concurrent users,
+# and reports per-step latency percentiles, time to acknowledge, allocations
+# and throughput.
+#
+#   python -m benchmarks.bench_interactions --users 200 --lines 10 --quantity 25
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+import bot
+from benchmarks.fakes import FakeInteraction, click, submit_modal
+from settings import Settings
+
+STEPS = ("market", "category_select", "item_select", "quantity_submit", "view_cart", "confirm_order")
+MAX_MODAL_ITEMS = 5
+
+
+def offline_settings(rate_limits: bool = False) -> Settings:
+    """Settings from the environment, with an in-memory order store unless
+    ORDER_DB_PATH is set. Simulated users act faster than people, so rate
+    limits are off unless asked for."""
+    env = {"ORDER_DB_PATH": ":memory:"}
+    if not rate_limits:
+        env.update(RATE_LIMIT_USER="0", RATE_LIMIT_GUILD="0", RATE_LIMIT_GLOBAL="0", REPEAT_WINDOW="0")
+    env.update(os.environ)
+    return Settings(env)
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+def plan_cart(lines: int):
+    """Split the first `lines` catalog items into per-category picks of at most 5."""
+    catalog = bot.catalog_source.catalog
+    picks = []
+    remaining = lines
+    while remaining > 0:
+        progressed = False
+        for category in catalog.categories:
+            item_ids = [item["id"] for item in catalog.items_in(category)]
+            for start in range(0, len(item_ids), MAX_MODAL_ITEMS):
+                chunk = item_ids[start:start + MAX_MODAL_ITEMS][:remaining]
+                if not chunk:
+                    break
+                picks.append((category, chunk))
+                remaining -= len(chunk)
+                progressed = True
+                if remaining <= 0:
+                    return picks
+        if not progressed:
+            break
+    return picks
+
+
+class Recorder:
+    def __init__(self, trace_memory: bool = False):
+        self.trace_memory = trace_memory
+        self.latency = {step: [] for step in STEPS}
+        self.ack = {step: [] for step in STEPS}
+        self.peak = {step: [] for step in STEPS}
+        self.retained = {step: [] for step in STEPS}
+
+    async def run(self, step, coro, interaction):
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+        started = time.perf_counter()
+        result = await coro
+        self.latency[step].append(time.perf_counter() - started)
+        if interaction.response.acked_at is not None:
+            self.ack[step].append(interaction.response.acked_at - started)
+        if self.trace_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            self.peak[step].append(peak - before)
+            self.retained[step].append(current - before)
+        return result
+
+
+async def shopper(user_id: int, picks, quantity: int, rec: Recorder):
+    interaction = FakeInteraction(user_id)
+    await rec.run("market", bot.market.callback(interaction), interaction)
+    view = interaction.response.last["view"]
+
+    for category, item_ids in picks:
+        interaction = FakeInteraction(user_id)
+        reply = await rec.run("category_select", click(view, "category", interaction, [category]), interaction)
+        item_view = reply["view"]
+
+        interaction = FakeInteraction(user_id)
+        reply = await rec.run("item_select", click(item_view, "items", interaction, item_ids), interaction)
+        modal = reply["modal"]
+
+        interaction = FakeInteraction(user_id)
+        reply = await rec.run("quantity_submit", submit_modal(modal, interaction, [quantity] * len(item_ids)), interaction)
+        view = item_view = reply["view"]
+
+        # Back to the category list for the next pick
+        interaction = FakeInteraction(user_id)
+        view = (await click(item_view, "browse_categories", interaction))["view"]
+
+    interaction = FakeInteraction(user_id)
+    reply = await rec.run("view_cart", click(item_view, "view_cart", interaction), interaction)
+    cart_view = reply["view"]
+
+    interaction = FakeInteraction(user_id)
+    await rec.run("confirm_order", click(cart_view, "confirm_order", interaction), interaction)
+
+
+async def run_benchmark(users: int, lines: int, quantity: int, rounds: int, alloc_users: int):
+    bot.create_bot(offline_settings())
+    await bot.order_store.start()
+    await bot.cart_store.start()
+    picks = plan_cart(lines)
+    try:
+        # Timing pass: users shop concurrently
+        rec = Recorder()
+        started = time.perf_counter()
+        for round_no in range(rounds):
+            base = round_no * users
+            await asyncio.gather(*(shopper(base + i + 1, picks, quantity, rec) for i in range(users)))
+        elapsed = time.perf_counter() - started
+
+        # Allocation pass: sequential so each step's allocations can be attributed
+        alloc = Recorder(trace_memory=True)
+        tracemalloc.start()
+        try:
+            for i in range(alloc_users):
+                await shopper(10_000_000 + i, picks, quantity, alloc)
+        finally:
+            tracemalloc.stop()
+    finally:
+        await bot.jobs.close()
+        await bot.cart_store.close()
+        await bot.order_store.close()
+
+    flows = users * rounds
+    interactions = sum(len(samples) for samples in rec.latency.values())
+    report = {
+        "users": users,
+        "rounds": rounds,
+        "cart_lines": sum(len(ids) for _, ids in picks),
+        "quantity": quantity,
+        "elapsed_s": elapsed,
+        "flows_per_s": flows / elapsed if elapsed else 0.0,
+        "interactions_per_s": interactions / elapsed if elapsed else 0.0,
+        "steps": {},
+    }
+    for step in STEPS:
+        samples = sorted(rec.latency[step])
+        acks = sorted(rec.ack[step])
+        peaks = alloc.peak[step]
+        retained = alloc.retained[step]
+        report["steps"][step] = {
+            "count": len(samples),
+            "p50_ms": percentile(samples, 50) * 1000,
+            "p90_ms": percentile(samples, 90) * 1000,
+            "p99_ms": percentile(samples, 99) * 1000,
+            "max_ms": (samples[-1] if samples else 0.0) * 1000,
+            "ack_p50_ms": percentile(acks, 50) * 1000,
+            "ack_p99_ms": percentile(acks, 99) * 1000,
+            "alloc_peak_kib": (sum(peaks) / len(peaks) / 1024) if peaks else 0.0,
+            "alloc_retained_kib": (sum(retained) / len(retained) / 1024) if retained else 0.0,
+        }
+    return report
+
+
+def print_report(report):
+    print(
+        f"{report['users']} users x {report['rounds']} round(s), "
+        f"{report['cart_lines']} cart lines x{report['quantity']}: "
+        f"{report['flows_per_s']:.1f} flows/s, {report['interactions_per_s']:.1f} interactions/s"
+    )
+    header = (
+        f"{'step':<16}{'count':>8}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}"
+        f"{'ack p50':>10}{'ack p99':>10}{'peak KiB':>11}{'kept KiB':>11}"
+    )
+    print(header)
+    print("-" * len(header))
+    for step, s in report["steps"].items():
+        print(
+            f"{step:<16}{s['count']:>8}{s['p50_ms']:>10.3f}{s['p90_ms']:>10.3f}{s['p99_ms']:>10.3f}"
+            f"{s['max_ms']:>10.3f}{s['ack_p50_ms']:>10.3f}{s['ack_p99_ms']:>10.3f}"
+            f"{s['alloc_peak_kib']:>11.2f}{s['alloc_retained_kib']:>11.2f}"
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmark of the market interaction flow.")
+    parser.add_argument("--users", type=int, default=100, help="concurrent simulated users")
+    parser.add_argument("--lines", type=int, default=5, help="distinct items per cart")
+    parser.add_argument("--quantity", type=int, default=10, help="quantity entered per item (1-99)")
+    parser.add_argument("--rounds", type=int, default=3, help="times to repeat the concurrent batch")
+    parser.add_argument("--alloc-users", type=int, default=20, help="users in the tracemalloc pass")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(run_benchmark(args.users, args.lines, args.quantity, args.rounds, args.alloc_users))
+    if args.json:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+# benchmarks/bench_logging.py
+# How much event-loop time logging costs at a given interaction rate.
+#
+# Fake interactions arrive at --rate per second. Each one runs through
+# metrics.observe() (so it produces the real per-interaction record, with its
+# context) and its handler logs --records more INFO lines. The same load is run
+# with logging off, with handlers writing synchronously on the loop (what
+# logging.basicConfig plus a FileHandler does), and through the queued pipeline
+# in logs.py. --slow-ms makes every write block that long, like a congested
+# disk or a slow terminal.
+#
+#   python -m benchmarks.bench_logging --rate 500 --seconds 5 --slow-ms 1
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+import metrics
+from benchmarks.bench_interactions import percentile
+from benchmarks.fakes import FakeInteraction
+from benchmarks.loadtest import LoopLag
+from logs import JsonFormatter, LogPipeline
+
+MODES = ("off", "sync", "queue")
+
+log = logging.getLogger("market.bench")
+
+
+class SlowFile:
+    """File wrapper whose writes block for `delay` seconds."""
+
+    def __init__(self, path: str, delay: float):
+        self._file = open(path, "a", encoding="utf-8")
+        self.delay = delay
+
+    def write(self, text):
+        if self.delay:
+            time.sleep(self.delay)
+        return self._file.write(text)
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+def configure(mode: str, path: str, slow: float, sample: float):
+    """Install logging for a mode; returns a callable that tears it down."""
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    if mode == "off":
+        root.setLevel(logging.WARNING)
+        return lambda: None
+
+    stream = SlowFile(path, slow)
+    if mode == "sync":
+        handler = logging.StreamHandler(stream)
+        handler.setFormatter(JsonFormatter())
+        root.addHandler(handler)
+        root.setLevel(logging.INFO)
+
+        def stop():
+            root.removeHandler(handler)
+            stream.close()
+        return stop
+
+    pipeline = LogPipeline(
+        level="INFO", fmt="json", stream=stream,
+        samples={"market.interaction": sample} if sample < 1 else None,
+        queue_size=100000,
+    ).start()
+
+    def stop():
+        pipeline.stop()
+        stream.close()
+    stop.pipeline = pipeline
+    return stop
+
+
+async def handler(records: int):
+    for n in range(records):
+        log.info("step %d", n, extra={"item_id": "pallet-coke", "quantity": 3})
+
+
+async def run_mode(mode: str, rate: float, seconds: float, records: int, slow: float, sample: float, path: str):
+    stop = configure(mode, path, slow, sample)
+    lag = LoopLag(0.005)
+    lag.start()
+    loop_time = []
+    interval = 1 / rate
+    started = time.perf_counter()
+    count = int(rate * seconds)
+    try:
+        for n in range(count):
+            # Arrivals on a fixed schedule; fall behind rather than skip
+            delay = started + n * interval - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            interaction = FakeInteraction(n % 500 + 1)
+            t0 = time.perf_counter()
+            await metrics.observe("bench.handler", interaction, lambda: handler(records))
+            loop_time.append(time.perf_counter() - t0)
+        elapsed = time.perf_counter() - started
+        drained_at = time.perf_counter()
+    finally:
+        await lag.stop()
+        pipeline = getattr(stop, "pipeline", None)
+        stats = pipeline.stats() if pipeline is not None else {}
+        stop()
+    # Stopping the listener writes out the backlog
+    drain = time.perf_counter() - drained_at
+
+    loop_time.sort()
+    lags = sorted(lag.samples)
+    return {
+        "mode": mode,
+        "interactions": count,
+        "records_per_interaction": records + 1,
+        "achieved_rate": count / elapsed if elapsed else 0.0,
+        "loop_us_mean": sum(loop_time) / len(loop_time) * 1e6 if loop_time else 0.0,
+        "loop_us_p99": percentile(loop_time, 99) * 1e6,
+        "loop_busy_pct": sum(loop_time) / elapsed * 100 if elapsed else 0.0,
+        "lag_p99_ms": percentile(lags, 99) * 1000,
+        "lag_max_ms": (lags[-1] if lags else 0.0) * 1000,
+        "drain_s": drain,
+        "dropped_sampled": stats.get("dropped_sampled", 0),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Event-loop cost of logging at a given interaction rate.")
+    parser.add_argument("--rate", type=float, default=500, help="interactions per second")
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--records", type=int, default=2, help="extra INFO records per interaction")
+    parser.add_argument("--slow-ms", type=float, default=0.0, help="block every write for this long")
+    parser.add_argument("--sample", type=float, default=1.0, help="fraction of per-interaction records kept (queue mode)")
+    parser.add_argument("--modes", default=",".join(MODES))
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args(argv)
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in args.modes.split(","):
+            path = os.path.join(tmp, f"{mode}.log")
+            results.append(asyncio.run(run_mode(
+                mode, args.rate, args.seconds, args.records, args.slow_ms / 1000, args.sample, path
+            )))
+    base = next((r["loop_us_mean"] for r in results if r["mode"] == "off"), None)
+
+    if args.json:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+        return
+    print(
+        f"{args.rate:.0f} interactions/s for {args.seconds:.0f}s, {args.records + 1} records each, "
+        f"writes block {args.slow_ms:.1f} ms"
+    )
+    header = (
+        f"{'mode':<8}{'rate/s':>9}{'loop us':>10}{'logging us':>12}{'loop p99 us':>13}"
+        f"{'busy %':>8}{'lag p99 ms':>12}{'lag max ms':>12}{'drain s':>9}"
+    )
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        cost = r["loop_us_mean"] - base if base is not None else float("nan")
+        print(
+            f"{r['mode']:<8}{r['achieved_rate']:>9.0f}{r['loop_us_mean']:>10.1f}{cost:>12.1f}{r['loop_us_p99']:>13.1f}"
+            f"{r['loop_busy_pct']:>8.1f}{r['lag_p99_ms']:>12.2f}{r['lag_max_ms']:>12.2f}{r['drain_s']:>9.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
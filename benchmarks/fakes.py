@@ -0,0 +1,130 @@
+# benchmarks/fakes.py
+# Local stand-ins for discord.Interaction and friends, so the market handlers
+# can be driven without a gateway connection or any HTTP calls.
+import asyncio
+import itertools
+import time
+
+import routing
+
+_ids = itertools.count(1)
+
+
+class FakeUser:
+    def __init__(self, user_id: int):
+        self.id = user_id
+        self.display_name = f"shopper-{user_id}"
+        self.name = self.display_name
+
+
+class FakeResponse:
+    """Records what a handler sent. `delay` simulates the Discord API round-trip.
+    Everything but a defer is also appended to `sent`, shared with the followups."""
+
+    def __init__(self, delay: float = 0.0, sent=None):
+        self.delay = delay
+        self.calls = []
+        self.sent = [] if sent is None else sent
+        self._done = False
+        # perf_counter() when the interaction was first acknowledged
+        self.acked_at = None
+
+    def is_done(self):
+        return self._done
+
+    async def _reply(self, kind, payload):
+        if self._done:
+            raise RuntimeError("This interaction has already been responded to before")
+        self._done = True
+        self.acked_at = time.perf_counter()
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        self.calls.append((kind, payload))
+        if kind != "defer":
+            self.sent.append(payload)
+
+    async def send_message(self, content=None, **kwargs):
+        await self._reply("send_message", dict(kwargs, content=content))
+
+    async def edit_message(self, **kwargs):
+        await self._reply("edit_message", kwargs)
+
+    async def send_modal(self, modal):
+        await self._reply("send_modal", {"modal": modal})
+
+    async def defer(self, **kwargs):
+        await self._reply("defer", kwargs)
+
+    @property
+    def last(self):
+        return self.calls[-1][1] if self.calls else None
+
+
+class FakeFollowup:
+    def __init__(self, delay: float = 0.0, sent=None):
+        self.delay = delay
+        self.calls = []
+        self.sent = [] if sent is None else sent
+
+    async def send(self, content=None, **kwargs):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        payload = dict(kwargs, content=content)
+        self.calls.append(payload)
+        self.sent.append(payload)
+
+
+class FakeInteraction:
+    def __init__(self, user_id: int, guild_id: int = 1, delay: float = 0.0, data=None):
+        self.id = next(_ids)
+        self.user = FakeUser(user_id)
+        self.guild_id = guild_id
+        self.guild = None
+        self.channel_id = 1
+        self.data = data or {}
+        # Replies in the order they were made, however they were made
+        self.sent = []
+        self.response = FakeResponse(delay, self.sent)
+        self.followup = FakeFollowup(delay, self.sent)
+        self.edits = []
+
+    async def edit_original_response(self, **kwargs):
+        if self.response.delay:
+            await asyncio.sleep(self.response.delay)
+        self.edits.append(kwargs)
+        self.sent.append(kwargs)
+
+    @property
+    def reply(self):
+        # The handler's main reply: the response itself, or the first edit or
+        # followup after a defer
+        return self.sent[0] if self.sent else None
+
+
+def find_component(view, action: str):
+    for component in view.children:
+        if getattr(component, "action", None) == action:
+            return component
+    raise LookupError(f"No {action!r} component in {type(view).__name__}")
+
+
+async def click(view, action: str, interaction: FakeInteraction, values=None):
+    """Dispatch a component the way the library does: rebuild it from its
+    custom_id, fill in the selected values, check ownership, run the callback."""
+    sent = find_component(view, action)
+    match = routing.MarketComponent.__discord_ui_compiled_template__.fullmatch(sent.custom_id)
+    component = await routing.MarketComponent.from_custom_id(interaction, sent.item, match)
+    if values is not None:
+        component.item._values = list(values)
+    if await component.interaction_check(interaction):
+        await component.callback(interaction)
+    return interaction.reply
+
+
+async def submit_modal(modal, interaction: FakeInteraction, values):
+    # Text inputs keep the submitted text in _value once the library parses the payload
+    for text_input, value in zip(modal.children, values):
+        text_input._value = str(value)
+    if await modal.interaction_check(interaction):
+        await modal.on_submit(interaction)
+    return interaction.reply
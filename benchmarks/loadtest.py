@@ -0,0 +1,375 @@
+# benchmarks/loadtest.py
+# Load test: many shoppers arriving in bursts, with think time between steps.
+#
+# Each session is a trace of steps (/market -> category -> items -> quantities
+# -> ... -> view cart -> confirm), each with the think time to wait before it.
+# Sessions are generated, or replayed from a JSON-lines trace file (one
+# session per line, the format --save-trace writes). Every step runs through
+# the real handlers with fake interactions whose Discord API calls take
+# --api-latency ms. Reports end-to-end latency per step, event-loop lag, RSS
+# and the number of live View objects sampled over the run.
+#
+#   python -m benchmarks.loadtest --shoppers 1000 --bursts 3 --burst-window 5
+#   python -m benchmarks.loadtest --trace sessions.jsonl
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import resource
+import sys
+import time
+import weakref
+
+import discord
+
+import bot
+from benchmarks.bench_interactions import offline_settings, percentile
+from benchmarks.fakes import FakeInteraction, click, submit_modal
+from settings import Settings
+
+STEPS = ("market", "category", "items", "quantities", "browse", "view_cart", "confirm")
+MAX_MODAL_ITEMS = 5
+_BaseView = getattr(discord.ui.view, "BaseView", discord.ui.View)
+
+
+def think_time(rng: random.Random, mean: float) -> float:
+    # Log-normal: most pauses are short, a few are long
+    if mean <= 0:
+        return 0.0
+    sigma = 0.8
+    return rng.lognormvariate(math.log(mean) - sigma * sigma / 2, sigma)
+
+
+def synthetic_sessions(catalog, shoppers: int, bursts: int = 1, burst_window: float = 5.0,
+                       burst_gap: float = 30.0, think: float = 2.0, max_picks: int = 3, seed: int = 1):
+    """Generate shopper sessions. Arrivals are spread over `burst_window` seconds
+    in each of `bursts` bursts, `burst_gap` seconds apart."""
+    rng = random.Random(seed)
+    categories = [c for c in catalog.categories if catalog.items_in(c)]
+    sessions = []
+    for n in range(shoppers):
+        burst = n % bursts
+        steps = [{"step": "market", "think": 0.0}]
+        for pick in range(rng.randint(1, max_picks)):
+            if pick:
+                steps.append({"step": "browse", "think": think_time(rng, think / 4)})
+            category = rng.choice(categories)
+            item_ids = [item["id"] for item in catalog.items_in(category)]
+            chosen = rng.sample(item_ids, rng.randint(1, min(MAX_MODAL_ITEMS, len(item_ids))))
+            steps.append({"step": "category", "think": think_time(rng, think), "category": category})
+            steps.append({"step": "items", "think": think_time(rng, think), "items": chosen})
+            steps.append({
+                "step": "quantities", "think": think_time(rng, think),
+                "quantities": [rng.randint(1, 20) for _ in chosen],
+            })
+        steps.append({"step": "view_cart", "think": think_time(rng, think)})
+        if rng.random() < 0.8:
+            steps.append({"step": "confirm", "think": think_time(rng, think)})
+        sessions.append({
+            "user_id": 1_000_000 + n,
+            "start": burst * burst_gap + rng.uniform(0, burst_window),
+            "steps": steps,
+        })
+    sessions.sort(key=lambda s: s["start"])
+    return sessions
+
+
+def load_trace(path: str):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def save_trace(path: str, sessions):
+    with open(path, "w") as f:
+        for session in sessions:
+            f.write(json.dumps(session, separators=(",", ":")) + "\n")
+
+
+def current_rss() -> int:
+    """Resident set size in bytes (peak RSS where /proc isn't available)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return peak_rss()
+
+
+def peak_rss() -> int:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class ViewTracker:
+    """Counts live View and Modal objects by holding weak references to every
+    one created while installed."""
+
+    def __init__(self):
+        self.live = weakref.WeakSet()
+        self.created = 0
+        self._original = None
+
+    def install(self):
+        original = self._original = _BaseView.__init__
+        tracker = self
+
+        def __init__(view, *args, **kwargs):
+            original(view, *args, **kwargs)
+            tracker.live.add(view)
+            tracker.created += 1
+        _BaseView.__init__ = __init__
+
+    def uninstall(self):
+        if self._original is not None:
+            _BaseView.__init__ = self._original
+            self._original = None
+
+    def counts(self):
+        views = modals = 0
+        for view in list(self.live):
+            if isinstance(view, discord.ui.Modal):
+                modals += 1
+            else:
+                views += 1
+        return views, modals
+
+
+class LoopLag:
+    """Measures how late the event loop runs a sleep of `interval` seconds."""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.samples = []
+        # Worst lag since the last take_max()
+        self.window_max = 0.0
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.perf_counter() - started - self.interval)
+            self.samples.append(lag)
+            self.window_max = max(self.window_max, lag)
+
+    def take_max(self) -> float:
+        worst, self.window_max = self.window_max, 0.0
+        return worst
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+
+class LoadRun:
+    def __init__(self, api_latency: float, time_scale: float = 1.0):
+        self.api_latency = api_latency
+        self.time_scale = time_scale
+        self.latency = {step: [] for step in STEPS}
+        self.errors = {}
+        self.active = 0
+        self.finished = 0
+        self.turned_away = 0
+        self.timeline = []
+
+    async def step(self, name, interaction, coro):
+        started = time.perf_counter()
+        try:
+            await coro
+        except Exception as e:
+            key = f"{name}: {type(e).__name__}"
+            self.errors[key] = self.errors.get(key, 0) + 1
+            return None
+        self.latency[name].append(time.perf_counter() - started)
+        return interaction.reply
+
+    def interaction(self, user_id):
+        return FakeInteraction(user_id, delay=self.api_latency)
+
+    async def session(self, session, started):
+        await asyncio.sleep(max(0.0, started + session["start"] * self.time_scale - time.perf_counter()))
+        self.active += 1
+        user_id = session["user_id"]
+        # The message the shopper is looking at, and the modal once one is open
+        view = modal = None
+        try:
+            for entry in session["steps"]:
+                if entry.get("think"):
+                    await asyncio.sleep(entry["think"] * self.time_scale)
+                name = entry["step"]
+                interaction = self.interaction(user_id)
+                if name == "market":
+                    coro = bot.market.callback(interaction)
+                elif name == "category":
+                    coro = click(view, "category", interaction, [entry["category"]])
+                elif name == "items":
+                    coro = click(view, "items", interaction, entry["items"])
+                elif name == "quantities":
+                    coro = submit_modal(modal, interaction, entry["quantities"])
+                elif name == "browse":
+                    coro = click(view, "browse_categories", interaction)
+                elif name == "view_cart":
+                    coro = click(view, "view_cart", interaction)
+                elif name == "confirm":
+                    coro = click(view, "confirm_order", interaction)
+                else:
+                    raise ValueError(f"Unknown step {name!r}")
+                reply = await self.step(name, interaction, coro)
+                if not reply:
+                    break
+                if reply.get("modal") is not None:
+                    modal = reply["modal"]
+                elif reply.get("view") is not None:
+                    view = reply["view"]
+                elif reply.get("ephemeral"):
+                    # Turned away (empty cart, sold out); a real shopper would stop here
+                    self.turned_away += 1
+                    break
+        finally:
+            self.active -= 1
+            self.finished += 1
+
+    async def sample(self, lag: LoopLag, views: ViewTracker, started, interval):
+        while True:
+            await asyncio.sleep(interval)
+            live_views, live_modals = views.counts()
+            self.timeline.append({
+                "t": time.perf_counter() - started,
+                "active": self.active,
+                "finished": self.finished,
+                "lag_max_ms": lag.take_max() * 1000,
+                "rss_mib": current_rss() / 2**20,
+                "views": live_views,
+                "modals": live_modals,
+            })
+
+
+async def run_load(sessions, api_latency: float, time_scale: float, sample_interval: float, rate_limits: bool = False):
+    bot.create_bot(offline_settings(rate_limits))
+    await bot.order_store.start()
+    await bot.cart_store.start()
+    await bot.inventory.start(bot.catalog_source.catalog)
+    await bot.pricing.warm()
+
+    run = LoadRun(api_latency, time_scale)
+    lag = LoopLag()
+    views = ViewTracker()
+    views.install()
+    lag.start()
+    started = time.perf_counter()
+    sampler = asyncio.create_task(run.sample(lag, views, started, sample_interval))
+    try:
+        await asyncio.gather(*(run.session(session, started) for session in sessions))
+        elapsed = time.perf_counter() - started
+        await bot.jobs.join()
+    finally:
+        sampler.cancel()
+        await asyncio.gather(sampler, return_exceptions=True)
+        await lag.stop()
+        views.uninstall()
+        bot.inventory.stop()
+        await bot.jobs.close()
+        await bot.cart_store.close()
+        await bot.order_store.close()
+
+    all_samples = sorted(s for samples in run.latency.values() for s in samples)
+    lags = sorted(lag.samples)
+    report = {
+        "sessions": len(sessions),
+        "interactions": len(all_samples),
+        "elapsed_s": elapsed,
+        "api_latency_ms": api_latency * 1000,
+        "errors": run.errors,
+        "turned_away": run.turned_away,
+        "loop_lag_p50_ms": percentile(lags, 50) * 1000,
+        "loop_lag_p99_ms": percentile(lags, 99) * 1000,
+        "loop_lag_max_ms": (lags[-1] if lags else 0.0) * 1000,
+        "peak_rss_mib": peak_rss() / 2**20,
+        "views_created": views.created,
+        "steps": {},
+        "timeline": run.timeline,
+    }
+    for step, samples in list(run.latency.items()) + [("all", all_samples)]:
+        samples = sorted(samples)
+        report["steps"][step] = {
+            "count": len(samples),
+            "p50_ms": percentile(samples, 50) * 1000,
+            "p99_ms": percentile(samples, 99) * 1000,
+            "max_ms": (samples[-1] if samples else 0.0) * 1000,
+        }
+    return report
+
+
+def print_report(report):
+    print(
+        f"{report['sessions']} sessions, {report['interactions']} interactions in {report['elapsed_s']:.1f}s "
+        f"(API latency {report['api_latency_ms']:.0f} ms), {report['turned_away']} turned away"
+    )
+    print(
+        f"event-loop lag p50 {report['loop_lag_p50_ms']:.2f} ms, p99 {report['loop_lag_p99_ms']:.2f} ms, "
+        f"max {report['loop_lag_max_ms']:.2f} ms; peak RSS {report['peak_rss_mib']:.1f} MiB; "
+        f"{report['views_created']} views created"
+    )
+    for error, count in sorted(report["errors"].items()):
+        print(f"  error {error} x{count}")
+    header = f"{'step':<12}{'count':>8}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}"
+    print(header)
+    print("-" * len(header))
+    for step, s in report["steps"].items():
+        print(f"{step:<12}{s['count']:>8}{s['p50_ms']:>10.2f}{s['p99_ms']:>10.2f}{s['max_ms']:>10.2f}")
+    print()
+    header = f"{'t s':>7}{'active':>8}{'done':>8}{'lag ms':>9}{'RSS MiB':>9}{'views':>8}{'modals':>8}"
+    print(header)
+    print("-" * len(header))
+    for row in report["timeline"]:
+        print(
+            f"{row['t']:>7.1f}{row['active']:>8}{row['finished']:>8}{row['lag_max_ms']:>9.2f}"
+            f"{row['rss_mib']:>9.1f}{row['views']:>8}{row['modals']:>8}"
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the market flow with bursts of simulated shoppers.")
+    parser.add_argument("--shoppers", type=int, default=1000, help="generated sessions")
+    parser.add_argument("--bursts", type=int, default=1, help="arrival bursts")
+    parser.add_argument("--burst-window", type=float, default=5.0, help="seconds each burst's arrivals span")
+    parser.add_argument("--burst-gap", type=float, default=30.0, help="seconds between burst starts")
+    parser.add_argument("--think", type=float, default=2.0, help="mean think time between steps, seconds")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--trace", help="replay sessions from this JSON-lines file instead of generating them")
+    parser.add_argument("--save-trace", help="write the sessions to this JSON-lines file")
+    parser.add_argument("--api-latency", type=float, default=50.0, help="simulated Discord API round-trip, ms")
+    parser.add_argument("--time-scale", type=float, default=1.0, help="multiply arrival and think times (0.1 = 10x faster)")
+    parser.add_argument("--sample-interval", type=float, default=1.0, help="seconds between timeline samples")
+    parser.add_argument("--rate-limits", action="store_true", help="apply the configured interaction rate limits")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args(argv)
+
+    if args.trace:
+        sessions = load_trace(args.trace)
+    else:
+        catalog = bot.CatalogSource(Settings().catalog_path).catalog
+        sessions = synthetic_sessions(
+            catalog, args.shoppers, args.bursts, args.burst_window, args.burst_gap, args.think, seed=args.seed
+        )
+    if args.save_trace:
+        save_trace(args.save_trace, sessions)
+
+    report = asyncio.run(run_load(
+        sessions, args.api_latency / 1000, args.time_scale, args.sample_interval, args.rate_limits
+    ))
+    if args.json:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,153 +1,446 @@
 # bot.py
-import os
+#
+# Importing this module only defines things: no .env, no token, no Bot, no
+# catalog. main() (or create_bot() from tools and benchmarks) reads the
+# settings and builds the bot, and the catalog, stores and caches load on
+# first use or in setup_hook.
+#
+#   python bot.py [--profile-startup]
+import time
+
+# Measured from here to the first READY and the first handled interaction
+STARTUP_BEGAN = time.perf_counter()
+
+import argparse
+import asyncio
 import logging
 import discord
 from discord.ext import commands
 from discord import app_commands
-from dotenv import load_dotenv
-import random
-import json
-
-logging.basicConfig(level=logging.INFO)
-
-# Load token from .env
-load_dotenv()
-TOKEN = os.getenv("DISCORD_TOKEN") or os.getenv("TOKEN")
-if not TOKEN:
-    raise RuntimeError("Bot tokeen not found. Put DISCORD_TOKEN=... in a .env file.")
-
-# Intents
-intents = discord.Intents.default()
-intents.message_content = True
-
-# Create bot
-bot = commands.Bot(command_prefix="!", intents=intents)
-
-# Market data
-MARKET_DATA = {
-    "Guns": [
-        {"name": "Combat Pistol", "price": 55000, "description": "Standard sidearm for combat situations"},
-        {"name": "MK2 Pistol", "price": 65000, "description": "Advanced pistol with improved accuracy"},
-        {"name": "Glock18c", "price": 95000, "description": "High-rate automatic pistol"},
-        {"name": "Micro SMG", "price": 100000, "description": "Compact submachine gun"},
-        {"name": "Combat PDW", "price": 129500, "description": "Personal defense weapon"},
-        {"name": "Shotgun", "price": 120000, "description": "Close-range combat shotgun"},
-        {"name": "Ammo Pistol", "price": 1500, "description": "Ammunition for pistols"},
-        {"name": "Ammo SMG", "price": 2000, "description": "Ammunition for submachine guns"},
-        {"name": "Ammo Shotgun", "price": 2000, "description": "Ammunition for shotguns"}
-    ],
-    "Drugs": [
-        {"name": "Pallet Coke", "price": 1050000, "description": "High-grade cocaine pallet"},
-        {"name": "Pallet Weed", "price": 800000, "description": "Premium cannabis pallet"}
-    ],
-    "Heist Pack": [
-        {"name": "Fleeca Heist Pack", "price": 60000, "description": "Equipment pack for bank heists"},
-        {"name": "Bijoux Heist Pack", "price": 100000, "description": "Specialized jewelry store heist kit"},
-        {"name": "Paleto Heist Pack", "price": 100000, "description": "Advanced heist equipment package"}
-    ]
-}
+import tempfile
+from typing import Literal
 
-# Store user orders
-user_orders = {}
+import metrics
+import replies
+import routing
+from analytics import SalesAggregates, export_chunks
+from cart_store import MemoryCartStore, RemoteCartStore
+from command_sync import sync_commands
+from cart_render import CartRenderer
+from catalog import CatalogSource, format_cents
+from gateway import latency_report
+from inventory import Inventory, LocalStock, OutOfStock, RemoteStock
+from jobs import JobQueue
+from logs import setup_logging
+from locks import IdempotencyCache, UserLocks
+from metrics import instrument
+from pricing import Pricing
+from ratelimit import InteractionGate, RateLimiter
+from sessions import SessionStore
+from routing import MarketComponent, route
+from settings import Settings
+from startup import StartupProfile
+from storage import OrderStore
 
-class CategorySelect(discord.ui.Select):
-    def __init__(self, user_id: int):
-        self.user_id = user_id
-        
-        options = [
-            discord.SelectOption(
-                label="Guns",
-                description="Firearms and ammunition",
-                emoji="🔫",
-                value="Guns"
-            ),
-            discord.SelectOption(
-                label="Drugs",
-                description="Narcotics and substances",
-                emoji="💊",
-                value="Drugs"
-            ),
-            discord.SelectOption(
-                label="Heist Pack",
-                description="Heist equipment packages",
-                emoji="💰",
-                value="Heist Pack"
+log = logging.getLogger("market")
+audit_log = logging.getLogger("market.audit")
+
+# Built by create_bot()
+settings = None
+bot = None
+order_store = None
+catalog_source = None
+cart_store = None
+jobs = None
+inventory = None
+gate = None
+pricing = None
+
+startup = StartupProfile(STARTUP_BEGAN)
+
+class MarketBotMixin:
+    sync_seconds = None
+    synced = False
+    ready_logged = False
+    metrics_runner = None
+    sales_replay = None
+    profile_startup = False
+
+    async def setup_hook(self):
+        startup.mark("setup_hook")
+        # One dynamic item routes every market component by its custom_id
+        self.add_dynamic_items(MarketComponent)
+        with startup.phase("order store"):
+            await order_store.start()
+        with startup.phase("cart store"):
+            await cart_store.start()
+        jobs.start()
+        # Orders confirmed from now on are counted as they happen; older ones
+        # are replayed in the background
+        with startup.phase("sales replay start"):
+            last_order_id = await order_store.last_order_id()
+            self.sales_replay = self.loop.create_task(sales.replay(order_store.iter_orders(until_id=last_order_id)))
+            self.sales_replay.add_done_callback(sales_replay_done)
+        # Load the catalog now so the first interaction doesn't pay for it
+        with startup.phase("catalog"):
+            await catalog_source.warm()
+        catalog_source.watch(settings.catalog_poll_interval)
+        # A malformed rules file stops startup here rather than failing every quote
+        with startup.phase("pricing rules"):
+            await pricing.warm()
+        with startup.phase("stock"):
+            await inventory.start(catalog_source.catalog)
+        if settings.metrics_port:
+            with startup.phase("metrics server"):
+                self.metrics_runner = await metrics.start_http_server(settings.metrics_host, settings.metrics_port)
+        
+        # setup_hook runs once per process, unlike on_ready which fires on every reconnect
+        started = time.perf_counter()
+        try:
+            results = await sync_commands(
+                self, settings.command_sync_state, settings.sync_guild_ids, force=settings.force_command_sync
+            )
+            self.synced = any(count is not None for count in results.values())
+        except Exception:
+            log.exception("Slash command sync failed")
+        self.sync_seconds = time.perf_counter() - started
+        startup.add_phase("command sync" if self.synced else "command sync (skipped)", self.sync_seconds)
+        startup.mark("setup_hook done")
+
+    async def on_ready(self):
+        log.info("Logged in as %s (ID: %s)", self.user, self.user.id)
+        if not self.ready_logged:
+            self.ready_logged = True
+            log.info(
+                "Startup took %.2fs (%s, %.2fs)",
+                startup.mark("first READY"),
+                "with command sync" if self.synced else "command sync skipped",
+                self.sync_seconds or 0.0
+            )
+            if self.profile_startup:
+                log.info("%s", startup.report())
+
+    async def close(self):
+        catalog_source.stop()
+        inventory.stop()
+        if self.sales_replay is not None:
+            self.sales_replay.cancel()
+        if self.metrics_runner is not None:
+            await self.metrics_runner.cleanup()
+        # Queued jobs (order announcements among them) still need the client
+        await jobs.close()
+        await super().close()
+        await cart_store.close()
+        await order_store.close()
+
+def sales_replay_done(task):
+    if task.cancelled():
+        return
+    error = task.exception()
+    if error is not None:
+        sales.replay_error = error
+        log.error("Replaying past orders for /sales failed", exc_info=error)
+
+class MarketTree(app_commands.CommandTree):
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        # Rate limits and duplicate suppression before any command runs
+        return await gate.admit(interaction)
+
+class MarketBot(MarketBotMixin, commands.Bot):
+    pass
+
+class ShardedMarketBot(MarketBotMixin, commands.AutoShardedBot):
+    pass
+
+def catalog_item(item_id: str, guild_id: int = None):
+    return catalog_source.storefront(guild_id).catalog.item(item_id)
+
+def storefront(interaction: discord.Interaction):
+    """The catalog, render cache and search index for the interaction's guild."""
+    return catalog_source.storefront(interaction.guild_id)
+
+def create_bot(config: Settings = None):
+    """Build the bot and the services its handlers use. Nothing is loaded or
+    connected here; that happens in setup_hook or on first use."""
+    global settings, bot, order_store, catalog_source, cart_store, jobs, inventory, gate, pricing
+    with startup.phase("create bot"):
+        settings = config or Settings()
+        order_store = OrderStore(settings.order_db_path)
+        catalog_source = CatalogSource(settings.catalog_path, settings.catalog_overlays_path)
+        if settings.cart_store == "remote":
+            cart_store = RemoteCartStore(
+                settings.cart_store_host, settings.cart_store_port, catalog_item, cache_ttl=settings.cart_cache_ttl
+            )
+        else:
+            cart_store = MemoryCartStore(
+                SessionStore(max_size=settings.cart_max_sessions, idle_ttl=settings.cart_idle_ttl),
+                order_store,
+                catalog_item
+            )
+        jobs = JobQueue(workers=settings.job_workers, max_size=settings.job_queue_size)
+        if settings.cart_store == "remote":
+            # Shards share one set of counts and holds on the cart server
+            inventory = RemoteStock(cart_store.request, hold_ttl=settings.stock_hold_ttl)
+        else:
+            inventory = LocalStock(Inventory(hold_ttl=settings.stock_hold_ttl), order_store)
+            # A cart deleted as abandoned hands its reserved stock back
+            cart_store.on_expire.append(inventory.release)
+        catalog_source.on_reload.append(inventory.load_levels)
+        pricing = Pricing(settings.pricing_rules_path)
+        gate = InteractionGate(
+            RateLimiter(settings.rate_limit_user, settings.rate_limit_guild, settings.rate_limit_global),
+            repeat_window=settings.repeat_window
+        )
+        routing.gate = gate.admit
+        
+        gateway = settings.gateway
+        bot_class = ShardedMarketBot if gateway["sharded"] else MarketBot
+        bot = bot_class(command_prefix="!", tree_cls=MarketTree, **gateway["options"])
+        for command in COMMANDS:
+            bot.tree.add_command(command)
+    return bot
+
+cart_renderer = CartRenderer()
+
+# Gauges read the module's services when scraped, so they can be registered before create_bot()
+metrics.registry.gauge("market_cart_sessions", "Open carts held by this process.", lambda: len(cart_store))
+metrics.registry.gauge(
+    "market_cart_evictions",
+    "Carts dropped from memory: lru (store full), idle (TTL ran out), released (views gone) (cumulative).",
+    lambda: {(("reason", reason),): count for reason, count in cart_store.evictions().items()}
+)
+metrics.registry.gauge("market_cart_bytes_held", "Approximate memory held by open carts.", lambda: cart_store.bytes_held())
+metrics.registry.gauge(
+    "market_cart_cache_lookups",
+    "Remote cart store reads by whether the local cache had them (cumulative).",
+    lambda: {
+        (("result", "hit"),): getattr(cart_store, "cache_hits", 0),
+        (("result", "miss"),): getattr(cart_store, "cache_misses", 0),
+    }
+)
+metrics.registry.gauge(
+    "market_cart_conflicts", "Remote cart writes refused because the cart had changed (cumulative).",
+    lambda: getattr(cart_store, "conflicts", 0)
+)
+metrics.registry.gauge(
+    "market_order_store_pending",
+    "Cart snapshots and orders waiting to be flushed.",
+    lambda: order_store.pending()
+)
+metrics.registry.gauge(
+    "market_carts_pruned", "Stored carts deleted after the idle TTL (cumulative).", lambda: order_store.carts_pruned
+)
+
+# Cart mutations for one user run one at a time; confirmations are remembered
+# by (user id, cart version) so a repeated click doesn't confirm twice
+user_locks = UserLocks()
+confirmations = IdempotencyCache(ttl=600)
+metrics.registry.gauge("market_user_locks", "Per-user locks currently held or awaited.", lambda: len(user_locks))
+metrics.registry.gauge("market_user_lock_contention", "Lock acquisitions that had to wait (cumulative).", lambda: user_locks.contended)
+metrics.registry.gauge("market_duplicate_confirmations", "Repeated confirm clicks answered from the first result (cumulative).", lambda: confirmations.hits)
+
+# Background jobs for side effects (see settings.py)
+metrics.registry.gauge("market_jobs_queued", "Background jobs waiting for a worker.", lambda: len(jobs))
+metrics.registry.gauge("market_jobs_submitted", "Background jobs submitted (cumulative).", lambda: jobs.submitted)
+metrics.registry.gauge("market_jobs_failed", "Background jobs that raised (cumulative).", lambda: jobs.failed)
+metrics.registry.gauge("market_jobs_blocked", "Submissions that waited for room in a full queue (cumulative).", lambda: jobs.blocked)
+
+# Running sales totals for /sales, kept up to date by the order job
+sales = SalesAggregates()
+metrics.registry.gauge(
+    "market_category_revenue_cents",
+    "Revenue by category since the ledger began.",
+    lambda: {(("category", name),): cents for name, cents in sales.category_revenue().items()}
+)
+
+# Limited stock (see inventory.py)
+metrics.registry.gauge(
+    "market_stock_available",
+    "Units on sale for each limited item.",
+    lambda: {(("item", item_id),): units for item_id, units in inventory.stock_levels().items()}
+)
+metrics.registry.gauge("market_stock_holds", "Users with stock reserved in their cart.", lambda: inventory.stats()["holds"])
+metrics.registry.gauge("market_stock_refused", "Reservations refused for lack of stock (cumulative).", lambda: inventory.refused)
+metrics.registry.gauge("market_pricing_quotes", "Cart quotes computed (cumulative).", lambda: pricing.misses)
+metrics.registry.gauge("market_pricing_quote_hits", "Cart quotes served from the memo (cumulative).", lambda: pricing.hits)
+metrics.registry.gauge("market_pricing_plans", "Pricing plans compiled (cumulative).", lambda: pricing.compiles)
+metrics.registry.gauge(
+    "market_pricing_reload_errors", "Pricing rules reloads that failed and kept the old rules (cumulative).",
+    lambda: pricing.reload_errors
+)
+metrics.registry.gauge(
+    "market_catalog_overlays",
+    "Guilds with their own catalog overlay.",
+    lambda: len(catalog_source.overlay_guilds) if catalog_source.loaded else 0
+)
+
+# Interaction admission (see ratelimit.py)
+metrics.registry.gauge(
+    "market_rate_limit_allowed",
+    "Interactions admitted, by bucket scope (cumulative).",
+    lambda: {(("scope", limiter.scope),): limiter.allowed for limiter in gate.limiter.scopes}
+)
+metrics.registry.gauge(
+    "market_rate_limit_denied",
+    "Interactions rejected, by the bucket scope that ran out (cumulative).",
+    lambda: {(("scope", limiter.scope),): limiter.denied for limiter in gate.limiter.scopes}
+)
+metrics.registry.gauge(
+    "market_duplicate_interactions",
+    "Interactions dropped as redeliveries or repeated clicks (cumulative).",
+    lambda: {(("reason", reason),): count for reason, count in gate.duplicates.items()}
+)
+
+async def audit(event: str, user_id: int, **fields):
+    async def write():
+        audit_log.info(event, extra={"user_id": user_id, "fields": fields})
+    await jobs.submit("audit", write)
+
+async def notify_order(user, cart, quote):
+    channel_id = settings.order_channel_id
+    channel = bot.get_channel(channel_id) or await bot.fetch_channel(channel_id)
+    await channel.send(f"🧾 New order from {user.mention}: {cart.units} items, {format_cents(quote.total_cents)}")
+
+async def get_cart(user_id: int):
+    """Return the user's cart, or None if they don't have one."""
+    return await cart_store.load(user_id)
+
+async def add_to_cart(user_id: int, guild_id: int, quantities: list):
+    """Add (item, quantity) pairs from guild_id's storefront to the user's
+    cart and return the cart. Limited items are reserved first; raises
+    OutOfStock if any can't be."""
+    def add(cart):
+        for item, quantity in quantities:
+            cart.add(item, quantity, guild_id)
+    
+    wanted = {}
+    for item, quantity in quantities:
+        wanted[item["id"]] = wanted.get(item["id"], 0) + quantity
+    async with user_locks.hold(user_id):
+        await inventory.reserve(user_id, wanted)
+        try:
+            cart = await cart_store.update(user_id, add)
+        except BaseException:
+            await inventory.unreserve(user_id, wanted)
+            raise
+    await audit("cart_add", user_id, items=[[item["id"], quantity] for item, quantity in quantities])
+    return cart
+
+def stock_options(options: list) -> list:
+    """Item options with the live stock count on limited items."""
+    for i, option in enumerate(options):
+        left = inventory.available(option.value)
+        if left is not None:
+            options[i] = discord.SelectOption(
+                label=option.label,
+                value=option.value,
+                description=f"{left} in stock" if left else "Sold out"
             )
-        ]
+    return options
+
+def build_out_of_stock_embed(error: OutOfStock, catalog):
+    lines = []
+    for item_id, left in error.shortages.items():
+        item = catalog.item(item_id)
+        name = item["name"] if item else item_id
+        lines.append(f"**{name}**: {left} left" if left else f"**{name}**: sold out")
+    return discord.Embed(
+        title="❌ Not Enough Stock",
+        description="Nothing was added to your cart:\n" + "\n".join(lines),
+        color=discord.Color.red()
+    )
+
+class CategorySelect:
+    """Category dropdown. The component is stateless; the user id lives in its custom_id."""
+    
+    @staticmethod
+    def create(store, user_id: int):
+        options = store.render.category_options()
         
-        super().__init__(
+        return routing.select(
+            "category",
+            user_id,
             placeholder="🛒 Choose a category to browse...",
             min_values=1,
             max_values=1,
             options=options
         )
     
-    async def callback(self, interaction: discord.Interaction):
-        if interaction.user.id != self.user_id:
-            await interaction.response.send_message("This market is not for you!", ephemeral=True)
+    @staticmethod
+    @route("category")
+    async def callback(interaction: discord.Interaction, component: MarketComponent):
+        category = component.values[0]
+        store = storefront(interaction)
+        if store.catalog.category(category) is None:
+            await interaction.response.send_message("That category is no longer available.", ephemeral=True)
             return
         
-        category = self.values[0]
-        
-        embed = discord.Embed(
-            title=f"🛍️ {category}",
-            description="Select multiple items to add to your cart from the dropdown below!",
-            color=discord.Color.blue()
-        )
+        embed = store.render.category_embed(category)
         
         # Create item selection view
-        item_view = ItemSelectionView(self.user_id, category)
+        item_view = ItemSelectionView(store, component.user_id, category)
         await interaction.response.edit_message(embed=embed, view=item_view)
 
-class ItemSelect(discord.ui.Select):
-    def __init__(self, user_id: int, category: str):
-        self.user_id = user_id
-        self.category = category
-        
-        items = MARKET_DATA[category]
-        options = []
-        
-        for i, item in enumerate(items):
-            # Format price to remove .00 for whole numbers
-            price_str = f"${item['price']:,}" if item['price'] % 1 == 0 else f"${item['price']:,.2f}"
-            options.append(
-                discord.SelectOption(
-                    label=f"{item['name']} - {price_str}",
-                    value=str(i)
-                )
-            )
-        
-        super().__init__(
+# A modal holds at most 5 inputs, so that's as many items as one pick can take
+MAX_MODAL_ITEMS = 5
+
+def page_arg(category: str, page: int) -> str:
+    return f"{page}:{category}"
+
+def parse_page_arg(arg: str):
+    page, category = arg.split(":", 1)
+    return category, int(page)
+
+class ItemSelect:
+    """Item dropdown for one page of a category; category and page are carried in the custom_id."""
+    
+    @staticmethod
+    def create(store, user_id: int, category: str, page: int = 0):
+        options = stock_options(store.render.item_options(category, page))
+        
+        return routing.select(
+            "items",
+            user_id,
+            page_arg(category, page),
             placeholder="🛒 Select items to add to your cart (you can select multiple)...",
             min_values=1,
-            max_values=len(options),  # Allow selecting multiple items
+            max_values=min(len(options), MAX_MODAL_ITEMS),  # Allow selecting multiple items
             options=options
         )
     
-    async def callback(self, interaction: discord.Interaction):
-        if interaction.user.id != self.user_id:
-            await interaction.response.send_message("This is not your cart!", ephemeral=True)
-            return
-        
-        # Store selected items for quantity selection
+    @staticmethod
+    @route("items", denied="This is not your cart!")
+    async def callback(interaction: discord.Interaction, component: MarketComponent):
+        category, page = parse_page_arg(component.arg)
+        
+        # Store selected items for quantity selection (skipping any removed by a
+        # reload), priced as this guild sells them
+        catalog = storefront(interaction).catalog
         selected_items = []
-        for item_index in self.values:
-            item = MARKET_DATA[self.category][int(item_index)]
-            selected_items.append(item)
+        for item_id in component.values:
+            item = catalog.item(item_id)
+            if item is not None:
+                selected_items.append(item)
+        
+        if not selected_items:
+            await interaction.response.send_message("Those items are no longer available.", ephemeral=True)
+            return
         
         # Show quantity input modal directly
-        modal = QuantityModal(self.user_id, self.category, selected_items)
+        modal = QuantityModal(component.user_id, category, selected_items, page)
         await interaction.response.send_modal(modal)
 
 class QuantityModal(discord.ui.Modal):
-    def __init__(self, user_id: int, category: str, selected_items: list):
-        super().__init__(title="Enter Quantities")
+    def __init__(self, user_id: int, category: str, selected_items: list, page: int = 0):
+        # Modals are held by the library until submitted, so don't keep abandoned ones forever
+        super().__init__(title="Enter Quantities", timeout=300)
         self.user_id = user_id
         self.category = category
-        self.selected_items = selected_items
+        self.page = page
+        self.selected_items = selected_items[:MAX_MODAL_ITEMS]
         
         # Add text inputs for each item (max 5 due to Discord limits)
-        for i, item in enumerate(selected_items[:5]):
+        for i, item in enumerate(self.selected_items):
             text_input = discord.ui.TextInput(
                 label=f"Quantity for {item['name']}",
                 placeholder="Enter quantity (1-99)",
@@ -158,16 +451,22 @@ class QuantityModal(discord.ui.Modal):
             )
             self.add_item(text_input)
     
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        return await gate.admit(interaction)
+    
+    async def on_timeout(self):
+        # Let the cart store drop this user's cart if it's empty or idle
+        cart_store.release(self.user_id)
+    
+    @instrument()
     async def on_submit(self, interaction: discord.Interaction):
         if interaction.user.id != self.user_id:
             await interaction.response.send_message("This is not your cart!", ephemeral=True)
             return
-        
-        # Initialize user order if not exists
-        if self.user_id not in user_orders:
-            user_orders[self.user_id] = []
+        await replies.defer(interaction)
         
         added_items = []
+        quantities = []
         
         # Get quantities from text inputs
         for i, item in enumerate(self.selected_items):
@@ -182,85 +481,178 @@ class QuantityModal(discord.ui.Modal):
                     elif quantity > 99:
                         quantity = 99
                     
-                    # Add items based on quantity
-                    for _ in range(quantity):
-                        user_orders[self.user_id].append(item)
+                    quantities.append((item, quantity))
                     added_items.append(f"**{item['name']}** x{quantity}")
                 except ValueError:
                     # Default to 1 if invalid input
-                    user_orders[self.user_id].append(item)
+                    quantities.append((item, 1))
                     added_items.append(f"**{item['name']}** x1 (invalid input, defaulted to 1)")
         
-        # Create confirmation embed
-        embed = discord.Embed(
-            title="✅ Items Added to Cart!",
-            description=f"Successfully added items from **{self.category}**:",
-            color=discord.Color.green()
-        )
-        
-        for item_text in added_items:
-            embed.add_field(
-                name="📦 Added:",
-                value=item_text,
-                inline=False
-            )
-        
+        store = storefront(interaction)
+        try:
+            await add_to_cart(self.user_id, interaction.guild_id, quantities)
+        except OutOfStock as e:
+            embed = build_out_of_stock_embed(e, store.catalog)
+        else:
+            embed = build_added_embed(self.category, added_items)
+        
+        # Return to item selection view for this category and page
+        item_view = ItemSelectionView(store, self.user_id, self.category, self.page)
+        await replies.edit(interaction, embed=embed, view=item_view)
+
+def build_added_embed(category: str, added_items: list):
+    # Create confirmation embed
+    embed = discord.Embed(
+        title="✅ Items Added to Cart!",
+        description=f"Successfully added items from **{category}**:",
+        color=discord.Color.green()
+    )
+    
+    for item_text in added_items:
         embed.add_field(
-            name="🛒 Next Steps:",
-            value="• Browse other categories\n• View your cart\n• Continue shopping",
+            name="📦 Added:",
+            value=item_text,
             inline=False
         )
-        
-        # Return to item selection view for this category
-        item_view = ItemSelectionView(self.user_id, self.category)
-        await interaction.response.edit_message(embed=embed, view=item_view)
+    
+    embed.add_field(
+        name="🛒 Next Steps:",
+        value="• Browse other categories\n• View your cart\n• Continue shopping",
+        inline=False
+    )
+    return embed
+
+def build_cart_pages(cart, quote, footer: str = None):
+    return cart_renderer.render(cart, "🛒 Your Shopping Cart", discord.Color.blue(), footer=footer, quote=quote)
+
+# Follow-up messages a confirmed order may add after its first page
+MAX_FOLLOWUP_PAGES = 4
+
+async def send_remaining_pages(interaction: discord.Interaction, pages: list, quote):
+    # A message holds one embed's worth of text, so long orders continue in
+    # follow-ups, up to a few; the rest is summed up instead of flooding the channel
+    rest = pages[1:]
+    for page in rest[:MAX_FOLLOWUP_PAGES]:
+        await interaction.followup.send(embed=page)
+    skipped = len(rest) - MAX_FOLLOWUP_PAGES
+    if skipped > 0:
+        await interaction.followup.send(
+            f"…and {skipped} more page{'s' if skipped != 1 else ''} of items. "
+            f"Order total: **{format_cents(quote.total_cents)}**."
+        )
+
+async def record_order(user, cart, quote):
+    created_at = time.time()
+    receipt = cart.receipt(quote.line_discounts)
+    order_store.record_order(user.id, quote.total_cents / 100, receipt, created_at)
+    sales.record(created_at, receipt)
+
+async def order_confirmed(user, cart, quote):
+    # Everything that follows a confirmation, off the interaction's path
+    await jobs.submit("record_order", lambda: record_order(user, cart, quote))
+    await audit("order", user.id, units=cart.units, total_cents=quote.total_cents)
+    if settings.order_channel_id:
+        await jobs.submit("notify_order", lambda: notify_order(user, cart, quote))
+
+async def checkout(user, cart_version: str, catalog):
+    """Confirm the user's cart if it is still the version they were shown.
+    It is priced with the rules compiled for `catalog` (the one the user is
+    shopping from), and the order is recorded in the background.
 
+    Returns (status, cart) where status is "confirmed", "duplicate" (this
+    exact cart was already confirmed), "stale" (the cart changed since),
+    "out_of_stock" (the stock reservation lapsed and the items sold out; the
+    cart is left as it was) or "empty".
+    """
+    user_id = user.id
+    key = (user_id, cart_version)
+    async with user_locks.hold(user_id):
+        if confirmations.get(key) is not None:
+            return "duplicate", None
+        # Take the cart only if it is still the version that was shown; with a
+        # shared store another process may have changed or confirmed it meanwhile
+        cart = None
+        if cart_version.isdigit():
+            cart = await cart_store.discard(user_id, if_version=int(cart_version))
+        if cart is None:
+            cart = await get_cart(user_id)
+            return ("stale", cart) if cart else ("empty", None)
+        try:
+            await inventory.commit(user_id, {line.item_id: line.quantity for line in cart})
+        except OutOfStock:
+            # The reservation lapsed and the stock sold meanwhile; put the cart back
+            def put_back(current):
+                for line in cart:
+                    current.add(line.item, line.quantity, line.guild_id)
+            return "out_of_stock", await cart_store.update(user_id, put_back)
+        confirmations.put(key, True)
+    await order_confirmed(user, cart, pricing.quote(cart, catalog))
+    return "confirmed", cart
 
+def sold_out_summary(cart) -> str:
+    short = []
+    for line in cart:
+        left = inventory.available(line.item_id)
+        if left is not None and left < line.quantity:
+            short.append(f"{line.item['name']} ({left} left)")
+    return ", ".join(short)
+
+async def clear_user_cart(user_id: int):
+    async with user_locks.hold(user_id):
+        await cart_store.discard(user_id)
+        await inventory.release(user_id)
+    await audit("cart_clear", user_id)
 
 class CartManagementView(discord.ui.View):
-    def __init__(self, user_id: int):
-        super().__init__(timeout=300)  # 5 minutes timeout
-        self.user_id = user_id
-        
-        # Initialize user order if not exists
-        if user_id not in user_orders:
-            user_orders[user_id] = []
+    def __init__(self, user_id: int, cart_version: int, page: int = 0, pages: int = 1):
+        super().__init__(timeout=None)
+        self.add_item(routing.button("continue_shopping", user_id, label="Continue Shopping", style=discord.ButtonStyle.primary, emoji="🌍"))
+        self.add_item(routing.button("clear_cart", user_id, label="Clear Cart", style=discord.ButtonStyle.danger, emoji="🗑️"))
+        self.add_item(routing.button("confirm_order", user_id, str(cart_version), label="Confirm Order", style=discord.ButtonStyle.success, emoji="✅"))
+        if pages > 1:
+            self.add_item(routing.button(
+                "cart_page", user_id, str(max(page - 1, 0)),
+                label="Previous", emoji="◀️", style=discord.ButtonStyle.secondary, disabled=page == 0
+            ))
+            self.add_item(routing.button(
+                "cart_page", user_id, str(min(page + 1, pages - 1)),
+                label="Next", emoji="▶️", style=discord.ButtonStyle.secondary, disabled=page == pages - 1
+            ))
     
-    @discord.ui.button(label="Continue Shopping", style=discord.ButtonStyle.primary, emoji="🌍")
-    async def continue_shopping(self, interaction: discord.Interaction, button: discord.ui.Button):
-        if interaction.user.id != self.user_id:
-            await interaction.response.send_message("This market is not for you!", ephemeral=True)
+    @staticmethod
+    async def show(interaction: discord.Interaction, user_id: int, cart, page: int = 0, footer: str = None):
+        await inventory.touch(user_id)
+        # Memoized per cart version, so paging and repeat views don't reprice
+        quote = pricing.quote(cart, storefront(interaction).catalog)
+        pages = build_cart_pages(cart, quote, footer)
+        page = max(0, min(page, len(pages) - 1))
+        # The confirm button is tied to this version of the cart
+        view = CartManagementView(user_id, cart.version, page, len(pages))
+        await replies.edit(interaction, embed=pages[page], view=view)
+    
+    @staticmethod
+    @route("cart_page", denied="This is not your cart!", defer=True)
+    async def change_page(interaction: discord.Interaction, component: MarketComponent):
+        cart = await get_cart(component.user_id)
+        if not cart:
+            await replies.send(interaction, "Your cart is empty!", ephemeral=True)
             return
-        
-        embed = discord.Embed(
-            title="🏪 Black Market",
-            description="Welcome back! Choose a category to browse available items.",
-            color=discord.Color.gold()
-        )
-        
-        embed.add_field(
-            name="Available Categories",
-            value="🔫 Guns\n💊 Drugs\n💰 Heist Pack",
-            inline=False
-        )
-        
-        embed.add_field(
-            name="How it works",
-            value="1. Select a category from dropdown\n2. Choose multiple items to add to cart\n3. Enter quantities\n4. View cart and confirm order",
-            inline=False
-        )
+        await CartManagementView.show(interaction, component.user_id, cart, int(component.arg))
+    
+    @staticmethod
+    @route("continue_shopping")
+    async def continue_shopping(interaction: discord.Interaction, component: MarketComponent):
+        store = storefront(interaction)
+        embed = store.render.landing_embed("welcome_back")
         
         # Create category selection view
-        view = CategoryView(interaction.user.id)
+        view = CategoryView(store, interaction.user.id)
         await interaction.response.edit_message(embed=embed, view=view)
     
-    @discord.ui.button(label="Clear Cart", style=discord.ButtonStyle.danger, emoji="🗑️")
-    async def clear_cart(self, interaction: discord.Interaction, button: discord.ui.Button):
-        if interaction.user.id != self.user_id:
-            await interaction.response.send_message("This is not your cart!", ephemeral=True)
-            return
-        
-        user_orders[self.user_id] = []
+    @staticmethod
+    @route("clear_cart", denied="This is not your cart!", defer=True)
+    async def clear_cart(interaction: discord.Interaction, component: MarketComponent):
+        await clear_user_cart(component.user_id)
         
         embed = discord.Embed(
             title="🗑️ Cart Cleared!",
@@ -275,309 +667,355 @@ class CartManagementView(discord.ui.View):
         )
         
         # Show continue shopping option
-        continue_view = discord.ui.View(timeout=300)
-        continue_button = discord.ui.Button(
+        continue_view = discord.ui.View(timeout=None)
+        continue_view.add_item(routing.button(
+            "start_shopping",
+            component.user_id,
             label="Start Shopping",
             style=discord.ButtonStyle.primary,
             emoji="🛍️"
-        )
+        ))
         
-        async def start_shopping_callback(button_interaction):
-            if button_interaction.user.id != self.user_id:
-                await button_interaction.response.send_message("This market is not for you!", ephemeral=True)
-                return
-            
-            market_embed = discord.Embed(
-                title="🌍 International Market",
-                description="Welcome to the market! Choose a country to browse their unique items.",
-                color=discord.Color.gold()
-            )
-            
-            market_embed.add_field(
-                name="Available Countries",
-                value="🇺🇸 United States\n🇯🇵 Japan\n🇮🇹 Italy\n🇫🇷 France\n🇲🇽 Mexico",
-                inline=False
-            )
-            
-            country_view = CountryView(button_interaction.user.id)
-            await button_interaction.response.edit_message(embed=market_embed, view=country_view)
-        
-        continue_button.callback = start_shopping_callback
-        continue_view.add_item(continue_button)
-        
-        await interaction.response.edit_message(embed=embed, view=continue_view)
+        await replies.edit(interaction, embed=embed, view=continue_view)
     
-    @discord.ui.button(label="Confirm Order", style=discord.ButtonStyle.success, emoji="✅")
-    async def confirm_order(self, interaction: discord.Interaction, button: discord.ui.Button):
-        if interaction.user.id != self.user_id:
-            await interaction.response.send_message("This is not your cart!", ephemeral=True)
-            return
-        
-        if not user_orders[self.user_id]:
-            await interaction.response.send_message("Your cart is empty!", ephemeral=True)
-            return
-        
-        # Calculate total and group items
-        total = 0
-        item_counts = {}
-        
-        for item in user_orders[self.user_id]:
-            item_key = (item['name'], item['price'])
-            if item_key in item_counts:
-                item_counts[item_key]['count'] += 1
-            else:
-                item_counts[item_key] = {
-                    'item': item,
-                    'count': 1
-                }
-            total += item['price']
-        
-        # Create cart display string for order confirmation
-        order_display = ""
-        for item_data in item_counts.values():
-            item = item_data['item']
-            count = item_data['count']
-            subtotal = item['price'] * count
-            # Format price to remove .00 for whole numbers
-            subtotal_str = f"${subtotal:,}" if subtotal % 1 == 0 else f"${subtotal:,.2f}"
-            order_display += f"- {count} {item['name']} : {subtotal_str}\n"
-        
-        # Format total to remove .00 for whole numbers
-        total_str = f"${total:,}" if total % 1 == 0 else f"${total:,.2f}"
-        order_display += f"\nTotal : {total_str}"
-        
-        # Create order summary
-        embed = discord.Embed(
-            title="🎉 Order Confirmed!",
-            description=f"Thank you for your purchase! Here's your order summary:\n\n{order_display}",
-            color=discord.Color.green(),
-            timestamp=discord.utils.utcnow()
-        )
-        
-        embed.add_field(
-            name="📞 Order Status",
-            value="Your order has been processed successfully!\nThank you for shopping with us! 🙏",
-            inline=False
-        )
-        
-        embed.set_footer(text=f"Order by {interaction.user.display_name}")
-        
-        await interaction.response.edit_message(embed=embed, view=None)
-        
-        # Clear the order after confirmation
-        user_orders[self.user_id] = []
-
-class MarketView(discord.ui.View):
-    def __init__(self, user_id: int):
-        super().__init__(timeout=300)  # 5 minutes timeout
-        self.user_id = user_id
-        
-        # Initialize user order if not exists
-        if user_id not in user_orders:
-            user_orders[user_id] = []
+    @staticmethod
+    @route("start_shopping")
+    async def start_shopping(interaction: discord.Interaction, component: MarketComponent):
+        store = storefront(interaction)
+        market_embed = store.render.landing_embed("market")
+        
+        view = CategoryView(store, interaction.user.id)
+        await interaction.response.edit_message(embed=market_embed, view=view)
     
-    @discord.ui.button(label="Clear Cart", style=discord.ButtonStyle.danger, emoji="🗑️")
-    async def clear_cart(self, interaction: discord.Interaction, button: discord.ui.Button):
-        if interaction.user.id != self.user_id:
-            await interaction.response.send_message("This is not your cart!", ephemeral=True)
+    @staticmethod
+    @route("confirm_order", denied="This is not your cart!", defer=True)
+    async def confirm_order(interaction: discord.Interaction, component: MarketComponent):
+        catalog = storefront(interaction).catalog
+        status, cart = await checkout(interaction.user, component.arg, catalog)
+        if status == "duplicate":
+            await replies.send(interaction, "✅ This order was already confirmed.", ephemeral=True)
             return
-        
-        user_orders[self.user_id] = []
-        await interaction.response.send_message("🛒 Cart cleared!", ephemeral=True)
-    
-    @discord.ui.button(label="Confirm Order", style=discord.ButtonStyle.success, emoji="✅")
-    async def confirm_order(self, interaction: discord.Interaction, button: discord.ui.Button):
-        if interaction.user.id != self.user_id:
-            await interaction.response.send_message("This is not your cart!", ephemeral=True)
+        if status == "empty":
+            await replies.send(interaction, "Your cart is empty!", ephemeral=True)
             return
-        
-        if not user_orders[self.user_id]:
-            await interaction.response.send_message("Your cart is empty!", ephemeral=True)
+        if status == "stale":
+            # Something was added since this summary was shown; show the cart as it is now
+            await CartManagementView.show(
+                interaction, component.user_id, cart,
+                footer="Your cart changed since you opened it. Review it and confirm again."
+            )
+            return
+        if status == "out_of_stock":
+            await CartManagementView.show(
+                interaction, component.user_id, cart,
+                footer=f"Some items sold out: {sold_out_summary(cart)}. Clear your cart to pick again."
+            )
             return
-        
-        # Calculate total and group items
-        total = 0
-        item_counts = {}
-        
-        for item in user_orders[self.user_id]:
-            item_key = (item['name'], item['price'])
-            if item_key in item_counts:
-                item_counts[item_key]['count'] += 1
-            else:
-                item_counts[item_key] = {
-                    'item': item,
-                    'count': 1
-                }
-            total += item['price']
         
         # Create order summary
-        embed = discord.Embed(
-            title="🛒 Order Confirmed!",
-            color=discord.Color.green(),
-            timestamp=discord.utils.utcnow()
+        quote = pricing.quote(cart, catalog)
+        pages = cart_renderer.render(
+            cart,
+            "🎉 Order Confirmed!",
+            discord.Color.green(),
+            intro="Thank you for your purchase! Here's your order summary:\n\n",
+            fields=[("📞 Order Status", "Your order has been processed successfully!\nThank you for shopping with us! 🙏")],
+            footer=f"Order by {interaction.user.display_name}",
+            timestamp=discord.utils.utcnow(),
+            quote=quote
         )
         
-        for item_data in item_counts.values():
-            item = item_data['item']
-            count = item_data['count']
-            subtotal = item['price'] * count
-            
-            if count > 1:
-                embed.add_field(
-                    name=f"${item['price']:.2f} x{count} = ${subtotal:.2f} - {item['name']}",
-                    value=item['description'],
-                    inline=False
-                )
-            else:
-                embed.add_field(
-                    name=f"${item['price']:.2f} - {item['name']}",
-                    value=item['description'],
-                    inline=False
-                )
-        
-        embed.add_field(
-            name="💰 Total",
-            value=f"**${total:.2f} USD**",
-            inline=False
-        )
-        
-        embed.set_footer(text=f"Order by {interaction.user.display_name}")
-        
-        await interaction.response.send_message(embed=embed)
-        
-        # Clear the order after confirmation
-        user_orders[self.user_id] = []
+        await replies.edit(interaction, embed=pages[0], view=None)
+        await send_remaining_pages(interaction, pages, quote)
+
+# Views are only used to lay out components when sending a message. All their
+# components are routed MarketComponents, so the library keeps nothing per message.
 
 class CategoryView(discord.ui.View):
-    def __init__(self, user_id: int):
-        super().__init__(timeout=300)
-        self.user_id = user_id
-        self.add_item(CategorySelect(user_id))
+    def __init__(self, store, user_id: int):
+        super().__init__(timeout=None)
+        self.add_item(CategorySelect.create(store, user_id))
 
 class ItemSelectionView(discord.ui.View):
-    def __init__(self, user_id: int, category: str):
-        super().__init__(timeout=300)
-        self.user_id = user_id
-        self.category = category
-        self.add_item(ItemSelect(user_id, category))
+    def __init__(self, store, user_id: int, category: str, page: int = 0):
+        super().__init__(timeout=None)
+        pages = store.render.page_count(category)
+        page = max(0, min(page, pages - 1))
+        self.add_item(routing.button("view_cart", user_id, label="View Cart", style=discord.ButtonStyle.success, emoji="🛒"))
+        self.add_item(routing.button("browse_categories", user_id, label="Browse Other Categories", style=discord.ButtonStyle.secondary, emoji="🏪"))
+        if pages > 1:
+            self.add_item(routing.button(
+                "item_page", user_id, page_arg(category, max(page - 1, 0)),
+                label="Previous", emoji="◀️", style=discord.ButtonStyle.secondary, disabled=page == 0
+            ))
+            self.add_item(routing.button(
+                "item_page", user_id, page_arg(category, min(page + 1, pages - 1)),
+                label="Next", emoji="▶️", style=discord.ButtonStyle.secondary, disabled=page == pages - 1
+            ))
+        self.add_item(ItemSelect.create(store, user_id, category, page))
     
-    @discord.ui.button(label="View Cart", style=discord.ButtonStyle.success, emoji="🛒")
-    async def view_cart(self, interaction: discord.Interaction, button: discord.ui.Button):
-        if interaction.user.id != self.user_id:
-            await interaction.response.send_message("This is not your cart!", ephemeral=True)
+    @staticmethod
+    @route("item_page")
+    async def change_page(interaction: discord.Interaction, component: MarketComponent):
+        category, page = parse_page_arg(component.arg)
+        store = storefront(interaction)
+        if store.catalog.category(category) is None:
+            await interaction.response.send_message("That category is no longer available.", ephemeral=True)
             return
-        
-        if not user_orders.get(self.user_id, []):
-            await interaction.response.send_message("Your cart is empty!", ephemeral=True)
+        page = max(0, min(page, store.render.page_count(category) - 1))
+        embed = store.render.category_embed(category, page)
+        await interaction.response.edit_message(embed=embed, view=ItemSelectionView(store, component.user_id, category, page))
+    
+    @staticmethod
+    @route("view_cart", denied="This is not your cart!", defer=True)
+    async def view_cart(interaction: discord.Interaction, component: MarketComponent):
+        cart = await get_cart(component.user_id)
+        if not cart:
+            await replies.send(interaction, "Your cart is empty!", ephemeral=True)
             return
         
         # Show current cart contents WITH prices and total
-        cart_items = user_orders[self.user_id]
-        total = sum(item["price"] for item in cart_items)
-        
-        # Group items by name for display
-        item_counts = {}
-        for item in cart_items:
-            item_key = (item['name'], item['price'])
-            if item_key in item_counts:
-                item_counts[item_key]['count'] += 1
-            else:
-                item_counts[item_key] = {
-                    'item': item,
-                    'count': 1
-                }
-        
-        # Create cart display string
-        cart_display = ""
-        for item_data in item_counts.values():
-            item = item_data['item']
-            count = item_data['count']
-            subtotal = item['price'] * count
-            # Format price to remove .00 for whole numbers
-            subtotal_str = f"${subtotal:,}" if subtotal % 1 == 0 else f"${subtotal:,.2f}"
-            cart_display += f"- {count} {item['name']} : {subtotal_str}\n"
-        
-        # Format total to remove .00 for whole numbers
-        total_str = f"${total:,}" if total % 1 == 0 else f"${total:,.2f}"
-        cart_display += f"\nTotal : {total_str}"
-        
-        embed = discord.Embed(
-            title="🛒 Your Shopping Cart",
-            description=cart_display,
-            color=discord.Color.blue()
-        )
-        
-        # Create cart management view with continue shopping
-        cart_view = CartManagementView(self.user_id)
-        await interaction.response.edit_message(embed=embed, view=cart_view)
+        await CartManagementView.show(interaction, component.user_id, cart)
     
-    @discord.ui.button(label="Browse Other Categories", style=discord.ButtonStyle.secondary, emoji="🏪")
-    async def browse_categories(self, interaction: discord.Interaction, button: discord.ui.Button):
-        if interaction.user.id != self.user_id:
-            await interaction.response.send_message("This market is not for you!", ephemeral=True)
-            return
-        
-        embed = discord.Embed(
-            title="🏪 Black Market",
-            description="Welcome to the black market! Choose a category to browse available items.",
-            color=discord.Color.gold()
-        )
-        
-        embed.add_field(
-            name="Available Categories",
-            value="🔫 Guns\n💊 Drugs\n💰 Heist Pack",
-            inline=False
-        )
-        
-        embed.add_field(
-            name="How it works",
-            value="1. Select a category from dropdown\n2. Choose multiple items to add to cart\n3. View cart and confirm order",
-            inline=False
-        )
+    @staticmethod
+    @route("browse_categories")
+    async def browse_categories(interaction: discord.Interaction, component: MarketComponent):
+        store = storefront(interaction)
+        embed = store.render.landing_embed("browse")
         
         # Create category selection view
-        view = CategoryView(interaction.user.id)
+        view = CategoryView(store, interaction.user.id)
         await interaction.response.edit_message(embed=embed, view=view)
 
-@bot.event
-async def on_ready():
-    print(f"✅ Logged in as {bot.user} (ID: {bot.user.id})")
-    # Sync slash (/) commands to Discord
+# Market command
+@app_commands.command(name="market", description="Open the black market to browse guns, drugs, and heist packs")
+@instrument()
+async def market(interaction: discord.Interaction):
+    store = storefront(interaction)
+    embed = store.render.landing_embed("market")
+    
+    # Create category selection view
+    view = CategoryView(store, interaction.user.id)
+    await interaction.response.send_message(embed=embed, view=view)
+
+# A simple slash command: /ping
+@app_commands.command(name="ping", description="Replies with Pong and latency.")
+@instrument()
+async def ping(interaction: discord.Interaction):
+    report = latency_report(interaction.client, interaction.guild_id)
+    if "\n" in report:
+        await interaction.response.send_message(f"Pong!\n{report}")
+    else:
+        await interaction.response.send_message(f"Pong! {report}")
+
+# Buy by name: /buy item:<autocomplete> quantity:<1-99>
+@app_commands.command(name="buy", description="Add an item to your cart by name.")
+@app_commands.describe(item="Start typing an item name", quantity="How many to add (1-99)")
+@instrument()
+async def buy(interaction: discord.Interaction, item: str, quantity: app_commands.Range[int, 1, 99] = 1):
+    # Autocomplete sends the item id; fall back to a name search for free text
+    store = storefront(interaction)
+    entry = store.catalog.item(item) or store.catalog.find(item)
+    if entry is None:
+        matches = store.search.search(item, limit=1)
+        entry = matches[0] if matches else None
+    if entry is None:
+        await interaction.response.send_message(f"No item matches **{item}**.", ephemeral=True)
+        return
+    
+    # The cart store may be remote; acknowledge before touching it
+    await replies.defer(interaction)
     try:
-        synced = await bot.tree.sync()
-        print(f"✅ Synced {len(synced)} slash command(s).")
+        await add_to_cart(interaction.user.id, interaction.guild_id, [(entry, quantity)])
+    except OutOfStock as e:
+        embed = build_out_of_stock_embed(e, store.catalog)
+    else:
+        embed = build_added_embed(entry["category"], [f"**{entry['name']}** x{quantity}"])
+    view = ItemSelectionView(store, interaction.user.id, entry["category"])
+    await replies.send(interaction, embed=embed, view=view)
+
+@buy.autocomplete("item")
+@instrument("buy.autocomplete")
+async def buy_item_autocomplete(interaction: discord.Interaction, current: str):
+    store = storefront(interaction)
+    render = store.render
+    return [
+        app_commands.Choice(name=f"{entry['name']} - {render.price_label(entry['id'])}"[:100], value=entry["id"])
+        for entry in store.search.search(current, limit=25)
+    ]
+
+# Admin command: /reload_catalog
+@app_commands.command(name="reload_catalog", description="Reload the market catalog and pricing rules from disk.")
+@app_commands.default_permissions(administrator=True)
+@instrument()
+async def reload_catalog(interaction: discord.Interaction):
+    try:
+        changed = await catalog_source.reload(force=True)
     except Exception as e:
-        print(f"❌ Slash command sync failed: {e}")
+        await interaction.response.send_message(f"❌ Catalog reload failed: {e}", ephemeral=True)
+        return
+    catalog = catalog_source.catalog
+    status = "Reloaded" if changed else "No changes in"
+    message = f"✅ {status} catalog (version `{catalog.version}`, {len(catalog)} items)."
+    if not await pricing.reload():
+        message += "\n❌ Pricing rules reload failed (see the log); the previous rules are still in use."
+    await interaction.response.send_message(message, ephemeral=True)
 
-# Market command
-@bot.tree.command(name="market", description="Open the black market to browse guns, drugs, and heist packs")
-async def market(interaction: discord.Interaction):
-    embed = discord.Embed(
-        title="🏪 Black Market",
-        description="Welcome to the black market! Choose a category to browse available items.",
-        color=discord.Color.gold()
+# Admin command: /restock [items] [mode]
+def parse_restock(text: str) -> dict:
+    """"pallet-coke=5, Pallet Weed=10" -> {item id: units}"""
+    catalog = catalog_source.catalog
+    quantities = {}
+    for part in text.split(","):
+        if not part.strip():
+            continue
+        name, _, units = part.rpartition("=")
+        item = catalog.item(name.strip()) or catalog.find(name.strip())
+        if item is None:
+            raise ValueError(f"No item matches {name.strip()!r}")
+        quantities[item["id"]] = int(units)
+    return quantities
+
+@app_commands.command(name="restock", description="Restock limited items.")
+@app_commands.describe(
+    items="item=units pairs, comma separated; leave empty to refill everything to its catalog level",
+    mode="add units to what's on sale, or set it"
+)
+@app_commands.default_permissions(administrator=True)
+@instrument()
+async def restock(interaction: discord.Interaction, items: str = "", mode: Literal["add", "set"] = "add"):
+    try:
+        levels = await inventory.restock(parse_restock(items) or None, mode)
+    except (KeyError, ValueError) as e:
+        await interaction.response.send_message(
+            f"❌ Restock failed: {e}. Items need a stock level in the catalog, written as `item=units`.",
+            ephemeral=True
+        )
+        return
+    catalog = catalog_source.catalog
+    summary = "\n".join(
+        f"{catalog.item(item_id)['name'] if catalog.item(item_id) else item_id}: {units}"
+        for item_id, units in levels.items()
     )
-    
+    await interaction.response.send_message(f"✅ Restocked:\n{summary or 'no limited items'}", ephemeral=True)
+    await audit("restock", interaction.user.id, mode=mode, levels=levels)
+
+# Admin command: /stats
+@app_commands.command(name="stats", description="Show interaction latency and throughput.")
+@app_commands.default_permissions(administrator=True)
+@instrument()
+async def stats(interaction: discord.Interaction):
+    carts = ", ".join(f"{key}={value}" for key, value in cart_store.stats().items())
+    await interaction.response.send_message(f"```\n{metrics.summary()}\n\ncarts: {carts}\n```", ephemeral=True)
+
+# Admin command: /sales
+@app_commands.command(name="sales", description="Show sales totals, best sellers and recent revenue.")
+@app_commands.default_permissions(administrator=True)
+@instrument()
+async def sales_command(interaction: discord.Interaction):
+    totals = sales.totals
+    day = sales.window(24)
+    embed = discord.Embed(title="📈 Sales", color=discord.Color.gold(), timestamp=discord.utils.utcnow())
     embed.add_field(
-        name="Available Categories",
-        value="🔫 Guns\n💊 Drugs\n💰 Heist Pack",
+        name="All time",
+        value=f"{totals.orders:,} orders • {totals.units:,} units • {format_cents(totals.revenue_cents)}",
         inline=False
     )
+    last_24h = f"{day.orders:,} orders • {day.units:,} units • {format_cents(day.revenue_cents)}"
+    busiest = sales.busiest_hour(24)
+    if busiest is not None:
+        last_24h += f"\nBusiest hour: <t:{busiest[0]}:t> ({format_cents(busiest[1].revenue_cents)})"
+    embed.add_field(name="Last 24 hours", value=last_24h, inline=False)
     
-    embed.add_field(
-        name="How it works",
-        value="1. Select a category\n2. Choose items to add to cart\n3. View cart and confirm order",
-        inline=False
+    for category, category_totals in sorted(sales.categories.items(), key=lambda kv: -kv[1].revenue_cents)[:20]:
+        best = ", ".join(
+            f"{sales.item_names[item_id]} ({sales.items[item_id][0]:,})"
+            for item_id in sales.best_sellers.get(category, ())[:3]
+        )
+        embed.add_field(
+            name=category,
+            value=f"{format_cents(category_totals.revenue_cents)} • {category_totals.units:,} units\nBest: {best}"[:1024],
+            inline=False
+        )
+    if sales.replay_error is not None:
+        embed.set_footer(text=f"Loading older orders failed ({type(sales.replay_error).__name__}); totals only cover orders since startup.")
+    elif not sales.ready:
+        embed.set_footer(text="Still loading older orders; totals are partial.")
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+# Admin command: /export_orders
+@app_commands.command(name="export_orders", description="Download the full order history.")
+@app_commands.default_permissions(administrator=True)
+@app_commands.rename(fmt="format")
+@instrument()
+async def export_orders(interaction: discord.Interaction, fmt: Literal["csv", "jsonl"] = "csv"):
+    await interaction.response.defer(ephemeral=True, thinking=True)
+    limit = interaction.guild.filesize_limit if interaction.guild else 10 * 1024 * 1024
+    size = 0
+    # Small exports stay in memory; larger ones spill to a temporary file
+    with tempfile.SpooledTemporaryFile(max_size=1024 * 1024) as spool:
+        async for chunk in export_chunks(order_store.iter_orders(), fmt):
+            data = chunk.encode()
+            size += len(data)
+            if size > limit:
+                await interaction.followup.send(
+                    "The order history is too large to upload here. Export it on the host with "
+                    f"`python analytics.py export --db {settings.order_db_path} --format {fmt}`.",
+                    ephemeral=True
+                )
+                return
+            await asyncio.to_thread(spool.write, data)
+        spool.seek(0)
+        filename = f"orders-{discord.utils.utcnow():%Y%m%d-%H%M%S}.{fmt}"
+        await interaction.followup.send(file=discord.File(spool, filename=filename), ephemeral=True)
+
+# Added to the tree by create_bot()
+COMMANDS = (market, ping, buy, reload_catalog, restock, stats, sales_command, export_orders)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the market bot.")
+    parser.add_argument(
+        "--profile-startup", action="store_true",
+        help="log a per-phase startup breakdown at the first READY and first handled interaction"
     )
+    args = parser.parse_args(argv)
+    startup.mark("imported", IMPORTED)
     
-    # Create category selection view
-    view = CategoryView(interaction.user.id)
-    await interaction.response.send_message(embed=embed, view=view)
+    from dotenv import load_dotenv
+    
+    with startup.phase("load .env"):
+        # Load token from .env
+        load_dotenv()
+    config = Settings()
+    if not config.token:
+        raise SystemExit("Bot token not found. Put DISCORD_TOKEN=... in a .env file.")
+    logs = setup_logging(config)
+    metrics.registry.gauge("market_log_queued", "Log records waiting for the writer thread.", lambda: logs.queue.qsize())
+    metrics.registry.gauge(
+        "market_log_dropped",
+        "Log records dropped, by reason (cumulative).",
+        lambda: {(("reason", "queue_full"),): logs.handler.dropped, (("reason", "sampled"),): logs.sampler.dropped}
+    )
+    
+    market_bot = create_bot(config)
+    market_bot.profile_startup = args.profile_startup
+    
+    def first_handled(label, seconds):
+        startup.add_phase(f"first interaction ({label})", seconds)
+        startup.mark("first interaction handled")
+        if market_bot.profile_startup:
+            log.info("%s", startup.report())
+    metrics.registry.on_first_handled = first_handled
+    
+    try:
+        # Our pipeline is already on the root logger; don't let the library add its own
+        market_bot.run(config.token, log_handler=None)
+    finally:
+        logs.stop()
 
-# A simple slash command: /ping
-@bot.tree.command(name="ping", description="Replies with Pong and latency.")
-async def ping(interaction: discord.Interaction):
-    await interaction.response.send_message(f"Pong! {round(bot.latency * 1000)}ms")
+# Import ends here; everything above is definitions
+IMPORTED = time.perf_counter()
+startup.add_phase("import", IMPORTED - STARTUP_BEGAN)
 
 if __name__ == "__main__":
-    bot.run(TOKEN)
+    main()
@@ -0,0 +1,139 @@
+# cart.py
+# Compact shopping cart: one line per distinct item with a quantity,
+# instead of one list entry per unit.
+import itertools
+import time
+
+# Cart versions are unique within a process and, being seeded from the clock,
+# unlikely to repeat across restarts. They tell a stale button from a fresh one.
+_versions = itertools.count(int(time.time() * 1000))
+
+
+class CartLine:
+    __slots__ = ("item", "quantity", "guild_id")
+
+    def __init__(self, item, quantity: int = 0, guild_id: int = None):
+        self.item = item
+        self.quantity = quantity
+        # The guild whose storefront the item came from (None for the base catalog)
+        self.guild_id = guild_id
+
+    @property
+    def item_id(self):
+        return self.item["id"]
+
+    @property
+    def category(self):
+        return self.item["category"]
+
+    @property
+    def subtotal_cents(self):
+        return self.item["price_cents"] * self.quantity
+
+    @property
+    def subtotal(self):
+        return self.subtotal_cents / 100
+
+
+class Cart:
+    """Items grouped by catalog item id, with a running total.
+
+    Viewing or confirming a cart walks the distinct lines only, so the cost
+    does not depend on how many units were typed into the quantity modal.
+    The total is kept in integer cents.
+    Lines hold the catalog entry they were added from, so a catalog reload
+    doesn't change the price of items already in the cart. Each line also
+    records the guild it was added in; a restored cart looks every item up in
+    that guild's storefront, so overlay items and prices come back.
+    """
+
+    __slots__ = ("_lines", "total_cents", "units", "version")
+
+    def __init__(self):
+        self._lines = {}
+        self.total_cents = 0
+        self.units = 0
+        self.version = next(_versions)
+
+    def add(self, item, quantity: int = 1, guild_id: int = None):
+        line = self._lines.get(item["id"])
+        if line is None:
+            line = self._lines[item["id"]] = CartLine(item, 0, guild_id)
+        line.quantity += quantity
+        self.total_cents += item["price_cents"] * quantity
+        self.units += quantity
+        self.version = next(_versions)
+        return line
+
+    @property
+    def total(self):
+        return self.total_cents / 100
+
+    def snapshot(self):
+        # Compact, JSON-friendly form used for persistence: [item id, quantity],
+        # plus the guild for lines added from a guild's storefront
+        return [
+            [line.item_id, line.quantity] if line.guild_id is None else [line.item_id, line.quantity, line.guild_id]
+            for line in self._lines.values()
+        ]
+
+    def receipt(self, discounts: dict = None):
+        # Self-contained lines for the order ledger (names and prices can change later).
+        # discounts maps item id -> cents off that line, from a pricing quote.
+        lines = []
+        for line in self._lines.values():
+            entry = {
+                "id": line.item_id,
+                "category": line.category,
+                "name": line.item["name"],
+                "price": line.item["price"],
+                "quantity": line.quantity,
+            }
+            cents = discounts.get(line.item_id) if discounts else None
+            if cents:
+                entry["discount"] = cents // 100 if cents % 100 == 0 else cents / 100
+            lines.append(entry)
+        return lines
+
+    @classmethod
+    def restore(cls, snapshot, lookup, version: int = None):
+        # lookup(item_id, guild_id) returns the item as that guild's catalog
+        # has it, or None if it's gone. A cart shared between processes keeps
+        # the version it was saved with.
+        cart = cls()
+        for entry in snapshot:
+            guild_id = entry[2] if len(entry) > 2 else None
+            item = lookup(entry[0], guild_id)
+            if item is not None:
+                cart.add(item, entry[1], guild_id)
+        if version is not None:
+            cart.version = version
+        return cart
+
+    def copy(self):
+        cart = Cart()
+        for item_id, line in self._lines.items():
+            cart._lines[item_id] = CartLine(line.item, line.quantity, line.guild_id)
+        cart.total_cents = self.total_cents
+        cart.units = self.units
+        cart.version = self.version
+        return cart
+
+    def clear(self):
+        self._lines.clear()
+        self.total_cents = 0
+        self.units = 0
+        self.version = next(_versions)
+
+    def lines(self):
+        # Lines are kept in the order items were first added.
+        return list(self._lines.values())
+
+    def __iter__(self):
+        return iter(self._lines.values())
+
+    def __len__(self):
+        return len(self._lines)
+
+    def __bool__(self):
+        return bool(self._lines)
@@ -0,0 +1,123 @@
+# cart_render.py
+# Renders carts and order summaries as embeds.
+#
+# Every cart display goes through CartRenderer so they all look the same.
+# Amounts are formatted from integer cents. Line strings are memoized by item
+# and quantity, and the output is built with joins. A cart too big for one
+# embed is split into more fields and then more pages, so a large cart costs
+# time proportional to its line count and always stays within Discord's limits.
+from collections import OrderedDict
+
+import discord
+
+from catalog import format_cents
+
+# Discord embed limits
+DESCRIPTION_LIMIT = 4096
+FIELD_VALUE_LIMIT = 1024
+FIELD_LIMIT = 25
+EMBED_LIMIT = 6000
+
+# Continuation fields need a name; a zero-width space shows nothing
+BLANK = "\u200b"
+# Room kept for the "Page x/y" footer suffix
+PAGE_SUFFIX_ROOM = 24
+# Longest single line; item names are short, but never let one line overflow a field
+LINE_LIMIT = 200
+
+
+def _take(lines: list, start: int, limit: int):
+    """Join lines from start while they fit in limit characters.
+    Returns (text, next index)."""
+    end = start
+    size = -1
+    while end < len(lines) and size + 1 + len(lines[end]) <= limit:
+        size += 1 + len(lines[end])
+        end += 1
+    # The total is set off by a blank line, which is dropped at the top of a chunk
+    return "\n".join(lines[start:end]).lstrip("\n"), end
+
+
+class CartRenderer:
+    def __init__(self, max_cached_lines: int = 8192):
+        self.max_cached_lines = max_cached_lines
+        self._lines = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def line(self, line) -> str:
+        item = line.item
+        key = (item["id"], item["name"], item["price_cents"], line.quantity)
+        text = self._lines.get(key)
+        if text is not None:
+            self.hits += 1
+            self._lines.move_to_end(key)
+            return text
+        self.misses += 1
+        text = f"- {line.quantity} {item['name']} : {format_cents(line.subtotal_cents)}"
+        if len(text) > LINE_LIMIT:
+            text = text[:LINE_LIMIT - 1] + "…"
+        self._lines[key] = text
+        if len(self._lines) > self.max_cached_lines:
+            self._lines.popitem(last=False)
+        return text
+
+    def lines(self, cart, quote=None) -> list:
+        lines = [self.line(line) for line in cart]
+        if quote is not None and quote.discount_cents:
+            lines.append(f"\nSubtotal : {format_cents(quote.subtotal_cents)}")
+            lines.extend(f"{label} : -{format_cents(cents)}" for label, cents in quote.adjustments)
+            lines.append(f"Total : {format_cents(quote.total_cents)}")
+        else:
+            lines.append(f"\nTotal : {format_cents(cart.total_cents)}")
+        return lines
+
+    def render(self, cart, title: str, color, intro: str = "", fields=(),
+               footer: str = None, timestamp=None, quote=None) -> list:
+        """Embeds (pages) showing the cart, with the discounts in quote (a
+        pricing.Quote) if given. intro opens the first page; fields ((name,
+        value) pairs) and footer are added to every page."""
+        lines = self.lines(cart, quote)
+        fields = list(fields)
+        fixed = len(title) + len(footer or "") + PAGE_SUFFIX_ROOM
+        fixed += sum(len(name) + len(value) for name, value in fields)
+        max_chunks = FIELD_LIMIT - len(fields)
+
+        pages = []
+        i = 0
+        while i < len(lines):
+            start = i
+            head = intro if not pages else ""
+            budget = EMBED_LIMIT - fixed - len(head)
+            text, i = _take(lines, i, min(DESCRIPTION_LIMIT - len(head), budget))
+            budget -= len(text)
+            chunks = []
+            while i < len(lines) and len(chunks) < max_chunks and budget > len(BLANK):
+                chunk, next_i = _take(lines, i, min(FIELD_VALUE_LIMIT, budget - len(BLANK)))
+                if next_i == i:
+                    break
+                if chunk:
+                    chunks.append(chunk)
+                    budget -= len(BLANK) + len(chunk)
+                i = next_i
+            if i == start:
+                raise ValueError("Fixed embed content leaves no room for cart lines")
+            pages.append((head + text, chunks))
+
+        embeds = []
+        for number, (description, chunks) in enumerate(pages, 1):
+            embed = discord.Embed(title=title, description=description, color=color, timestamp=timestamp)
+            for chunk in chunks:
+                embed.add_field(name=BLANK, value=chunk, inline=False)
+            for name, value in fields:
+                embed.add_field(name=name, value=value, inline=False)
+            parts = [footer] if footer else []
+            if len(pages) > 1:
+                parts.append(f"Page {number}/{len(pages)}")
+            if parts:
+                embed.set_footer(text=" · ".join(parts))
+            embeds.append(embed)
+        return embeds
+
+    def __len__(self):
+        return len(self._lines)
@@ -0,0 +1,157 @@
+# cart_server.py
+# Stand-in cart server for RemoteCartStore.
+#
+# Holds every cart in memory with a revision number and answers JSON-line
+# requests over TCP. It is what the remote backend is developed and tested
+# against; a production deployment would put the same three operations on a
+# real shared store.
+#
+#   {"id", "op": "get", "user"}                    -> {"rev", "cart"}
+#   {"id", "op": "put", "user", "rev", "cart"}     -> {"ok", "rev", "cart"}
+#   {"id", "op": "delete", "user", "version"}      -> {"ok", "rev", "cart"}
+#   {"id", "op": "stats"}                          -> {"carts", "requests", "conflicts"}
+#
+# put only succeeds when rev is the cart's current revision (0 for no cart);
+# a refused put or delete answers with the current cart.
+#
+# It also keeps limited stock for every shard in one Inventory (see
+# inventory.RemoteStock). The "stock_*" ops map onto Inventory methods and
+# answer {"ok", "result", "stock", "stats"}, or {"ok": false, "shortages"} and
+# {"ok": false, "invalid", "kind"} for OutOfStock and bad restocks. Like the
+# carts, stock here lives in memory. Run it with
+#   python cart_server.py --port 7480
+import argparse
+import asyncio
+import json
+import logging
+
+from inventory import Inventory, OutOfStock
+
+log = logging.getLogger(__name__)
+
+
+class CartServer:
+    def __init__(self):
+        # user id -> (revision, cart payload)
+        self._carts = {}
+        # Revisions keep counting up across deletes so an old revision never matches again
+        self._revision = 0
+        self.requests = 0
+        self.conflicts = 0
+        self._server = None
+        self.inventory = Inventory()
+
+    def handle(self, request: dict) -> dict:
+        self.requests += 1
+        op = request.get("op")
+        if not isinstance(op, str):
+            return {"error": f"bad op {op!r}"}
+        user = request.get("user")
+        revision, cart = self._carts.get(user, (0, None))
+        if op == "get":
+            return {"rev": revision, "cart": cart}
+        if op == "put":
+            if request["rev"] != revision:
+                self.conflicts += 1
+                return {"ok": False, "rev": revision, "cart": cart}
+            self._revision += 1
+            self._carts[user] = (self._revision, request["cart"])
+            return {"ok": True, "rev": self._revision, "cart": None}
+        if op == "delete":
+            version = request.get("version")
+            if cart is None or (version is not None and cart["version"] != version):
+                return {"ok": False, "rev": revision, "cart": cart}
+            del self._carts[user]
+            return {"ok": True, "rev": 0, "cart": cart}
+        if op.startswith("stock_"):
+            return self._stock(op, request)
+        if op == "stats":
+            return {"carts": len(self._carts), "requests": self.requests, "conflicts": self.conflicts}
+        return {"error": f"unknown op {op!r}"}
+
+    def _stock(self, op: str, request: dict) -> dict:
+        inventory = self.inventory
+        user = request.get("user")
+        items = request.get("items")
+        result = None
+        try:
+            if op == "stock_levels":
+                inventory.hold_ttl = request.get("hold_ttl", inventory.hold_ttl)
+                inventory.set_levels(request["levels"])
+            elif op == "stock_reserve":
+                inventory.reserve(user, items)
+            elif op == "stock_unreserve":
+                inventory.unreserve(user, items)
+            elif op == "stock_commit":
+                inventory.commit(user, items)
+            elif op == "stock_release":
+                result = inventory.release(user)
+            elif op == "stock_touch":
+                inventory.touch(user)
+            elif op == "stock_restock":
+                result = inventory.restock(items, request.get("mode", "add"))
+            elif op != "stock_get":
+                return {"error": f"unknown op {op!r}"}
+        except OutOfStock as e:
+            return {"ok": False, "shortages": e.shortages, "stock": inventory.stock_levels(), "stats": inventory.stats()}
+        except (KeyError, ValueError) as e:
+            return {"ok": False, "invalid": str(e.args[0]), "kind": type(e).__name__}
+        # Counts are few (limited items only), so every answer carries all of them
+        return {"ok": True, "result": result, "stock": inventory.stock_levels(), "stats": inventory.stats()}
+
+    async def _serve(self, reader, writer):
+        try:
+            while line := await reader.readline():
+                # A bad request gets an error reply (under its id, when it has
+                # one); the connection is shared by every pipelined call
+                request = None
+                try:
+                    request = json.loads(line)
+                    reply = self.handle(request)
+                except (ValueError, KeyError, TypeError, AttributeError) as e:
+                    reply = {"error": str(e)}
+                reply["id"] = request.get("id") if isinstance(request, dict) else None
+                writer.write(json.dumps(reply).encode() + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host: str = "127.0.0.1", port: int = 7480):
+        self._server = await asyncio.start_server(self._serve, host, port)
+        self.inventory.start()
+        return self._server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        self.inventory.stop()
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    def __len__(self):
+        return len(self._carts)
+
+
+async def serve(host: str, port: int):
+    server = CartServer()
+    port = await server.start(host, port)
+    log.info("Cart server listening on %s:%d", host, port)
+    await asyncio.Event().wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stand-in shared cart server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7480)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
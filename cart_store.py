@@ -0,0 +1,337 @@
+# cart_store.py
+# Where open carts live.
+#
+# Handlers never touch a cart dict directly; they go through a CartStore:
+#
+#   load(user_id)                      -> Cart or None
+#   update(user_id, mutate)            -> Cart after mutate(cart) was applied
+#   discard(user_id, if_version=None)  -> the removed Cart, or None
+#   release(user_id)                   hint that the user's views went away
+#
+# MemoryCartStore keeps carts in this process (a SessionStore, backed by the
+# SQLite order store). RemoteCartStore keeps them on a shared cart server (see
+# cart_server.py) so several shard processes see the same cart. Writes to the
+# server are compare-and-set on a per-cart revision: a write made from an
+# out-of-date copy is refused, and update() reapplies the mutation to the
+# current cart and tries again. Reads go through a small local cache that
+# expires after a moment.
+import asyncio
+import itertools
+import json
+import logging
+import random
+import time
+from collections import OrderedDict
+
+from cart import Cart
+
+log = logging.getLogger(__name__)
+
+
+class CartConflict(Exception):
+    """An update kept losing to concurrent writers and was given up."""
+
+
+class CartStore:
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+    async def load(self, user_id: int):
+        raise NotImplementedError
+
+    async def update(self, user_id: int, mutate) -> Cart:
+        """Apply mutate(cart) to the user's cart, creating it if needed.
+        mutate may be called more than once, each time on a fresh copy."""
+        raise NotImplementedError
+
+    async def discard(self, user_id: int, if_version: int = None):
+        """Remove the user's cart, only if its version is if_version when given."""
+        raise NotImplementedError
+
+    def release(self, user_id: int):
+        pass
+
+    def stats(self) -> dict:
+        return {}
+
+    def evictions(self) -> dict:
+        """Carts dropped from this process's memory, by reason (cumulative)."""
+        return {}
+
+    def bytes_held(self) -> int:
+        return 0
+
+    def __len__(self):
+        # Carts held by this process
+        return 0
+
+
+class MemoryCartStore(CartStore):
+    """Carts in a SessionStore, persisted through the order store and warmed
+    back lazily on first access. Updates run without awaiting between read
+    and write, so on one event loop they can't conflict.
+
+    Every sweep_interval seconds, stored carts that haven't been written for
+    the sessions' idle TTL (and aren't open in memory) are deleted, and each
+    on_expire listener is awaited with the user id, e.g. to release stock."""
+
+    def __init__(self, sessions, order_store, lookup, sweep_interval: float = 60.0):
+        self.sessions = sessions
+        self.order_store = order_store
+        # (item id, guild id) -> catalog item; a callable so it follows
+        # catalog reloads
+        self.lookup = lookup
+        self.sweep_interval = sweep_interval
+        self.on_expire = []
+        self._sweeper = None
+
+    async def start(self):
+        if self._sweeper is None and self.sweep_interval > 0 and self.sessions.idle_ttl > 0:
+            self._sweeper = asyncio.create_task(self._sweep_loop())
+
+    async def close(self):
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            await asyncio.gather(self._sweeper, return_exceptions=True)
+            self._sweeper = None
+
+    async def _sweep_loop(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                await self.sweep()
+            except Exception:
+                log.exception("Sweeping abandoned carts failed")
+
+    async def sweep(self) -> int:
+        """Delete abandoned stored carts now; returns how many."""
+        pruned = await self.order_store.prune_carts(time.time() - self.sessions.idle_ttl, self.sessions.user_ids())
+        for user_id in pruned:
+            for listener in self.on_expire:
+                await listener(user_id)
+        if pruned:
+            log.info("Deleted %d abandoned carts", len(pruned))
+        return len(pruned)
+
+    async def load(self, user_id: int):
+        cart = self.sessions.get(user_id)
+        if cart is not None:
+            return cart
+        snapshot = await self.order_store.load_cart(user_id)
+        # Another handler may have loaded or created the cart while we waited
+        cart = self.sessions.get(user_id)
+        if cart is None and snapshot:
+            cart = self.sessions.put(user_id, Cart.restore(snapshot, self.lookup))
+        return cart
+
+    async def update(self, user_id: int, mutate) -> Cart:
+        cart = await self.load(user_id)
+        if cart is None:
+            cart = self.sessions.get_or_create(user_id)
+        mutate(cart)
+        self.order_store.save_cart(user_id, cart.snapshot())
+        return cart
+
+    async def discard(self, user_id: int, if_version: int = None):
+        cart = await self.load(user_id)
+        if cart is None or (if_version is not None and cart.version != if_version):
+            return None
+        self.sessions.discard(user_id)
+        self.order_store.delete_cart(user_id)
+        return cart
+
+    def release(self, user_id: int):
+        self.sessions.release(user_id)
+
+    def stats(self) -> dict:
+        return {"backend": "memory", **self.sessions.stats(), "pruned": self.order_store.carts_pruned}
+
+    def evictions(self) -> dict:
+        sessions = self.sessions
+        return {"lru": sessions.evicted_lru, "idle": sessions.evicted_idle, "released": sessions.released}
+
+    def bytes_held(self) -> int:
+        return self.sessions.bytes_held()
+
+    def __len__(self):
+        return len(self.sessions)
+
+
+def _payload(cart: Cart) -> dict:
+    return {"version": cart.version, "lines": cart.snapshot()}
+
+
+def _restore(payload, lookup):
+    if payload is None:
+        return None
+    return Cart.restore(payload["lines"], lookup, payload["version"])
+
+
+class RemoteCartStore(CartStore):
+    """Carts on a shared cart server, spoken to over one pipelined connection
+    of JSON lines."""
+
+    def __init__(self, host: str, port: int, lookup, cache_size: int = 1024,
+                 cache_ttl: float = 1.0, max_attempts: int = 8, retry_delay: float = 0.005,
+                 clock=time.monotonic):
+        self.host = host
+        self.port = port
+        self.lookup = lookup
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self._clock = clock
+        # user id -> (revision, cart or None, fetched at)
+        self._cache = OrderedDict()
+        self._ids = itertools.count(1)
+        self._waiting = {}
+        self._reader = None
+        self._writer = None
+        self._read_task = None
+        self._connecting = asyncio.Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.conflicts = 0
+        self.requests = 0
+
+    # --- connection ---
+
+    async def start(self):
+        await self._connect()
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        if self._read_task is not None:
+            self._read_task.cancel()
+            try:
+                await self._read_task
+            except asyncio.CancelledError:
+                pass
+        self._reader = self._writer = self._read_task = None
+
+    async def _connect(self):
+        async with self._connecting:
+            if self._writer is not None:
+                return
+            self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+            self._read_task = asyncio.create_task(self._read_loop(self._reader))
+
+    async def _read_loop(self, reader):
+        try:
+            while line := await reader.readline():
+                reply = json.loads(line)
+                future = self._waiting.pop(reply.pop("id"), None)
+                if future is not None and not future.done():
+                    future.set_result(reply)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            log.exception("Cart server connection failed")
+        finally:
+            # Anything still waiting will never get an answer on this connection
+            if self._reader is reader:
+                self._writer.close()
+                self._reader = self._writer = None
+            waiting, self._waiting = self._waiting, {}
+            for future in waiting.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("Lost connection to the cart server"))
+
+    async def request(self, op: str, **args) -> dict:
+        """Send any server op over the store's connection (stock uses this)."""
+        return await self._call(op, **args)
+
+    async def _call(self, op: str, **args) -> dict:
+        if self._writer is None:
+            await self._connect()
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._waiting[request_id] = future
+        self._writer.write(json.dumps({"id": request_id, "op": op, **args}).encode() + b"\n")
+        self.requests += 1
+        await self._writer.drain()
+        reply = await future
+        if "error" in reply:
+            raise RuntimeError(f"Cart server error: {reply['error']}")
+        return reply
+
+    # --- cache ---
+
+    def _remember(self, user_id, revision, cart):
+        self._cache[user_id] = (revision, cart, self._clock())
+        self._cache.move_to_end(user_id)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return revision, cart
+
+    def _cached(self, user_id):
+        entry = self._cache.get(user_id)
+        if entry is None:
+            return None
+        if self._clock() - entry[2] >= self.cache_ttl:
+            del self._cache[user_id]
+            return None
+        self._cache.move_to_end(user_id)
+        return entry
+
+    async def _fetch(self, user_id, fresh=False):
+        entry = None if fresh else self._cached(user_id)
+        if entry is not None:
+            self.cache_hits += 1
+            return entry[0], entry[1]
+        self.cache_misses += 1
+        reply = await self._call("get", user=user_id)
+        return self._remember(user_id, reply["rev"], _restore(reply["cart"], self.lookup))
+
+    # --- store ---
+
+    async def load(self, user_id: int):
+        return (await self._fetch(user_id))[1]
+
+    async def update(self, user_id: int, mutate) -> Cart:
+        revision, cart = await self._fetch(user_id)
+        for attempt in range(self.max_attempts):
+            if attempt:
+                # Jittered backoff so writers racing on one cart spread out
+                await asyncio.sleep(random.uniform(0, self.retry_delay * attempt))
+            # Work on a copy so a refused write leaves the cache untouched
+            work = cart.copy() if cart is not None else Cart()
+            mutate(work)
+            reply = await self._call("put", user=user_id, rev=revision, cart=_payload(work))
+            if reply["ok"]:
+                self._remember(user_id, reply["rev"], work)
+                return work
+            # Someone else wrote first; the reply carries the current cart
+            self.conflicts += 1
+            revision, cart = self._remember(user_id, reply["rev"], _restore(reply["cart"], self.lookup))
+        raise CartConflict(f"Cart for user {user_id} kept changing; gave up after {self.max_attempts} attempts")
+
+    async def discard(self, user_id: int, if_version: int = None):
+        reply = await self._call("delete", user=user_id, version=if_version)
+        if not reply["ok"]:
+            self._remember(user_id, reply["rev"], _restore(reply["cart"], self.lookup))
+            return None
+        self._cache.pop(user_id, None)
+        return _restore(reply["cart"], self.lookup)
+
+    def release(self, user_id: int):
+        self._cache.pop(user_id, None)
+
+    def stats(self) -> dict:
+        return {
+            "backend": "remote",
+            "cached": len(self._cache),
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+            "conflicts": self.conflicts,
+            "requests": self.requests,
+            "connected": self._writer is not None,
+        }
+
+    def __len__(self):
+        return len(self._cache)
@@ -0,0 +1,550 @@
+# catalog.py
+# Market catalog loaded from a JSON file.
+#
+# A Catalog is an immutable, versioned index over the file: items are keyed by
+# a stable id (so reordering the file doesn't break open carts) and can be
+# looked up by name or category. CatalogSource holds the live catalog together
+# with its pre-rendered select options and embeds, and swaps in a new version
+# atomically when the file changes. Guilds can have overlays (changed prices,
+# removed or extra items) layered over the shared base; see GuildCatalog.
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from collections import ChainMap
+from types import MappingProxyType
+
+import discord
+
+from search import OverlaySearch, SearchIndex
+
+log = logging.getLogger(__name__)
+
+
+def to_cents(amount) -> int:
+    # Prices are kept as integer cents internally so totals never drift
+    return int(round(amount * 100))
+
+
+def format_cents(cents: int) -> str:
+    # Drop the .00 for whole numbers
+    dollars, rest = divmod(cents, 100)
+    return f"${dollars:,}" if rest == 0 else f"${dollars:,}.{rest:02d}"
+
+
+def format_price(amount) -> str:
+    return format_cents(to_cents(amount))
+
+
+# Discord allows 25 options per select
+PAGE_SIZE = 25
+# Category names travel in component custom_ids (see bot.page_arg), which
+# Discord caps at 100 characters including the action, user id and page
+CATEGORY_NAME_LIMIT = 50
+
+
+def catalog_version(data) -> str:
+    payload = json.dumps(data, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(payload.encode()).hexdigest()[:12]
+
+
+def _make_item(raw: dict, category: str):
+    item_id = raw["id"]
+    if not isinstance(raw["price"], (int, float)) or raw["price"] < 0:
+        raise ValueError(f"Invalid price for item {item_id!r}")
+    stock = raw.get("stock")
+    if stock is not None and (not isinstance(stock, int) or stock < 0):
+        raise ValueError(f"Invalid stock for item {item_id!r}")
+    return MappingProxyType({
+        "id": item_id,
+        "category": category,
+        "name": raw["name"],
+        "price": raw["price"],
+        "price_cents": to_cents(raw["price"]),
+        "description": raw.get("description", ""),
+        # Units per restock; None for unlimited supply
+        "stock": stock,
+    })
+
+
+class Catalog:
+    def __init__(self, data: dict):
+        categories = {}
+        category_items = {}
+        items = {}
+        by_name = {}
+
+        for category in data["categories"]:
+            name = category["name"]
+            if name in categories:
+                raise ValueError(f"Duplicate category {name!r}")
+            if not name or len(name) > CATEGORY_NAME_LIMIT:
+                raise ValueError(f"Category name {name!r} must be 1 to {CATEGORY_NAME_LIMIT} characters")
+            if not category["items"]:
+                # An item select needs at least one option
+                raise ValueError(f"Category {name!r} has no items")
+            categories[name] = MappingProxyType({
+                "name": name,
+                "description": category.get("description", ""),
+                "emoji": category.get("emoji"),
+            })
+            entries = []
+            for raw in category["items"]:
+                item_id = raw["id"]
+                if item_id in items:
+                    raise ValueError(f"Duplicate item id {item_id!r}")
+                item = _make_item(raw, name)
+                items[item_id] = item
+                by_name.setdefault(raw["name"].casefold(), item)
+                entries.append(item)
+            category_items[name] = tuple(entries)
+
+        self.version = catalog_version(data)
+        self._categories = MappingProxyType(categories)
+        self._category_items = MappingProxyType(category_items)
+        self._items = MappingProxyType(items)
+        self._by_name = MappingProxyType(by_name)
+
+    @classmethod
+    def from_file(cls, path: str) -> "Catalog":
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    @property
+    def categories(self):
+        return tuple(self._categories)
+
+    def category(self, name: str):
+        return self._categories.get(name)
+
+    def items_in(self, category: str) -> tuple:
+        return self._category_items.get(category, ())
+
+    def item(self, item_id: str):
+        return self._items.get(item_id)
+
+    def find(self, name: str):
+        return self._by_name.get(name.casefold())
+
+    def __contains__(self, item_id):
+        return item_id in self._items
+
+    def __len__(self):
+        return len(self._items)
+
+
+# Fields a guild overlay may change on a base item. Stock is shared by every
+# guild the process serves, so it stays with the base catalog.
+OVERRIDABLE = frozenset(("name", "price", "description"))
+
+
+class GuildCatalog:
+    """A base Catalog with one guild's overrides layered on top.
+
+    Only overridden or added items get entries of their own, and only the
+    categories they touch get a rebuilt item tuple; every other lookup falls
+    through to the base, so a guild costs memory in proportion to its
+    overlay. Overlay format:
+
+        {"items": {"<item id>": {"price": 1200000}, "<item id>": null},
+         "add": [{"id": ..., "category": ..., "name": ..., "price": ...}]}
+
+    null removes an item from the guild. A category left with no items is
+    hidden.
+    """
+
+    def __init__(self, base: Catalog, overlay: dict):
+        overrides = {}
+        touched = set()
+        added = {}
+        for item_id, change in (overlay.get("items") or {}).items():
+            item = base.item(item_id)
+            if item is None:
+                raise ValueError(f"Overlay changes unknown item {item_id!r}")
+            touched.add(item["category"])
+            if change is None:
+                overrides[item_id] = None
+                continue
+            unknown = set(change) - OVERRIDABLE
+            if unknown:
+                raise ValueError(f"Overlay can't change {', '.join(sorted(unknown))} of item {item_id!r}")
+            overrides[item_id] = _make_item(dict(item, **change), item["category"])
+        for raw in overlay.get("add") or ():
+            item_id, category = raw["id"], raw["category"]
+            if item_id in base or item_id in overrides:
+                raise ValueError(f"Overlay adds duplicate item id {item_id!r}")
+            if base.category(category) is None:
+                raise ValueError(f"Overlay adds item {item_id!r} to unknown category {category!r}")
+            if raw.get("stock") is not None:
+                raise ValueError(f"Overlay item {item_id!r} can't set stock")
+            overrides[item_id] = _make_item(raw, category)
+            added.setdefault(category, []).append(overrides[item_id])
+            touched.add(category)
+
+        category_items = {}
+        for category in touched:
+            entries = [overrides.get(item["id"], item) for item in base.items_in(category)]
+            category_items[category] = tuple(
+                [item for item in entries if item is not None] + added.get(category, [])
+            )
+
+        self.base = base
+        self.version = f"{base.version}+{catalog_version(overlay)}"
+        # item id -> replacement entry, or None when removed
+        self._overrides = MappingProxyType(overrides)
+        self._category_items = MappingProxyType(category_items)
+        self._by_name = MappingProxyType({
+            item["name"].casefold(): item for item in overrides.values() if item is not None
+        })
+        self._categories = tuple(
+            name for name in base.categories
+            if name not in category_items or category_items[name]
+        )
+        self._size = len(base) + sum(1 if item_id not in base else (-1 if item is None else 0)
+                                     for item_id, item in overrides.items())
+
+    @property
+    def overrides(self):
+        return self._overrides
+
+    @property
+    def touched_categories(self):
+        return frozenset(self._category_items)
+
+    @property
+    def categories(self):
+        return self._categories
+
+    def category(self, name: str):
+        if name in self._category_items and not self._category_items[name]:
+            return None
+        return self.base.category(name)
+
+    def items_in(self, category: str) -> tuple:
+        items = self._category_items.get(category)
+        return self.base.items_in(category) if items is None else items
+
+    def item(self, item_id: str):
+        if item_id in self._overrides:
+            return self._overrides[item_id]
+        return self.base.item(item_id)
+
+    def find(self, name: str):
+        key = name.casefold()
+        item = self._by_name.get(key)
+        if item is not None:
+            return item
+        item = self.base.find(key)
+        # A base item that was renamed or removed here doesn't match its old name
+        return None if item is None or item["id"] in self._overrides else item
+
+    def __contains__(self, item_id):
+        return self.item(item_id) is not None
+
+    def __len__(self):
+        return self._size
+
+
+# Landing embed variants: description and "How it works" text
+LANDING_TEXT = {
+    "market": (
+        "Welcome to the black market! Choose a category to browse available items.",
+        "1. Select a category\n2. Choose items to add to cart\n3. View cart and confirm order",
+    ),
+    "browse": (
+        "Welcome to the black market! Choose a category to browse available items.",
+        "1. Select a category from dropdown\n2. Choose multiple items to add to cart\n3. View cart and confirm order",
+    ),
+    "welcome_back": (
+        "Welcome back! Choose a category to browse available items.",
+        "1. Select a category from dropdown\n2. Choose multiple items to add to cart\n3. Enter quantities\n4. View cart and confirm order",
+    ),
+}
+
+
+class CatalogRenderCache:
+    def __init__(self):
+        self.version = None
+        self.rebuilds = 0
+        self._category_options = []
+        self._item_pages = {}
+        self._price_labels = {}
+        self._landing = {}
+        self._category_embeds = {}
+
+    def refresh(self, catalog: Catalog) -> bool:
+        """Rebuild if the catalog changed. Returns True when a rebuild happened."""
+        if catalog.version == self.version:
+            return False
+
+        category_options, landing = _category_views(catalog)
+
+        # Each category's options, split into select-sized pages
+        item_pages = {}
+        price_labels = {}
+        for category in catalog.categories:
+            item_pages[category] = _item_pages(catalog, category, price_labels)
+
+        category_embeds = {
+            category: discord.Embed(
+                title=f"🛍️ {category}",
+                description="Select multiple items to add to your cart from the dropdown below!",
+                color=discord.Color.blue()
+            ).to_dict()
+            for category in catalog.categories
+        }
+
+        # Swap everything in together so readers never see a half-built cache
+        (self._category_options, self._item_pages, self._price_labels,
+         self._landing, self._category_embeds) = (
+            category_options, item_pages, price_labels, landing, category_embeds)
+        self.version = catalog.version
+        self.rebuilds += 1
+        return True
+
+    def overlay(self, catalog: GuildCatalog) -> "CatalogRenderCache":
+        """A cache for a guild catalog layered over this one (built for its
+        base). Only the categories the overlay touches are rendered again;
+        the rest is shared."""
+        render = CatalogRenderCache()
+        item_pages = dict(self._item_pages)
+        price_labels = {}
+        for category in catalog.touched_categories:
+            if catalog.category(category) is None:
+                del item_pages[category]
+            else:
+                item_pages[category] = _item_pages(catalog, category, price_labels)
+        if catalog.categories == catalog.base.categories:
+            render._category_options, render._landing = self._category_options, self._landing
+        else:
+            render._category_options, render._landing = _category_views(catalog)
+        render._item_pages = item_pages
+        render._price_labels = ChainMap(price_labels, self._price_labels)
+        render._category_embeds = self._category_embeds
+        render.version = catalog.version
+        return render
+
+    # Options are never mutated after they're built, so callers get a new
+    # list that shares the option objects.
+
+    def category_options(self) -> list:
+        return list(self._category_options)
+
+    def item_options(self, category: str, page: int = 0) -> list:
+        return list(self._item_pages[category][page])
+
+    def page_count(self, category: str) -> int:
+        return len(self._item_pages[category])
+
+    def price_label(self, item_id: str) -> str:
+        return self._price_labels[item_id]
+
+    # Embeds get their own field list so callers can add fields freely
+
+    def landing_embed(self, variant: str = "market") -> discord.Embed:
+        return _embed_from(self._landing[variant])
+
+    def category_embed(self, category: str, page: int = 0) -> discord.Embed:
+        embed = _embed_from(self._category_embeds[category])
+        pages = len(self._item_pages[category])
+        if pages > 1:
+            embed.set_footer(text=f"Page {page + 1}/{pages}")
+        return embed
+
+
+def _category_views(catalog):
+    # Category select options and the landing embeds, which list the categories
+    category_options = [
+        discord.SelectOption(
+            label=name,
+            description=catalog.category(name)["description"],
+            emoji=catalog.category(name)["emoji"],
+            value=name
+        )
+        for name in catalog.categories
+    ]
+    category_list = "\n".join(f"{catalog.category(name)['emoji']} {name}" for name in catalog.categories)
+    landing = {}
+    for variant, (description, how_it_works) in LANDING_TEXT.items():
+        embed = discord.Embed(title="🏪 Black Market", description=description, color=discord.Color.gold())
+        embed.add_field(name="Available Categories", value=category_list, inline=False)
+        embed.add_field(name="How it works", value=how_it_works, inline=False)
+        landing[variant] = embed.to_dict()
+    return category_options, landing
+
+
+def _item_pages(catalog, category: str, price_labels: dict) -> list:
+    options = []
+    for item in catalog.items_in(category):
+        price_str = format_price(item["price"])
+        price_labels[item["id"]] = price_str
+        options.append(discord.SelectOption(label=f"{item['name']} - {price_str}", value=item["id"]))
+    return [options[i:i + PAGE_SIZE] for i in range(0, len(options), PAGE_SIZE)] or [[]]
+
+
+def _embed_from(payload: dict) -> discord.Embed:
+    data = dict(payload)
+    if "fields" in data:
+        data["fields"] = [dict(field) for field in data["fields"]]
+    return discord.Embed.from_dict(data)
+
+
+class Storefront:
+    """What one guild sees: a catalog with its render cache and search index."""
+
+    __slots__ = ("catalog", "render", "search")
+
+    def __init__(self, catalog, render, search):
+        self.catalog = catalog
+        self.render = render
+        self.search = search
+
+
+class _Loaded:
+    # One version of the catalog file and the overlays file, and everything built from them
+    __slots__ = ("base", "overlays", "version", "fronts")
+
+    def __init__(self, base: Storefront, overlays: dict, version: str):
+        self.base = base
+        # guild id -> GuildCatalog
+        self.overlays = overlays
+        self.version = version
+        # guild id -> Storefront, built on first use
+        self.fronts = {}
+
+
+def _build(path: str, overlays_path: str = None):
+    catalog = Catalog.from_file(path)
+    render = CatalogRenderCache()
+    render.refresh(catalog)
+    overlays = {}
+    version = catalog.version
+    if overlays_path and os.path.exists(overlays_path):
+        with open(overlays_path, encoding="utf-8") as f:
+            data = json.load(f)
+        for guild_id, overlay in (data.get("guilds") or {}).items():
+            overlays[int(guild_id)] = GuildCatalog(catalog, overlay)
+        version += "+" + catalog_version(data)
+    return _Loaded(Storefront(catalog, render, SearchIndex(catalog)), overlays, version)
+
+
+def _mtimes(path, overlays_path):
+    overlays = None
+    if overlays_path and os.path.exists(overlays_path):
+        overlays = os.stat(overlays_path).st_mtime_ns
+    return os.stat(path).st_mtime_ns, overlays
+
+
+class CatalogSource:
+    """The live catalog with its render cache and search index, reloadable from disk.
+
+    Guilds listed in the overlays file get their own storefront layered over
+    the shared base (see GuildCatalog); the rest share the base storefront.
+
+    Nothing is read until the catalog is first used (or load() is called), so
+    creating a source is free.
+    """
+
+    def __init__(self, path: str, overlays_path: str = None):
+        self.path = path
+        self.overlays_path = overlays_path
+        self._mtime = None
+        self._state = None
+        self.reloads = 0
+        self._watcher = None
+        # Called with the new base Catalog after each successful reload
+        self.on_reload = []
+
+    def load(self) -> _Loaded:
+        if self._state is None:
+            mtime = _mtimes(self.path, self.overlays_path)
+            self._state = _build(self.path, self.overlays_path)
+            self._mtime = mtime
+        return self._state
+
+    async def warm(self):
+        """Load in a worker thread ahead of first use."""
+        if self._state is None:
+            mtime = await asyncio.to_thread(_mtimes, self.path, self.overlays_path)
+            state = await asyncio.to_thread(_build, self.path, self.overlays_path)
+            if self._state is None:
+                self._state, self._mtime = state, mtime
+
+    @property
+    def loaded(self) -> bool:
+        return self._state is not None
+
+    @property
+    def catalog(self) -> Catalog:
+        return (self._state or self.load()).base.catalog
+
+    @property
+    def render(self) -> CatalogRenderCache:
+        return (self._state or self.load()).base.render
+
+    @property
+    def search(self):
+        return (self._state or self.load()).base.search
+
+    @property
+    def overlay_guilds(self):
+        return tuple((self._state or self.load()).overlays)
+
+    def storefront(self, guild_id: int = None) -> Storefront:
+        """The catalog as guild_id sees it. A guild's storefront is built the
+        first time it is asked for and kept until the next reload."""
+        state = self._state or self.load()
+        front = state.fronts.get(guild_id)
+        if front is None:
+            guild = state.overlays.get(guild_id)
+            if guild is None:
+                return state.base
+            base = state.base
+            front = state.fronts[guild_id] = Storefront(
+                guild, base.render.overlay(guild), OverlaySearch(base.search, guild)
+            )
+        return front
+
+    async def reload(self, force: bool = False) -> bool:
+        """Load the files again if they changed. Parsing and rendering run in
+        a worker thread; the swap itself is a plain assignment on the event
+        loop, so handlers see either the old version or the new one.
+
+        Open carts keep the item entries they were built from.
+        """
+        mtime = await asyncio.to_thread(_mtimes, self.path, self.overlays_path)
+        if not force and mtime == self._mtime:
+            return False
+        state = await asyncio.to_thread(_build, self.path, self.overlays_path)
+        self._mtime = mtime
+        if self._state is not None and state.version == self._state.version:
+            return False
+        self._state = state
+        self.reloads += 1
+        catalog = state.base.catalog
+        log.info(
+            "Catalog reloaded: version %s, %d items, %d guild overlays",
+            catalog.version, len(catalog), len(state.overlays)
+        )
+        for listener in self.on_reload:
+            listener(catalog)
+        return True
+
+    def watch(self, interval: float):
+        if self._watcher is None and interval > 0:
+            self._watcher = asyncio.create_task(self._watch(interval))
+
+    def stop(self):
+        if self._watcher is not None:
+            self._watcher.cancel()
+            self._watcher = None
+
+    async def _watch(self, interval):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.reload()
+            except Exception:
+                # Keep serving the current version until the file is fixed
+                log.exception("Catalog reload from %s failed", self.path)
@@ -0,0 +1,81 @@
+# command_sync.py
+# Sync slash commands only when the command tree actually changed.
+#
+# The serialized tree is hashed per scope (global or a guild id) and the hash of
+# the last successful sync is kept in a small JSON file, so restarts and
+# reconnects don't spend a rate-limited global sync on an unchanged tree.
+import hashlib
+import json
+import logging
+import os
+import time
+
+import discord
+
+log = logging.getLogger(__name__)
+
+
+def tree_hash(tree, guild=None) -> str:
+    commands = sorted(
+        (command.to_dict(tree) for command in tree.get_commands(guild=guild)),
+        key=lambda payload: (payload.get("type", 1), payload["name"]),
+    )
+    payload = json.dumps(commands, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _load_state(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError):
+        log.warning("Ignoring unreadable command sync state in %s", path)
+        return {}
+
+
+def _save_state(path, state):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+
+async def sync_commands(bot, state_path: str, guild_ids=(), force: bool = False) -> dict:
+    """Sync the command tree where it changed since the last sync.
+
+    With guild_ids, global commands are copied to those guilds and only the
+    guilds are synced (guild commands update instantly, handy while iterating).
+    Returns {scope: number of synced commands or None if skipped}.
+    """
+    tree = bot.tree
+    state = _load_state(state_path)
+    app_key = str(bot.application_id)
+    known = state.setdefault(app_key, {})
+
+    if guild_ids:
+        targets = []
+        for guild_id in guild_ids:
+            guild = discord.Object(id=guild_id)
+            tree.copy_global_to(guild=guild)
+            targets.append((str(guild_id), guild))
+    else:
+        targets = [("global", None)]
+
+    results = {}
+    for scope, guild in targets:
+        digest = tree_hash(tree, guild)
+        label = "global" if guild is None else f"guild {scope}"
+        if not force and known.get(scope) == digest:
+            log.info("Slash commands unchanged for %s, skipping sync", label)
+            results[scope] = None
+            continue
+        started = time.perf_counter()
+        synced = await tree.sync(guild=guild)
+        log.info("Synced %d slash command(s) to %s in %.2fs", len(synced), label, time.perf_counter() - started)
+        known[scope] = digest
+        # Save after each scope so a failure later on doesn't force a resync of this one
+        _save_state(state_path, state)
+        results[scope] = len(synced)
+    return results
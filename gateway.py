@@ -0,0 +1,74 @@
+# gateway.py
+# Gateway settings for running at scale.
+#
+# Everything the market does goes through slash commands and components, which
+# arrive as interactions regardless of intents. Production mode therefore only
+# asks for the guilds intent, caches no members or messages beyond what's
+# configured, and skips member chunking, so memory doesn't climb with the
+# number or size of guilds. Sharding can be automatic, or pinned to a subset of
+# shard ids so shards can run in separate processes.
+import discord
+
+
+def _parse_ids(value: str):
+    return [int(part) for part in value.replace(",", " ").split()]
+
+
+def gateway_options(env) -> dict:
+    """Keyword arguments for the bot constructor, read from an environment mapping.
+
+    BOT_MODE=production    trimmed intents, no member cache or chunking
+    MESSAGE_CACHE_SIZE     messages to cache (production default 0 = disabled)
+    SHARD_COUNT            total shards across every process
+    SHARD_IDS              shards this process runs, e.g. "0,1" (needs SHARD_COUNT)
+    """
+    production = env.get("BOT_MODE", "").lower() == "production"
+    shard_ids = _parse_ids(env.get("SHARD_IDS", ""))
+    shard_count = int(env["SHARD_COUNT"]) if env.get("SHARD_COUNT") else None
+    if shard_ids and shard_count is None:
+        raise RuntimeError("SHARD_IDS needs SHARD_COUNT to be set as well.")
+    if shard_count is not None and any(not 0 <= i < shard_count for i in shard_ids):
+        raise RuntimeError("SHARD_IDS must be between 0 and SHARD_COUNT - 1.")
+
+    options = {}
+    if production:
+        intents = discord.Intents.none()
+        intents.guilds = True
+        options["intents"] = intents
+        options["member_cache_flags"] = discord.MemberCacheFlags.none()
+        options["chunk_guilds_at_startup"] = False
+        cache_size = int(env.get("MESSAGE_CACHE_SIZE", "0"))
+    else:
+        intents = discord.Intents.default()
+        intents.message_content = True
+        options["intents"] = intents
+        cache_size = int(env.get("MESSAGE_CACHE_SIZE", "1000"))
+    # discord.py takes None to disable the message cache
+    options["max_messages"] = cache_size or None
+
+    sharded = production or shard_count is not None
+    if shard_count is not None:
+        options["shard_count"] = shard_count
+    if shard_ids:
+        options["shard_ids"] = shard_ids
+    return {"sharded": sharded, "options": options}
+
+
+def shard_for_guild(guild_id: int, shard_count: int) -> int:
+    return (guild_id >> 22) % shard_count
+
+
+def latency_report(bot, guild_id=None) -> str:
+    """One line per shard this process runs, marking the shard serving guild_id."""
+    latencies = getattr(bot, "latencies", None)
+    if not latencies:
+        return f"{round(bot.latency * 1000)}ms"
+    current = None
+    if guild_id is not None and bot.shard_count:
+        current = shard_for_guild(guild_id, bot.shard_count)
+    lines = []
+    for shard_id, latency in latencies:
+        marker = " ←" if shard_id == current else ""
+        value = "n/a" if latency != latency else f"{round(latency * 1000)}ms"  # NaN before the first heartbeat
+        lines.append(f"Shard {shard_id}: {value}{marker}")
+    return "\n".join(lines)
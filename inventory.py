@@ -0,0 +1,465 @@
+# inventory.py
+# Limited stock, kept in memory.
+#
+# Items with a "stock" level in the catalog are limited; everything else has
+# unlimited supply and is never tracked here. Adding to a cart reserves units
+# straight away (so the item select can show what's left without looking at
+# any carts), and confirming the order commits them. A user's reservations
+# expire together after `hold_ttl` seconds without activity: an expiry heap of
+# (deadline, user id) hands the units back. Touching a hold pushes a new heap
+# entry instead of moving the old one; stale entries are skipped when popped.
+#
+# Handlers don't use an Inventory directly but one of two stock stores, with
+# the same async methods (reserve, unreserve, commit, release, touch,
+# restock):
+#
+#   LocalStock   the Inventory lives in this process; every change is written
+#                behind to the order store (like carts), and a restart picks
+#                up the counts and holds where they were.
+#   RemoteStock  the Inventory lives on the shared cart server, so every shard
+#                sells from the same counts and sees the same holds.
+#
+# Counts start from the catalog levels the first time an item is limited and
+# then change only through restocks, reservations and sales.
+import asyncio
+import heapq
+import logging
+import time
+
+log = logging.getLogger(__name__)
+
+
+class OutOfStock(Exception):
+    def __init__(self, shortages: dict):
+        # item id -> units still available
+        self.shortages = shortages
+        super().__init__(", ".join(f"{item_id}: {left} left" for item_id, left in shortages.items()))
+
+
+class Inventory:
+    def __init__(self, hold_ttl: float = 1800.0, clock=time.monotonic):
+        self.hold_ttl = hold_ttl
+        self.clock = clock
+        # item id -> units on sale; limited items only
+        self._available = {}
+        # item id -> units reserved in open carts
+        self._held = {}
+        # item id -> level a full restock brings it back to
+        self._levels = {}
+        # user id -> {item id: units}, and when those units go back on sale
+        self._holds = {}
+        self._deadlines = {}
+        self._expiry = []
+        self._expirer = None
+        # Changed since the last changes() call, for persistence
+        self._dirty_items = set()
+        self._dirty_holds = set()
+        # Called after an expiry pass released holds
+        self.on_expire = None
+        self.reserved = 0
+        self.committed = 0
+        self.expired = 0
+        self.refused = 0
+
+    def load_levels(self, catalog):
+        """Pick up stock levels from a catalog. Newly limited items start at
+        their level; items already tracked keep their current count, so a
+        reload doesn't reset stock. Items no longer limited are dropped."""
+        self.set_levels(catalog_levels(catalog))
+
+    def set_levels(self, levels: dict):
+        for item_id in list(self._available):
+            if item_id not in levels:
+                del self._available[item_id]
+                self._held.pop(item_id, None)
+                self._dirty_items.add(item_id)
+        for item_id, level in levels.items():
+            if item_id not in self._available:
+                self._available[item_id] = level
+                self._held[item_id] = 0
+                self._dirty_items.add(item_id)
+        self._levels = dict(levels)
+
+    def available(self, item_id: str):
+        """Units on sale, or None for an unlimited item."""
+        return self._available.get(item_id)
+
+    def _shortages(self, needed: dict) -> dict:
+        available = self._available
+        return {
+            item_id: available[item_id]
+            for item_id, units in needed.items()
+            if item_id in available and units > available[item_id]
+        }
+
+    def reserve(self, user_id: int, quantities: dict):
+        """Hold {item id: units} for the user: all of it, or nothing (OutOfStock)."""
+        shortages = self._shortages(quantities)
+        if shortages:
+            self.refused += 1
+            raise OutOfStock(shortages)
+        for item_id, units in quantities.items():
+            if item_id in self._available and units > 0:
+                self._move(user_id, item_id, units)
+                self.reserved += units
+        self.touch(user_id)
+
+    def unreserve(self, user_id: int, quantities: dict):
+        """Give back part of a hold (a cart update that failed after reserving)."""
+        hold = self._holds.get(user_id)
+        if hold:
+            for item_id, units in quantities.items():
+                units = min(units, hold.get(item_id, 0))
+                if units > 0 and item_id in self._available:
+                    self._move(user_id, item_id, -units)
+            if not hold:
+                self._drop(user_id)
+
+    def _move(self, user_id, item_id, units):
+        # Positive units go from the shelf into the user's hold, negative back
+        hold = self._holds.setdefault(user_id, {})
+        left = hold.get(item_id, 0) + units
+        if left:
+            hold[item_id] = left
+        else:
+            hold.pop(item_id, None)
+        self._available[item_id] -= units
+        self._held[item_id] += units
+        self._dirty_items.add(item_id)
+        self._dirty_holds.add(user_id)
+
+    def touch(self, user_id: int):
+        """Push back the expiry of the user's hold."""
+        if user_id not in self._holds:
+            return
+        self._schedule(user_id, self.clock() + self.hold_ttl)
+
+    def _schedule(self, user_id, deadline):
+        self._deadlines[user_id] = deadline
+        self._dirty_holds.add(user_id)
+        heapq.heappush(self._expiry, (deadline, user_id))
+        # Touches leave stale entries behind; rebuild once they outnumber live ones
+        if len(self._expiry) > 2 * len(self._deadlines) + 64:
+            self._expiry = [(deadline, user_id) for user_id, deadline in self._deadlines.items()]
+            heapq.heapify(self._expiry)
+
+    def commit(self, user_id: int, quantities: dict):
+        """Sell {item id: units} (the confirmed cart) out of the user's hold.
+        Held units beyond that go back on sale. Units not held (the hold
+        expired) are taken from the shelf, or OutOfStock is raised and nothing
+        changes."""
+        hold = self._holds.get(user_id, {})
+        missing = {
+            item_id: units - hold.get(item_id, 0)
+            for item_id, units in quantities.items()
+            if item_id in self._available and units > hold.get(item_id, 0)
+        }
+        shortages = self._shortages(missing)
+        if shortages:
+            self.refused += 1
+            raise OutOfStock(shortages)
+        for item_id, units in missing.items():
+            self._move(user_id, item_id, units)
+        for item_id, units in self._drop(user_id).items():
+            if item_id in self._available:
+                self._held[item_id] -= units
+                self._available[item_id] += units - min(units, quantities.get(item_id, 0))
+                self._dirty_items.add(item_id)
+        self.committed += 1
+
+    def release(self, user_id: int) -> dict:
+        """Put everything the user holds back on sale."""
+        hold = self._drop(user_id)
+        for item_id, units in hold.items():
+            if item_id in self._available:
+                self._available[item_id] += units
+                self._held[item_id] -= units
+                self._dirty_items.add(item_id)
+        return hold
+
+    def _drop(self, user_id):
+        self._deadlines.pop(user_id, None)
+        self._dirty_holds.add(user_id)
+        return self._holds.pop(user_id, None) or {}
+
+    def expire(self, now: float = None) -> int:
+        """Release holds whose deadline has passed. Returns how many."""
+        now = self.clock() if now is None else now
+        expiry = self._expiry
+        released = 0
+        while expiry and expiry[0][0] <= now:
+            deadline, user_id = heapq.heappop(expiry)
+            if self._deadlines.get(user_id) == deadline:
+                self.release(user_id)
+                released += 1
+        self.expired += released
+        return released
+
+    def restock(self, quantities: dict = None, mode: str = "add") -> dict:
+        """Restock many items at once and return their new counts.
+
+        With no quantities every limited item is refilled to its catalog
+        level (less what's reserved). Otherwise mode "add" adds units and
+        "set" sets the units on sale. Unknown or unlimited items raise
+        KeyError before anything changes.
+        """
+        if quantities is None:
+            quantities = {item_id: max(0, level - self._held[item_id]) for item_id, level in self._levels.items()}
+            mode = "set"
+        elif mode not in ("add", "set"):
+            raise ValueError(f"Unknown restock mode {mode!r}")
+        unknown = [item_id for item_id in quantities if item_id not in self._available]
+        if unknown:
+            raise KeyError(", ".join(unknown))
+        for item_id, units in quantities.items():
+            current = self._available[item_id] if mode == "add" else 0
+            self._available[item_id] = max(0, current + units)
+            self._dirty_items.add(item_id)
+        return {item_id: self._available[item_id] for item_id in quantities}
+
+    def start(self, interval: float = 5.0):
+        if self._expirer is None and interval > 0:
+            self._expirer = asyncio.create_task(self._expire_loop(interval))
+
+    def stop(self):
+        if self._expirer is not None:
+            self._expirer.cancel()
+            self._expirer = None
+
+    async def _expire_loop(self, interval):
+        while True:
+            await asyncio.sleep(interval)
+            released = self.expire()
+            if released:
+                log.info("Released %d expired stock reservations", released)
+                if self.on_expire is not None:
+                    self.on_expire()
+
+    def stats(self) -> dict:
+        return {
+            "limited_items": len(self._available),
+            "holds": len(self._holds),
+            "units_held": sum(self._held.values()),
+            "reserved": self.reserved,
+            "committed": self.committed,
+            "expired": self.expired,
+            "refused": self.refused,
+        }
+
+    def stock_levels(self) -> dict:
+        return dict(self._available)
+
+    # --- persistence ---
+
+    def changes(self):
+        """What changed since the last call: ({item id: units on sale, or None
+        if no longer limited}, {user id: (hold, expires at as Unix time), or
+        None if released})."""
+        offset = time.time() - self.clock()
+        items = {item_id: self._available.get(item_id) for item_id in self._dirty_items}
+        holds = {}
+        for user_id in self._dirty_holds:
+            hold = self._holds.get(user_id)
+            deadline = self._deadlines.get(user_id)
+            holds[user_id] = (dict(hold), deadline + offset) if hold and deadline is not None else None
+        self._dirty_items.clear()
+        self._dirty_holds.clear()
+        return items, holds
+
+    def restore(self, available: dict, holds: dict):
+        """Take back counts and holds saved from changes(), before load_levels().
+        Holds on items that are no longer counted are dropped."""
+        offset = self.clock() - time.time()
+        self._available = dict(available)
+        self._held = dict.fromkeys(self._available, 0)
+        self._holds.clear()
+        self._deadlines.clear()
+        self._expiry = []
+        for user_id, (hold, expires_at) in holds.items():
+            hold = {item_id: units for item_id, units in hold.items() if item_id in self._available and units > 0}
+            if not hold:
+                continue
+            self._holds[user_id] = hold
+            for item_id, units in hold.items():
+                self._held[item_id] += units
+            self._schedule(user_id, expires_at + offset)
+        self._dirty_items.clear()
+        self._dirty_holds.clear()
+
+
+def catalog_levels(catalog) -> dict:
+    """{item id: stock level} for the catalog's limited items."""
+    levels = {}
+    for category in catalog.categories:
+        for item in catalog.items_in(category):
+            if item.get("stock") is not None:
+                levels[item["id"]] = item["stock"]
+    return levels
+
+
+class LocalStock:
+    """Stock kept by this process in an Inventory, written behind to the
+    order store after every change."""
+
+    def __init__(self, inventory: Inventory, order_store=None, expire_interval: float = 5.0):
+        self.inventory = inventory
+        self.order_store = order_store
+        self.expire_interval = expire_interval
+        inventory.on_expire = self._save
+
+    async def start(self, catalog):
+        if self.order_store is not None:
+            available, holds = await self.order_store.load_stock()
+            self.inventory.restore(available, holds)
+            if available:
+                log.info("Restored stock for %d items and %d holds", len(available), len(holds))
+        self.load_levels(catalog)
+        self.inventory.start(self.expire_interval)
+
+    def stop(self):
+        self.inventory.stop()
+        self._save()
+
+    def load_levels(self, catalog):
+        self.inventory.load_levels(catalog)
+        self._save()
+
+    def _save(self):
+        items, holds = self.inventory.changes()
+        if self.order_store is None:
+            return
+        for item_id, units in items.items():
+            self.order_store.save_stock(item_id, units)
+        for user_id, hold in holds.items():
+            self.order_store.save_hold(user_id, hold)
+
+    async def reserve(self, user_id: int, quantities: dict):
+        try:
+            self.inventory.reserve(user_id, quantities)
+        finally:
+            self._save()
+
+    async def unreserve(self, user_id: int, quantities: dict):
+        self.inventory.unreserve(user_id, quantities)
+        self._save()
+
+    async def commit(self, user_id: int, quantities: dict):
+        try:
+            self.inventory.commit(user_id, quantities)
+        finally:
+            self._save()
+
+    async def release(self, user_id: int) -> dict:
+        hold = self.inventory.release(user_id)
+        self._save()
+        return hold
+
+    async def touch(self, user_id: int):
+        self.inventory.touch(user_id)
+        self._save()
+
+    async def restock(self, quantities: dict = None, mode: str = "add") -> dict:
+        levels = self.inventory.restock(quantities, mode)
+        self._save()
+        return levels
+
+    def available(self, item_id: str):
+        return self.inventory.available(item_id)
+
+    def stock_levels(self) -> dict:
+        return self.inventory.stock_levels()
+
+    @property
+    def refused(self) -> int:
+        return self.inventory.refused
+
+    def stats(self) -> dict:
+        return self.inventory.stats()
+
+
+class RemoteStock:
+    """Stock kept by the shared cart server (see cart_server.py). Every reply
+    carries the server's current counts, which available() answers from
+    between calls; a poll keeps them fresh when this shard is idle."""
+
+    def __init__(self, call, hold_ttl: float = 1800.0, poll_interval: float = 5.0):
+        # call(op, **args) -> reply dict; RemoteCartStore.request
+        self._call = call
+        self.hold_ttl = hold_ttl
+        self.poll_interval = poll_interval
+        self._available = {}
+        self._stats = {}
+        self._poller = None
+        self._pending = set()
+        self.refused = 0
+
+    async def start(self, catalog):
+        await self._levels(catalog)
+        if self._poller is None and self.poll_interval > 0:
+            self._poller = asyncio.create_task(self._poll())
+
+    def stop(self):
+        if self._poller is not None:
+            self._poller.cancel()
+            self._poller = None
+
+    def load_levels(self, catalog):
+        # Called from catalog reload listeners, which can't wait
+        task = asyncio.get_running_loop().create_task(self._levels(catalog))
+        self._pending.add(task)
+        task.add_done_callback(self._levels_sent)
+
+    def _levels_sent(self, task):
+        self._pending.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            log.error("Sending stock levels to the cart server failed", exc_info=task.exception())
+
+    async def _levels(self, catalog):
+        await self._request("stock_levels", levels=catalog_levels(catalog), hold_ttl=self.hold_ttl)
+
+    async def _poll(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await self._request("stock_get")
+            except Exception:
+                log.exception("Polling stock from the cart server failed")
+
+    async def _request(self, op: str, **args) -> dict:
+        reply = await self._call(op, **args)
+        if "stock" in reply:
+            self._available = reply["stock"]
+            self._stats = reply.get("stats", self._stats)
+        if reply.get("shortages") is not None:
+            self.refused += 1
+            raise OutOfStock(reply["shortages"])
+        if reply.get("invalid") is not None:
+            raise (KeyError if reply.get("kind") == "KeyError" else ValueError)(reply["invalid"])
+        return reply
+
+    async def reserve(self, user_id: int, quantities: dict):
+        await self._request("stock_reserve", user=user_id, items=quantities)
+
+    async def unreserve(self, user_id: int, quantities: dict):
+        await self._request("stock_unreserve", user=user_id, items=quantities)
+
+    async def commit(self, user_id: int, quantities: dict):
+        await self._request("stock_commit", user=user_id, items=quantities)
+
+    async def release(self, user_id: int) -> dict:
+        return (await self._request("stock_release", user=user_id))["result"]
+
+    async def touch(self, user_id: int):
+        await self._request("stock_touch", user=user_id)
+
+    async def restock(self, quantities: dict = None, mode: str = "add") -> dict:
+        return (await self._request("stock_restock", items=quantities, mode=mode))["result"]
+
+    def available(self, item_id: str):
+        return self._available.get(item_id)
+
+    def stock_levels(self) -> dict:
+        return dict(self._available)
+
+    def stats(self) -> dict:
+        return dict(self._stats, holds=self._stats.get("holds", 0))
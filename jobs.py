@@ -0,0 +1,79 @@
+# jobs.py
+# Background work queue for side effects that don't need to finish before the
+# user sees a reply: recording orders, audit logging, notifications.
+#
+# A fixed pool of worker tasks drains a bounded asyncio.Queue. When the queue
+# is full, submit() waits for room, so a burst slows down the handlers that
+# produce work instead of growing memory without limit. Each kind of job is
+# recorded in the metrics registry (market_job_* series, apart from the
+# interaction handlers): runs, failures, run time and time spent queued.
+import asyncio
+import logging
+import time
+
+import metrics
+
+log = logging.getLogger(__name__)
+
+
+class JobQueue:
+    def __init__(self, workers: int = 4, max_size: int = 1000, registry=metrics.registry):
+        self.worker_count = workers
+        self.registry = registry
+        self._queue = asyncio.Queue(maxsize=max_size)
+        self._workers = []
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        # Submissions that found the queue full and had to wait
+        self.blocked = 0
+
+    def start(self):
+        if not self._workers:
+            self._workers = [asyncio.create_task(self._work()) for _ in range(self.worker_count)]
+
+    async def submit(self, kind: str, call):
+        """Queue call() (a coroutine factory) to run in the background."""
+        self.start()
+        if self._queue.full():
+            self.blocked += 1
+        await self._queue.put((kind, call, time.perf_counter()))
+        self.submitted += 1
+
+    async def _work(self):
+        while True:
+            kind, call, queued_at = await self._queue.get()
+            stats = self.registry.job_stats(kind)
+            stats.runs += 1
+            started = time.perf_counter()
+            stats.wait.observe(started - queued_at)
+            try:
+                await call()
+            except Exception:
+                stats.errors += 1
+                self.failed += 1
+                log.exception("Background job %s failed", kind)
+            else:
+                self.completed += 1
+            finally:
+                stats.duration.observe(time.perf_counter() - started)
+                self._queue.task_done()
+
+    async def join(self):
+        """Wait until everything queued so far has run."""
+        await self._queue.join()
+
+    async def close(self, timeout: float = 10.0):
+        # Give queued work a chance to finish, then stop the workers
+        if self._workers:
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout)
+            except asyncio.TimeoutError:
+                log.warning("Stopping with %d background jobs still queued", self._queue.qsize())
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def __len__(self):
+        return self._queue.qsize()
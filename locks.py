@@ -0,0 +1,96 @@
+# locks.py
+# Per-user serialization and idempotency for cart mutations.
+#
+# Each user gets their own asyncio.Lock, created on first use and dropped as
+# soon as nobody holds or waits for it, so different shoppers never wait on
+# each other and idle users cost nothing. Confirmations are recorded under an
+# idempotency key for a while, so a repeated "Confirm Order" click is answered
+# from the first result instead of confirming twice.
+import asyncio
+import time
+from collections import OrderedDict
+
+
+class _Hold:
+    __slots__ = ("_locks", "_user_id", "_entry")
+
+    def __init__(self, locks, user_id):
+        self._locks = locks
+        self._user_id = user_id
+        self._entry = None
+
+    async def __aenter__(self):
+        locks = self._locks
+        entry = locks._locks.get(self._user_id)
+        if entry is None:
+            entry = locks._locks[self._user_id] = [asyncio.Lock(), 0]
+        elif entry[0].locked():
+            locks.contended += 1
+        entry[1] += 1
+        self._entry = entry
+        try:
+            await entry[0].acquire()
+        except BaseException:
+            self._leave()
+            raise
+        return self
+
+    async def __aexit__(self, *exc):
+        self._entry[0].release()
+        self._leave()
+
+    def _leave(self):
+        entry = self._entry
+        entry[1] -= 1
+        if entry[1] == 0 and self._locks._locks.get(self._user_id) is entry:
+            del self._locks._locks[self._user_id]
+
+
+class UserLocks:
+    def __init__(self):
+        # user id -> [lock, holders + waiters]
+        self._locks = {}
+        self.contended = 0
+
+    def hold(self, user_id: int) -> _Hold:
+        """`async with user_locks.hold(user_id):` serializes work for one user."""
+        return _Hold(self, user_id)
+
+    def __len__(self):
+        return len(self._locks)
+
+
+class IdempotencyCache:
+    """Results of completed operations by key, kept for `ttl` seconds."""
+
+    def __init__(self, ttl: float = 600.0, max_size: int = 10000, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._clock = clock
+        self._entries = OrderedDict()
+        self.hits = 0
+
+    def get(self, key):
+        self._expire()
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key, result):
+        self._entries[key] = (result, self._clock())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def _expire(self):
+        deadline = self._clock() - self.ttl
+        while self._entries:
+            key, (_, stored_at) = next(iter(self._entries.items()))
+            if stored_at > deadline:
+                break
+            del self._entries[key]
+
+    def __len__(self):
+        return len(self._entries)
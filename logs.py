@@ -0,0 +1,226 @@
+# logs.py
+# Logging that stays off the event loop.
+#
+# Loggers hand records to a QueueHandler, which only captures the record and
+# puts it on a bounded queue; a QueueListener thread formats them and does the
+# writes (stderr, and optionally a size-rotated file). Records are written as
+# compact JSON lines carrying the context of the interaction being handled
+# (interaction id, user, guild, handler), which metrics.observe() sets for
+# the duration of each handler.
+#
+# High-volume INFO/DEBUG events can be sampled per logger: with
+# LOG_SAMPLE="market.interaction=0.1" one in ten is kept and carries
+# "sample": 10 so counts can be scaled back up. Warnings and errors are always
+# kept. When the queue is full, records are dropped and counted rather than
+# blocking the loop.
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+from contextvars import ContextVar
+
+# Fields of the interaction being handled, or None
+log_context = ContextVar("log_context", default=None)
+
+# Attributes every LogRecord has; anything else was passed in `extra`
+_RECORD_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "context", "sample"}
+
+
+def interaction_fields(interaction, handler: str) -> dict:
+    user = getattr(interaction, "user", None)
+    return {
+        "interaction": getattr(interaction, "id", None),
+        "user": getattr(user, "id", None),
+        "guild": getattr(interaction, "guild_id", None),
+        "handler": handler,
+    }
+
+
+def _extra(record) -> dict:
+    # Interaction context first, then whatever was passed in `extra`
+    fields = dict(getattr(record, "context", None) or {})
+    for key, value in vars(record).items():
+        if key not in _RECORD_ATTRS:
+            fields[key] = value
+    return fields
+
+
+class JsonFormatter(logging.Formatter):
+    """One compact JSON object per record."""
+
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in _extra(record).items():
+            entry.setdefault(key, value)
+        sample = getattr(record, "sample", 1)
+        if sample != 1:
+            entry["sample"] = sample
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str, separators=(",", ":"), ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    """Plain lines for a terminal, with the context and extra fields appended."""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-8s %(name)s: %(message)s")
+
+    def formatMessage(self, record):
+        # Runs before the traceback is appended, so the fields stay on the first line
+        line = super().formatMessage(record)
+        fields = " ".join(f"{key}={value}" for key, value in _extra(record).items() if value is not None)
+        return f"{line} [{fields}]" if fields else line
+
+
+class Sampler:
+    """Keeps one in N records below WARNING for the configured loggers."""
+
+    def __init__(self, rates: dict):
+        # logger name -> keep one in N; a rule covers the logger's children too
+        self.every = {name: max(1, round(1 / rate)) for name, rate in rates.items() if rate > 0}
+        self.off = {name for name, rate in rates.items() if rate <= 0}
+        self._counts = {}
+        self._rules = {}
+        self.dropped = 0
+
+    def _rule(self, name):
+        rule = self._rules.get(name)
+        if rule is None:
+            rule = ""
+            for prefix in list(self.every) + list(self.off):
+                if (name == prefix or name.startswith(prefix + ".")) and len(prefix) > len(rule):
+                    rule = prefix
+            self._rules[name] = rule
+        return rule
+
+    def keep(self, record) -> int:
+        """0 to drop the record, otherwise the N it stands for."""
+        if record.levelno >= logging.WARNING:
+            return 1
+        rule = self._rule(record.name)
+        if not rule:
+            return 1
+        if rule in self.off:
+            self.dropped += 1
+            return 0
+        every = self.every[rule]
+        seen = self._counts.get(rule, 0)
+        self._counts[rule] = seen + 1
+        if seen % every:
+            self.dropped += 1
+            return 0
+        return every
+
+
+class ContextQueueHandler(logging.handlers.QueueHandler):
+    """Samples, attaches the interaction context and queues the record.
+    Formatting happens on the listener thread."""
+
+    def __init__(self, log_queue, sampler: Sampler = None):
+        super().__init__(log_queue)
+        self.sampler = sampler
+        self.dropped = 0
+
+    def emit(self, record):
+        if self.sampler is not None:
+            sample = self.sampler.keep(record)
+            if not sample:
+                return
+            record.sample = sample
+        record.context = log_context.get()
+        try:
+            self.enqueue(self.prepare(record))
+        except queue.Full:
+            self.dropped += 1
+        except Exception:
+            self.handleError(record)
+
+    def prepare(self, record):
+        # Merge the arguments now (they may change after this returns) and
+        # keep exceptions as text; the record is otherwise formatted later.
+        # Only the root logger has a handler, so nothing else sees the record.
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class LogPipeline:
+    def __init__(self, level: str = "INFO", fmt: str = "json", path: str = None, max_bytes: int = 10 * 2**20,
+                 backups: int = 5, samples: dict = None, queue_size: int = 10000, stream=None):
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.sampler = Sampler(samples or {})
+        self.handler = ContextQueueHandler(self.queue, self.sampler)
+        formatter = JsonFormatter() if fmt == "json" else TextFormatter()
+        outputs = []
+        console = logging.StreamHandler(stream or sys.stderr)
+        console.setFormatter(formatter)
+        outputs.append(console)
+        if path:
+            # Files are always JSON lines
+            rotating = logging.handlers.RotatingFileHandler(
+                path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8"
+            )
+            rotating.setFormatter(JsonFormatter())
+            outputs.append(rotating)
+        self.outputs = outputs
+        self.listener = logging.handlers.QueueListener(self.queue, *outputs, respect_handler_level=True)
+        self.level = level
+        self._flags = None
+
+    def start(self):
+        # Records don't need the thread or process they came from; the
+        # "Optimization" section of the logging HOWTO documents these switches.
+        # stop() puts them back.
+        self._flags = (logging.logThreads, logging.logProcesses, logging.logMultiprocessing)
+        logging.logThreads = False
+        logging.logProcesses = False
+        logging.logMultiprocessing = False
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(self.handler)
+        root.setLevel(self.level)
+        self.listener.start()
+        return self
+
+    def stop(self):
+        """Write out whatever is queued and stop the listener thread."""
+        logging.getLogger().removeHandler(self.handler)
+        if self._flags is not None:
+            logging.logThreads, logging.logProcesses, logging.logMultiprocessing = self._flags
+            self._flags = None
+        self.listener.stop()
+        for output in self.outputs:
+            output.close()
+
+    def stats(self) -> dict:
+        return {
+            "queued": self.queue.qsize(),
+            "dropped_full": self.handler.dropped,
+            "dropped_sampled": self.sampler.dropped,
+        }
+
+
+def setup_logging(settings) -> LogPipeline:
+    return LogPipeline(
+        level=settings.log_level,
+        fmt=settings.log_format,
+        path=settings.log_file,
+        max_bytes=settings.log_file_max_bytes,
+        backups=settings.log_file_backups,
+        samples=settings.log_sample,
+        queue_size=settings.log_queue_size,
+    ).start()
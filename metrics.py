@@ -0,0 +1,310 @@
+# metrics.py
+# Per-handler latency and throughput instrumentation.
+#
+# Every component callback, modal submit and app command is wrapped so we
+# record, per handler: calls, errors, handler duration, time-to-ack (handler
+# start until the first response call returns) and how old the interaction
+# already was when we started handling it (Discord's 3 second deadline counts
+# from creation). Values go into fixed-bucket histograms, so recording is a
+# bisect and two additions. Results are served in Prometheus text format on a
+# local HTTP port and summarized by the /stats command.
+import functools
+import inspect
+import logging
+import time
+from bisect import bisect_left
+
+import discord
+
+from logs import interaction_fields, log_context
+
+# One record per handled interaction; sample it with LOG_SAMPLE under load
+interaction_log = logging.getLogger("market.interaction")
+
+# Seconds. Dense below the 3 s interaction deadline.
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 2.5, 3.0, 5.0, 10.0)
+
+# Response methods that acknowledge an interaction
+ACK_METHODS = frozenset(("send_message", "edit_message", "send_modal", "defer", "autocomplete"))
+
+
+class Histogram:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds=DEFAULT_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-th observation (an estimate)."""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= target:
+                return self.bounds[i] if i < len(self.bounds) else float("inf")
+        return float("inf")
+
+
+class HandlerStats:
+    __slots__ = ("calls", "errors", "duration", "ack", "age")
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.duration = Histogram()
+        self.ack = Histogram()
+        self.age = Histogram()
+
+
+class JobStats:
+    __slots__ = ("runs", "errors", "duration", "wait")
+
+    def __init__(self):
+        self.runs = 0
+        self.errors = 0
+        self.duration = Histogram()
+        # Time spent queued before a worker picked the job up
+        self.wait = Histogram()
+
+
+class Registry:
+    def __init__(self):
+        self.handlers = {}
+        # Background jobs by kind; kept apart from interactions
+        self.jobs = {}
+        # name -> (help text, callable returning a number or {labels tuple: number})
+        self.gauges = {}
+        self.started = time.time()
+        # Called once with (label, seconds) after the first interaction is handled
+        self.on_first_handled = None
+
+    def stats(self, label: str) -> HandlerStats:
+        stats = self.handlers.get(label)
+        if stats is None:
+            stats = self.handlers[label] = HandlerStats()
+        return stats
+
+    def job_stats(self, kind: str) -> JobStats:
+        stats = self.jobs.get(kind)
+        if stats is None:
+            stats = self.jobs[kind] = JobStats()
+        return stats
+
+    def gauge(self, name: str, help_text: str, read):
+        self.gauges[name] = (help_text, read)
+
+    def reset(self):
+        self.handlers.clear()
+        self.jobs.clear()
+        self.started = time.time()
+
+
+registry = Registry()
+
+
+class _AckTimer:
+    """Wraps an InteractionResponse and notes when the first response call completes."""
+
+    __slots__ = ("_response", "acked_at")
+
+    def __init__(self, response):
+        self._response = response
+        self.acked_at = None
+
+    def __getattr__(self, name):
+        attr = getattr(self._response, name)
+        if name not in ACK_METHODS:
+            return attr
+
+        async def timed(*args, **kwargs):
+            result = await attr(*args, **kwargs)
+            if self.acked_at is None:
+                self.acked_at = time.perf_counter()
+            return result
+        return timed
+
+
+def _swap_response(interaction, response):
+    # discord.Interaction caches its response object in a slot
+    if isinstance(interaction, discord.Interaction):
+        interaction._cs_response = response
+    else:
+        interaction.response = response
+
+
+async def observe(label: str, interaction, call):
+    """Run call() (a coroutine factory) for an interaction and record it under label."""
+    stats = registry.stats(label)
+    stats.calls += 1
+    started = time.perf_counter()
+    created_at = getattr(interaction, "created_at", None)
+    if created_at is not None:
+        stats.age.observe(max(0.0, (discord.utils.utcnow() - created_at).total_seconds()))
+
+    response = interaction.response
+    timer = _AckTimer(response)
+    _swap_response(interaction, timer)
+    # Log records made while handling carry the interaction's fields
+    context = log_context.set(interaction_fields(interaction, label))
+    failed = False
+    try:
+        return await call()
+    except Exception:
+        stats.errors += 1
+        failed = True
+        raise
+    finally:
+        _swap_response(interaction, response)
+        duration = time.perf_counter() - started
+        stats.duration.observe(duration)
+        if timer.acked_at is not None:
+            stats.ack.observe(timer.acked_at - started)
+        if interaction_log.isEnabledFor(logging.INFO):
+            interaction_log.info(
+                "handled", extra={
+                    "duration_ms": round(duration * 1000, 3),
+                    "ack_ms": None if timer.acked_at is None else round((timer.acked_at - started) * 1000, 3),
+                    "failed": failed,
+                }
+            )
+        log_context.reset(context)
+        if registry.on_first_handled is not None:
+            first, registry.on_first_handled = registry.on_first_handled, None
+            first(label, time.perf_counter() - started)
+
+
+def instrument(label: str = None):
+    """Decorator for handlers that take an `interaction` argument."""
+    def decorator(func):
+        name = label or func.__qualname__
+        position = list(inspect.signature(func).parameters).index("interaction")
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            interaction = kwargs["interaction"] if "interaction" in kwargs else args[position]
+            return await observe(name, interaction, lambda: func(*args, **kwargs))
+        return wrapper
+    return decorator
+
+
+# --- export ---
+
+def _fmt(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _histogram_lines(name, help_text, series, key="handler"):
+    yield f"# HELP {name} {help_text}"
+    yield f"# TYPE {name} histogram"
+    for label, hist in series:
+        cumulative = 0
+        for bound, n in zip(hist.bounds + (float("inf"),), hist.counts):
+            cumulative += n
+            yield f'{name}_bucket{{{key}="{label}",le="{_fmt(bound)}"}} {cumulative}'
+        yield f'{name}_sum{{{key}="{label}"}} {_fmt(hist.sum)}'
+        yield f'{name}_count{{{key}="{label}"}} {hist.count}'
+
+
+def render_prometheus(reg: Registry = registry) -> str:
+    handlers = sorted((_escape(label), stats) for label, stats in reg.handlers.items())
+    lines = [
+        "# HELP market_handler_calls_total Interactions handled.",
+        "# TYPE market_handler_calls_total counter",
+    ]
+    lines += [f'market_handler_calls_total{{handler="{label}"}} {s.calls}' for label, s in handlers]
+    lines += [
+        "# HELP market_handler_errors_total Handlers that raised.",
+        "# TYPE market_handler_errors_total counter",
+    ]
+    lines += [f'market_handler_errors_total{{handler="{label}"}} {s.errors}' for label, s in handlers]
+    lines += _histogram_lines(
+        "market_handler_duration_seconds", "Time spent in the handler.",
+        [(label, s.duration) for label, s in handlers])
+    lines += _histogram_lines(
+        "market_time_to_ack_seconds", "Handler start until the interaction was acknowledged.",
+        [(label, s.ack) for label, s in handlers])
+    lines += _histogram_lines(
+        "market_interaction_age_seconds", "Interaction age when the handler started.",
+        [(label, s.age) for label, s in handlers])
+
+    jobs = sorted((_escape(kind), stats) for kind, stats in reg.jobs.items())
+    lines += [
+        "# HELP market_job_runs_total Background jobs run.",
+        "# TYPE market_job_runs_total counter",
+    ]
+    lines += [f'market_job_runs_total{{kind="{kind}"}} {s.runs}' for kind, s in jobs]
+    lines += [
+        "# HELP market_job_errors_total Background jobs that raised.",
+        "# TYPE market_job_errors_total counter",
+    ]
+    lines += [f'market_job_errors_total{{kind="{kind}"}} {s.errors}' for kind, s in jobs]
+    lines += _histogram_lines(
+        "market_job_duration_seconds", "Time spent running the job.",
+        [(kind, s.duration) for kind, s in jobs], key="kind")
+    lines += _histogram_lines(
+        "market_job_wait_seconds", "Time the job waited in the queue.",
+        [(kind, s.wait) for kind, s in jobs], key="kind")
+
+    for name, (help_text, read) in sorted(reg.gauges.items()):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} gauge")
+        value = read()
+        if isinstance(value, dict):
+            for labels, v in value.items():
+                pairs = ",".join(f'{k}="{_escape(str(val))}"' for k, val in labels)
+                lines.append(f"{name}{{{pairs}}} {_fmt(v)}")
+        else:
+            lines.append(f"{name} {_fmt(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def summary(reg: Registry = registry, limit: int = 15) -> str:
+    """Short plain-text table for /stats, busiest handlers first."""
+    if not reg.handlers:
+        return "No interactions recorded yet."
+    rows = sorted(reg.handlers.items(), key=lambda kv: kv[1].calls, reverse=True)[:limit]
+    uptime = max(1.0, time.time() - reg.started)
+    total = sum(s.calls for s in reg.handlers.values())
+    out = [f"{total} interactions, {total / uptime:.2f}/s since {int(uptime)}s ago", ""]
+    out.append(f"{'handler':<36}{'calls':>7}{'err':>5}{'ack p50':>9}{'ack p99':>9}{'run p99':>9}")
+    for label, s in rows:
+        out.append(
+            f"{label[:35]:<36}{s.calls:>7}{s.errors:>5}"
+            f"{s.ack.quantile(0.5) * 1000:>7.0f}ms{s.ack.quantile(0.99) * 1000:>7.0f}ms"
+            f"{s.duration.quantile(0.99) * 1000:>7.0f}ms"
+        )
+    return "\n".join(out)
+
+
+async def start_http_server(host: str, port: int, reg: Registry = registry):
+    """Serve /metrics in Prometheus text format. Returns the aiohttp runner."""
+    from aiohttp import web
+
+    async def handle(request):
+        return web.Response(
+            body=render_prometheus(reg).encode(),
+            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+        )
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
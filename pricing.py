@@ -0,0 +1,404 @@
+# pricing.py
+# Discounts: quantity tiers, bundles and time-limited promotions.
+#
+# Rules are read from a JSON file (PRICING_RULES) and compiled into a
+# PricingPlan for each catalog version: every item gets the tuple of line
+# rules and bundles that can apply to it, with category rules merged in and
+# rules naming unknown items or categories dropped. Quoting a cart then walks
+# its lines once and only evaluates the rules indexed under them, so the cost
+# is O(lines + applicable rules) however many rules are configured.
+#
+#   {"rules": [
+#     {"id": "bulk-ammo", "type": "tiers", "categories": ["Guns"],
+#      "tiers": [{"min": 10, "percent_off": 5}, {"min": 50, "percent_off": 10}]},
+#     {"id": "heist-kit", "type": "bundle", "label": "Heist kit",
+#      "requires": [{"category": "Heist Pack", "quantity": 1}, {"item": "ammo-pistol", "quantity": 2}],
+#      "percent_off": 15},
+#     {"id": "halloween", "type": "promo", "items": ["pallet-coke"], "percent_off": 20,
+#      "starts": "2026-10-25T00:00:00+00:00", "ends": "2026-11-01T00:00:00+00:00"}
+#   ]}
+#
+# Tiers and promos are line rules: a line gets the single best one that is
+# active (a promo is a one-tier rule). Bundles take complete sets of units out
+# of the cart, in the order they are listed, and discount those units on top
+# of their line discount. Any rule can have a "starts"/"ends" window (ISO 8601
+# or Unix time). Quotes are memoized by cart version and kept until the next
+# window boundary of a rule they looked at.
+import asyncio
+import bisect
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from catalog import catalog_version
+
+log = logging.getLogger(__name__)
+
+RULE_TYPES = ("tiers", "promo", "bundle")
+# Labels end up as cart lines; keep them short
+LABEL_LIMIT = 80
+
+
+def _percent(value, rule_id) -> int:
+    # Kept as basis points so discounts stay in integer cents
+    if not isinstance(value, (int, float)) or not 0 < value <= 100:
+        raise ValueError(f"Rule {rule_id!r}: percent_off must be above 0 and at most 100")
+    return int(round(value * 100))
+
+
+def _timestamp(value, rule_id):
+    if value is None or isinstance(value, (int, float)):
+        return value
+    try:
+        moment = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Rule {rule_id!r}: can't read time {value!r}") from None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
+
+
+def _quantity(value, rule_id) -> int:
+    if not isinstance(value, int) or value < 1:
+        raise ValueError(f"Rule {rule_id!r}: quantities must be whole numbers of at least 1")
+    return value
+
+
+class _Rule:
+    def __init__(self, raw: dict, order: int):
+        self.id = raw["id"]
+        self.label = str(raw.get("label") or self.id)[:LABEL_LIMIT]
+        self.order = order
+        self.starts = _timestamp(raw.get("starts"), self.id)
+        self.ends = _timestamp(raw.get("ends"), self.id)
+        if self.starts is not None and self.ends is not None and self.ends <= self.starts:
+            raise ValueError(f"Rule {self.id!r} ends before it starts")
+
+    def active(self, now: float) -> bool:
+        return (self.starts is None or self.starts <= now) and (self.ends is None or now < self.ends)
+
+    def next_change(self, now: float):
+        """When active() next changes after now, or None if it never does."""
+        if self.starts is not None and now < self.starts:
+            return self.starts
+        if self.ends is not None and now < self.ends:
+            return self.ends
+        return None
+
+
+class LineRule(_Rule):
+    """Percent off a line by its quantity. A promo is a single tier from 1 unit."""
+
+    def __init__(self, raw: dict, order: int):
+        super().__init__(raw, order)
+        self.items = tuple(raw.get("items") or ())
+        self.categories = tuple(raw.get("categories") or ())
+        if not self.items and not self.categories:
+            raise ValueError(f"Rule {self.id!r} applies to no items or categories")
+        if raw["type"] == "promo":
+            tiers = [(1, _percent(raw.get("percent_off"), self.id))]
+        else:
+            tiers = sorted(
+                (_quantity(tier.get("min"), self.id), _percent(tier.get("percent_off"), self.id))
+                for tier in raw.get("tiers") or ()
+            )
+            if not tiers:
+                raise ValueError(f"Rule {self.id!r} has no tiers")
+        self.mins = tuple(minimum for minimum, _ in tiers)
+        self.bps = tuple(bps for _, bps in tiers)
+
+    def discount_bps(self, quantity: int) -> int:
+        i = bisect.bisect_right(self.mins, quantity) - 1
+        return self.bps[i] if i >= 0 else 0
+
+
+class Bundle(_Rule):
+    """Percent off every complete set of the required units."""
+
+    def __init__(self, raw: dict, order: int):
+        super().__init__(raw, order)
+        requires = []
+        for requirement in raw.get("requires") or ():
+            kind = "item" if "item" in requirement else "category"
+            requires.append((kind, requirement[kind], _quantity(requirement.get("quantity", 1), self.id)))
+        if not requires:
+            raise ValueError(f"Bundle {self.id!r} requires nothing")
+        if len({(kind, key) for kind, key, _ in requires}) != len(requires):
+            raise ValueError(f"Bundle {self.id!r} lists a requirement twice")
+        # (kind, item id or category, units per set)
+        self.requires = tuple(requires)
+        self.bps = _percent(raw.get("percent_off"), self.id)
+
+
+def parse_rules(data: dict) -> tuple:
+    """Rule objects from the rules file's contents; ValueError if one is malformed."""
+    rules = []
+    seen = set()
+    for order, raw in enumerate(data.get("rules") or ()):
+        rule_id = raw.get("id")
+        if not rule_id or rule_id in seen:
+            raise ValueError(f"Rule ids must be present and unique (got {rule_id!r})")
+        seen.add(rule_id)
+        kind = raw.get("type")
+        if kind not in RULE_TYPES:
+            raise ValueError(f"Rule {rule_id!r} has unknown type {kind!r}")
+        rules.append(Bundle(raw, order) if kind == "bundle" else LineRule(raw, order))
+    return tuple(rules)
+
+
+def _matching(kind, key, lines_by_id, lines_by_category):
+    # Cart lines a bundle requirement can take units from
+    if kind == "item":
+        line = lines_by_id.get(key)
+        return () if line is None else (line,)
+    return lines_by_category.get(key, ())
+
+
+class Quote:
+    __slots__ = ("subtotal_cents", "discount_cents", "total_cents", "adjustments", "line_discounts", "valid_until")
+
+    def __init__(self, subtotal_cents: int, adjustments: dict = None, line_discounts: dict = None,
+                 valid_until: float = None):
+        self.subtotal_cents = subtotal_cents
+        # (label, cents) for each rule that took something off, in the order they applied
+        self.adjustments = tuple((adjustments or {}).items())
+        # item id -> cents taken off that line
+        self.line_discounts = line_discounts or {}
+        self.discount_cents = min(subtotal_cents, sum(cents for _, cents in self.adjustments))
+        self.total_cents = subtotal_cents - self.discount_cents
+        # The quote is good until this (Unix) time, when a rule it looked at
+        # starts or ends; None means for as long as the cart is unchanged
+        self.valid_until = valid_until
+
+
+class PricingPlan:
+    """The rules compiled against one catalog version."""
+
+    def __init__(self, catalog, rules: tuple, rules_version: str):
+        self.version = f"{catalog.version}:{rules_version}"
+        self.empty = not rules
+        line_by_item, line_by_category = {}, {}
+        bundle_by_item, bundle_by_category = {}, {}
+        for rule in rules:
+            if isinstance(rule, Bundle):
+                targets = [(kind, key) for kind, key, _ in rule.requires]
+                if not all(self._known(catalog, rule, kind, key) for kind, key in targets):
+                    continue
+                # An item counted both on its own and through its category
+                # would be promised to two requirements
+                categories = {key for kind, key in targets if kind == "category"}
+                if any(kind == "item" and catalog.item(key)["category"] in categories for kind, key in targets):
+                    log.warning("Pricing rule %s requires an item and its own category; skipped", rule.id)
+                    continue
+                by_item, by_category = bundle_by_item, bundle_by_category
+            else:
+                targets = [("item", key) for key in rule.items]
+                targets += [("category", key) for key in rule.categories]
+                targets = [(kind, key) for kind, key in targets if self._known(catalog, rule, kind, key)]
+                by_item, by_category = line_by_item, line_by_category
+            for kind, key in targets:
+                (by_item if kind == "item" else by_category).setdefault(key, []).append(rule)
+
+        # Everything that can apply to each item, in rule order. Carts can hold
+        # items from another catalog (a different guild's, or one since
+        # reloaded); those are matched by category alone.
+        self._line_rules, self._bundles = {}, {}
+        for category in catalog.categories:
+            for item in catalog.items_in(category):
+                item_id = item["id"]
+                for merged, by_item, by_category in (
+                    (self._line_rules, line_by_item, line_by_category),
+                    (self._bundles, bundle_by_item, bundle_by_category),
+                ):
+                    found = by_item.get(item_id, []) + by_category.get(category, [])
+                    if found:
+                        merged[item_id] = tuple(sorted(found, key=lambda rule: rule.order))
+        self._category_line_rules = {key: tuple(found) for key, found in line_by_category.items()}
+        self._category_bundles = {key: tuple(found) for key, found in bundle_by_category.items()}
+
+    @staticmethod
+    def _known(catalog, rule, kind, key) -> bool:
+        known = key in catalog if kind == "item" else catalog.category(key) is not None
+        if not known:
+            log.warning("Pricing rule %s names unknown %s %r; ignored for catalog %s", rule.id, kind, key, catalog.version)
+        return known
+
+    def quote(self, cart, now: float) -> Quote:
+        subtotal = 0
+        adjustments = {}
+        rule_discounts = {}
+        line_discounts = {}
+        changes = []
+        lines_by_id = {}
+        lines_by_category = {}
+        bundles = {}
+        for line in cart:
+            item_id, category = line.item_id, line.category
+            subtotal += line.subtotal_cents
+            lines_by_id[item_id] = line
+            lines_by_category.setdefault(category, []).append(line)
+            best, best_bps = None, 0
+            for rule in self._line_rules.get(item_id) or self._category_line_rules.get(category, ()):
+                changes.append(rule.next_change(now))
+                if rule.active(now):
+                    bps = rule.discount_bps(line.quantity)
+                    if bps > best_bps:
+                        best, best_bps = rule, bps
+            if best is not None:
+                cents = line.subtotal_cents * best_bps // 10000
+                if cents:
+                    rule_discounts[item_id] = line_discounts[item_id] = cents
+                    adjustments[best.label] = adjustments.get(best.label, 0) + cents
+            for bundle in self._bundles.get(item_id) or self._category_bundles.get(category, ()):
+                bundles[bundle] = None
+
+        used = {}
+        for bundle in sorted(bundles, key=lambda rule: rule.order):
+            changes.append(bundle.next_change(now))
+            if not bundle.active(now):
+                continue
+            sets = None
+            for kind, key, quantity in bundle.requires:
+                free = sum(line.quantity - used.get(line.item_id, 0)
+                           for line in _matching(kind, key, lines_by_id, lines_by_category))
+                sets = free // quantity if sets is None else min(sets, free // quantity)
+                if not sets:
+                    break
+            if not sets:
+                continue
+            cents = 0
+            for kind, key, quantity in bundle.requires:
+                needed = sets * quantity
+                for line in _matching(kind, key, lines_by_id, lines_by_category):
+                    item_id = line.item_id
+                    take = min(needed, line.quantity - used.get(item_id, 0))
+                    if take <= 0:
+                        continue
+                    used[item_id] = used.get(item_id, 0) + take
+                    # The bundle discounts what's left after the line's own discount
+                    net = line.subtotal_cents - rule_discounts.get(item_id, 0)
+                    cut = net * take // line.quantity * bundle.bps // 10000
+                    line_discounts[item_id] = line_discounts.get(item_id, 0) + cut
+                    cents += cut
+                    needed -= take
+                    if not needed:
+                        break
+            if cents:
+                adjustments[bundle.label] = adjustments.get(bundle.label, 0) + cents
+
+        changes = [change for change in changes if change is not None]
+        return Quote(subtotal, adjustments, line_discounts, min(changes) if changes else None)
+
+
+def read_rules(path: str = None):
+    """(rules, rules version) from the rules file; ValueError if a rule is
+    malformed. No file means no rules."""
+    data = {}
+    if path and os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+    return parse_rules(data), catalog_version(data)
+
+
+class Pricing:
+    """Pricing rules from a file, compiled per catalog version, with quotes
+    memoized per cart version. The bot reads the file at startup (warm());
+    anything else that quotes without doing so reads it on first use. No
+    file means no discounts."""
+
+    def __init__(self, path: str = None, max_quotes: int = 10000, max_plans: int = 64, clock=time.time):
+        self.path = path
+        self.max_quotes = max_quotes
+        self.max_plans = max_plans
+        self._clock = clock
+        self._rules = None
+        self._rules_version = None
+        # catalog version -> PricingPlan; one per guild catalog in use
+        self._plans = OrderedDict()
+        # (cart version, plan version) -> Quote
+        self._quotes = OrderedDict()
+        self.compiles = 0
+        self.hits = 0
+        self.misses = 0
+        self.reload_errors = 0
+
+    def load(self, data: dict = None):
+        """Read (or take) the rules and drop every compiled plan and quote.
+        Raises if the rules are malformed, leaving the current ones in place."""
+        if data is None:
+            rules, version = read_rules(self.path)
+        else:
+            rules, version = parse_rules(data), catalog_version(data)
+        return self._use(rules, version)
+
+    def _use(self, rules, version):
+        self._rules = rules
+        self._rules_version = version
+        self._plans.clear()
+        self._quotes.clear()
+        log.info("Loaded %d pricing rules", len(rules))
+        return rules
+
+    async def warm(self):
+        """Read the file in a worker thread. Raises if it is malformed, so a
+        bad file stops startup instead of every quote."""
+        self._use(*await asyncio.to_thread(read_rules, self.path))
+
+    async def reload(self) -> bool:
+        """Read the file again. A malformed file is logged and the last good
+        rules (and their compiled plans) stay in use; returns False."""
+        try:
+            rules, version = await asyncio.to_thread(read_rules, self.path)
+        except Exception:
+            self.reload_errors += 1
+            log.exception("Pricing rules reload from %s failed; keeping the current rules", self.path)
+            return False
+        self._use(rules, version)
+        return True
+
+    def plan(self, catalog) -> PricingPlan:
+        if self._rules is None:
+            self.load()
+        plan = self._plans.get(catalog.version)
+        if plan is None:
+            plan = self._plans[catalog.version] = PricingPlan(catalog, self._rules, self._rules_version)
+            self.compiles += 1
+            if len(self._plans) > self.max_plans:
+                self._plans.popitem(last=False)
+        else:
+            self._plans.move_to_end(catalog.version)
+        return plan
+
+    def quote(self, cart, catalog, now: float = None) -> Quote:
+        """The cart's prices under the rules, as compiled for `catalog` (the
+        one the shopper is browsing)."""
+        plan = self.plan(catalog)
+        if plan.empty:
+            return Quote(cart.total_cents)
+        now = self._clock() if now is None else now
+        key = (cart.version, plan.version)
+        quote = self._quotes.get(key)
+        if quote is not None and (quote.valid_until is None or now < quote.valid_until):
+            self.hits += 1
+            self._quotes.move_to_end(key)
+            return quote
+        self.misses += 1
+        quote = self._quotes[key] = plan.quote(cart, now)
+        self._quotes.move_to_end(key)
+        if len(self._quotes) > self.max_quotes:
+            self._quotes.popitem(last=False)
+        return quote
+
+    def stats(self) -> dict:
+        return {
+            "rules": len(self._rules or ()),
+            "plans": len(self._plans),
+            "compiles": self.compiles,
+            "quotes": len(self._quotes),
+            "hits": self.hits,
+            "misses": self.misses,
+            "reload_errors": self.reload_errors,
+        }
@@ -0,0 +1,197 @@
+# ratelimit.py
+# Admission control for interactions: token buckets and duplicate suppression.
+#
+# Every command, component click and modal submit passes through
+# InteractionGate.admit() before its handler runs. It drops interactions it
+# has already seen (the same interaction id delivered twice, or the same
+# button, select choice, modal input or command options submitted again within
+# `repeat_window` seconds), then takes a token from the user's bucket, the guild's bucket and
+# the global bucket. The global bucket stands in for the Discord HTTP budget
+# every reply spends. A rejection is one ephemeral message (a repeated click
+# is just acknowledged), so a spammer costs one cheap response and no views
+# or embeds.
+import time
+from collections import OrderedDict
+
+import discord
+
+from locks import IdempotencyCache
+
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, tokens: float, now: float):
+        self.tokens = tokens
+        self.updated = now
+
+
+class BucketLimiter:
+    """Token buckets for one scope, keyed by user id, guild id or a single
+    global key. `rate` tokens per second refill up to `burst`; rate 0 turns
+    the scope off."""
+
+    def __init__(self, scope: str, rate: float, burst: int, max_keys: int = 50000, clock=time.monotonic):
+        self.scope = scope
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._clock = clock
+        # Least recently used first; a bucket idle for burst / rate seconds is
+        # full again, so dropping it changes nothing
+        self._buckets = OrderedDict()
+        self.allowed = 0
+        self.denied = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def _refill(self, key, now):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(self.burst, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated) * self.rate)
+            bucket.updated = now
+            self._buckets.move_to_end(key)
+        return bucket
+
+    def retry_after(self, key, now: float = None) -> float:
+        """Seconds until the key has a token (0 if it has one now)."""
+        if not self.enabled or key is None:
+            return 0.0
+        bucket = self._refill(key, self._clock() if now is None else now)
+        return 0.0 if bucket.tokens >= 1 else (1 - bucket.tokens) / self.rate
+
+    def take(self, key, now: float = None):
+        if self.enabled and key is not None:
+            self._refill(key, self._clock() if now is None else now).tokens -= 1
+            self.allowed += 1
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class RateLimiter:
+    """User, guild and global buckets. A token is taken from all three or none."""
+
+    def __init__(self, user=(1.0, 5), guild=(20.0, 60), global_=(40.0, 50), clock=time.monotonic):
+        self._clock = clock
+        self.scopes = (
+            BucketLimiter("user", *user, clock=clock),
+            BucketLimiter("guild", *guild, clock=clock),
+            BucketLimiter("global", *global_, clock=clock),
+        )
+
+    def check(self, user_id: int, guild_id: int = None):
+        """Take a token for the interaction. Returns None when allowed, or
+        (scope, seconds to wait) for the first scope that is out of tokens."""
+        now = self._clock()
+        keys = (user_id, guild_id, "global")
+        # The user's own bucket is checked first, so a spammer is turned away
+        # before they can drain the guild and global budgets
+        for limiter, key in zip(self.scopes, keys):
+            wait = limiter.retry_after(key, now)
+            if wait:
+                limiter.denied += 1
+                return limiter.scope, wait
+        for limiter, key in zip(self.scopes, keys):
+            limiter.take(key, now)
+        return None
+
+    def stats(self) -> dict:
+        return {
+            limiter.scope: {"allowed": limiter.allowed, "denied": limiter.denied, "buckets": len(limiter)}
+            for limiter in self.scopes
+        }
+
+
+DENIED = {
+    "user": "⏳ You're going too fast. Try again in {wait:.0f}s.",
+    "guild": "⏳ The market is busy in this server. Try again in {wait:.0f}s.",
+    "global": "⏳ The market is busy right now. Try again in {wait:.0f}s.",
+}
+
+
+def _options(options) -> tuple:
+    """Slash command options as nested (name, value) pairs; a subcommand's
+    value is its own options."""
+    return tuple(
+        (option.get("name"), _options(option["options"]) if "options" in option else option.get("value"))
+        for option in options
+    )
+
+
+def _fields(rows) -> tuple:
+    """Modal text inputs as (custom_id, value) pairs."""
+    return tuple(
+        (field.get("custom_id"), field.get("value"))
+        for row in rows
+        for field in row.get("components", ())
+    )
+
+
+def repeat_key(interaction):
+    """What makes two interactions the same request: the user plus the
+    component (with its selected values), modal (with what was typed) or
+    command (with its options)."""
+    data = interaction.data or {}
+    target = data.get("custom_id") or data.get("name")
+    if target is None:
+        return None
+    return (
+        interaction.user.id,
+        target,
+        tuple(data.get("values", ())),
+        _options(data.get("options", ())),
+        _fields(data.get("components", ())),
+    )
+
+
+class InteractionGate:
+    def __init__(self, limiter: RateLimiter, repeat_window: float = 1.0, seen_ttl: float = 60.0, clock=time.monotonic):
+        self.limiter = limiter
+        self._seen = IdempotencyCache(ttl=seen_ttl, max_size=50000, clock=clock)
+        self._repeats = IdempotencyCache(ttl=repeat_window, max_size=50000, clock=clock)
+        # Dropped interactions by reason
+        self.duplicates = {"interaction": 0, "repeat": 0}
+
+    async def admit(self, interaction) -> bool:
+        """True if the interaction's handler should run. Otherwise it has
+        been answered (or is a redelivery that needs no answer)."""
+        # Autocomplete can't be answered with a message and costs no message
+        # to serve; let it through
+        if getattr(interaction, "type", None) == discord.InteractionType.autocomplete:
+            return True
+        if self._seen.get(interaction.id) is not None:
+            self.duplicates["interaction"] += 1
+            return False
+        self._seen.put(interaction.id, True)
+
+        key = repeat_key(interaction)
+        if key is not None:
+            if self._repeats.get(key) is not None:
+                self.duplicates["repeat"] += 1
+                await self._reject(interaction, "⏳ Already working on that.", quiet=True)
+                return False
+            self._repeats.put(key, True)
+
+        denied = self.limiter.check(interaction.user.id, interaction.guild_id)
+        if denied is not None:
+            scope, wait = denied
+            await self._reject(interaction, DENIED[scope].format(wait=max(1.0, wait)))
+            return False
+        return True
+
+    async def _reject(self, interaction, message: str, quiet: bool = False):
+        if interaction.response.is_done():
+            return
+        if quiet and getattr(interaction, "type", None) != discord.InteractionType.application_command:
+            # A repeated click only needs acknowledging; the first one is
+            # already updating the message
+            await interaction.response.defer()
+        else:
+            await interaction.response.send_message(message, ephemeral=True)
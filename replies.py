@@ -0,0 +1,32 @@
+# replies.py
+# Replying to an interaction whether or not it was deferred.
+#
+# Handlers that do slow work acknowledge first (routes registered with
+# defer=True are deferred before the handler runs) and finish through the
+# original response or followups. These helpers pick the right call, so a
+# handler reads the same either way.
+import discord
+
+
+async def defer(interaction: discord.Interaction, **kwargs):
+    if not interaction.response.is_done():
+        await interaction.response.defer(**kwargs)
+
+
+async def edit(interaction: discord.Interaction, **kwargs):
+    """Edit the message the interaction came from."""
+    if interaction.response.is_done():
+        await interaction.edit_original_response(**kwargs)
+    else:
+        await interaction.response.edit_message(**kwargs)
+
+
+async def send(interaction: discord.Interaction, content: str = None, **kwargs):
+    """Send a new message in reply to the interaction."""
+    if interaction.response.is_done():
+        # Followups have no "no view" value; leave it out instead
+        if kwargs.get("view", discord.utils.MISSING) is None:
+            del kwargs["view"]
+        await interaction.followup.send(content, **kwargs)
+    else:
+        await interaction.response.send_message(content, **kwargs)
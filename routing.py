@@ -0,0 +1,101 @@
+# routing.py
+# Stateless component routing.
+#
+# Every market button and select carries its state in its custom_id
+# ("mkt:<action>:<user id>[:<arg>]"). A single dynamic item class is registered
+# with the bot once; when a component is clicked it decodes the custom_id and
+# hands the interaction to the handler registered for that action. No View
+# object or timeout task is kept per message, and buttons keep working after a
+# restart or on another process.
+import discord
+
+import metrics
+
+PREFIX = "mkt"
+CUSTOM_ID_LIMIT = 100
+
+# action -> (handler, message shown to anyone but the owner, defer first)
+_routes = {}
+
+# Optional async check run before every route, e.g. rate limiting:
+# gate(interaction) -> bool. When it returns False the gate has answered.
+gate = None
+
+
+def route(action: str, denied: str = "This market is not for you!", defer: bool = False):
+    """Register a handler for an action. Handlers are called as
+    handler(interaction, component) with the decoded MarketComponent.
+
+    With defer=True the interaction is acknowledged before the handler runs,
+    and the handler replies through the helpers in replies.py.
+    """
+    def decorator(func):
+        if action in _routes:
+            raise ValueError(f"Duplicate route {action!r}")
+        _routes[action] = (func, denied, defer)
+        return func
+    return decorator
+
+
+def handler_for(action: str):
+    entry = _routes.get(action)
+    return entry[0] if entry else None
+
+
+def encode(action: str, user_id: int, arg: str = None) -> str:
+    custom_id = f"{PREFIX}:{action}:{user_id}" if arg is None else f"{PREFIX}:{action}:{user_id}:{arg}"
+    if len(custom_id) > CUSTOM_ID_LIMIT:
+        raise ValueError(f"custom_id too long: {custom_id!r}")
+    return custom_id
+
+
+class MarketComponent(
+    discord.ui.DynamicItem[discord.ui.Item],
+    template=rf"{PREFIX}:(?P<action>[a-z_]+):(?P<user_id>[0-9]+)(?::(?P<arg>.+))?",
+):
+    def __init__(self, item, action: str, user_id: int, arg: str = None):
+        super().__init__(item)
+        self.action = action
+        self.user_id = user_id
+        self.arg = arg
+
+    @classmethod
+    async def from_custom_id(cls, interaction, item, match, /):
+        return cls(item, match["action"], int(match["user_id"]), match["arg"])
+
+    @property
+    def values(self):
+        # Selected values when the wrapped component is a select
+        return getattr(self.item, "values", [])
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        entry = _routes.get(self.action)
+        if entry is None:
+            return False
+        if gate is not None and not await gate(interaction):
+            return False
+        if interaction.user.id != self.user_id:
+            await interaction.response.send_message(entry[1], ephemeral=True)
+            return False
+        return True
+
+    async def callback(self, interaction: discord.Interaction):
+        handler, _, defer = _routes[self.action]
+
+        async def run():
+            if defer:
+                await interaction.response.defer()
+            await handler(interaction, self)
+
+        # Labelled by the handler's qualified name, e.g. ItemSelectionView.view_cart
+        await metrics.observe(handler.__qualname__, interaction, run)
+
+
+def button(action: str, user_id: int, arg: str = None, **kwargs) -> MarketComponent:
+    item = discord.ui.Button(custom_id=encode(action, user_id, arg), **kwargs)
+    return MarketComponent(item, action, user_id, arg)
+
+
+def select(action: str, user_id: int, arg: str = None, **kwargs) -> MarketComponent:
+    item = discord.ui.Select(custom_id=encode(action, user_id, arg), **kwargs)
+    return MarketComponent(item, action, user_id, arg)
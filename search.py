@@ -0,0 +1,122 @@
+# search.py
+# In-memory item search for slash command autocomplete.
+#
+# Built once per catalog version. Short queries use a sorted prefix index over
+# item names and the words in them (a bisect per lookup); longer queries are
+# scored by shared trigrams over name and description, which also tolerates
+# typos and matches in the middle of words.
+from bisect import bisect_left
+from itertools import islice
+
+
+def _trigrams(text: str):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _inner_trigrams(text: str):
+    # Without the padding, which matches the start or end of any word
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _all_items(catalog):
+    for category in catalog.categories:
+        yield from catalog.items_in(category)
+
+
+class SearchIndex:
+    def __init__(self, catalog, items=None):
+        """Index `items` (by default every item in the catalog); results are
+        looked up in the catalog."""
+        self.catalog = catalog
+        keys = []
+        trigrams = {}
+        self._names = {}
+        for item in _all_items(catalog) if items is None else items:
+            item_id = item["id"]
+            name = item["name"].casefold()
+            self._names[item_id] = name
+            keys.append((name, item_id))
+            for word in name.split()[1:]:
+                keys.append((word, item_id))
+            text = f"{name} {item['description'].casefold()}"
+            for gram in _trigrams(text):
+                trigrams.setdefault(gram, []).append(item_id)
+        keys.sort()
+        self._prefix_keys = [key for key, _ in keys]
+        self._prefix_ids = [item_id for _, item_id in keys]
+        self._trigrams = {gram: tuple(ids) for gram, ids in trigrams.items()}
+
+    def _prefix(self, query: str, limit: int):
+        found = []
+        seen = set()
+        i = bisect_left(self._prefix_keys, query)
+        while i < len(self._prefix_keys) and self._prefix_keys[i].startswith(query):
+            item_id = self._prefix_ids[i]
+            if item_id not in seen:
+                seen.add(item_id)
+                found.append(item_id)
+                if len(found) >= limit:
+                    break
+            i += 1
+        return found
+
+    def search(self, query: str, limit: int = 25):
+        """Item entries best matching query, at most `limit`."""
+        query = query.casefold().strip()
+        if not query:
+            ids = list(islice(self._names, limit))
+        else:
+            ids = self._prefix(query, limit)
+            if len(ids) < limit and len(query) >= 3:
+                scores = {}
+                inner_scores = {}
+                grams = _trigrams(query)
+                inner = _inner_trigrams(query)
+                for gram in grams:
+                    is_inner = gram in inner
+                    for item_id in self._trigrams.get(gram, ()):
+                        scores[item_id] = scores.get(item_id, 0) + 1
+                        if is_inner:
+                            inner_scores[item_id] = inner_scores.get(item_id, 0) + 1
+                # Need at least half the query's trigrams to count as a match,
+                # and half its own trigrams (rounded up) without the padding,
+                # which matches the start or end of any word
+                needed = max(1, len(grams) // 2)
+                needed_inner = (len(inner) + 1) // 2
+                ranked = sorted(
+                    (
+                        item_id for item_id, score in scores.items()
+                        if score >= needed and inner_scores.get(item_id, 0) >= needed_inner
+                    ),
+                    key=lambda item_id: (-scores[item_id], self._names[item_id]),
+                )
+                seen = set(ids)
+                for item_id in ranked:
+                    if item_id not in seen:
+                        ids.append(item_id)
+                        if len(ids) >= limit:
+                            break
+        return [self.catalog.item(item_id) for item_id in ids]
+
+
+class OverlaySearch:
+    """Search for a guild catalog: the base index, skipping items the guild
+    changed or removed, plus a small index of the guild's own entries."""
+
+    def __init__(self, base: SearchIndex, catalog):
+        self.base = base
+        self.catalog = catalog
+        self._overrides = catalog.overrides
+        self._own = SearchIndex(catalog, [item for item in self._overrides.values() if item is not None])
+
+    def search(self, query: str, limit: int = 25):
+        found = self._own.search(query, limit)
+        if len(found) < limit:
+            # Ask for enough extra that skipped base items can't starve the result
+            for item in self.base.search(query, limit + len(self._overrides)):
+                if item["id"] not in self._overrides:
+                    found.append(item)
+                    if len(found) >= limit:
+                        break
+        return found
@@ -0,0 +1,103 @@
+# sessions.py
+# Bounded store for open shopping carts. Carts are evicted when the store is
+# full (least recently used first) or when they sit idle past a TTL, so memory
+# follows the number of active shoppers instead of everyone who ever shopped.
+import sys
+import time
+from collections import OrderedDict
+
+from cart import Cart
+
+
+class SessionStore:
+    def __init__(self, max_size: int = 10000, idle_ttl: float = 1800.0, clock=time.monotonic):
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1")
+        self.max_size = max_size
+        self.idle_ttl = idle_ttl
+        self._clock = clock
+        # user id -> (cart, last access); ordered oldest access first
+        self._sessions = OrderedDict()
+        self.evicted_lru = 0
+        self.evicted_idle = 0
+        self.released = 0
+
+    def get(self, user_id: int):
+        """Return the user's cart, or None if they have no open session."""
+        self._expire()
+        entry = self._sessions.get(user_id)
+        if entry is None:
+            return None
+        self._touch(user_id, entry[0])
+        return entry[0]
+
+    def get_or_create(self, user_id: int) -> Cart:
+        cart = self.get(user_id)
+        if cart is None:
+            cart = self.put(user_id, Cart())
+        return cart
+
+    def put(self, user_id: int, cart: Cart) -> Cart:
+        self._touch(user_id, cart)
+        while len(self._sessions) > self.max_size:
+            self._sessions.popitem(last=False)
+            self.evicted_lru += 1
+        return cart
+
+    def discard(self, user_id: int):
+        return self._sessions.pop(user_id, (None, 0))[0]
+
+    def release(self, user_id: int):
+        # Called when one of the user's views times out. Empty carts are
+        # dropped straight away; carts with items stay until the idle TTL
+        # runs out so the user can pick them up again with /market.
+        entry = self._sessions.get(user_id)
+        if entry is None:
+            return
+        cart, last_access = entry
+        if not cart or self._clock() - last_access >= self.idle_ttl:
+            del self._sessions[user_id]
+            self.released += 1
+
+    def _touch(self, user_id, cart):
+        self._sessions[user_id] = (cart, self._clock())
+        self._sessions.move_to_end(user_id)
+
+    def _expire(self):
+        # Sessions are ordered by last access, so only the head can be stale.
+        deadline = self._clock() - self.idle_ttl
+        while self._sessions:
+            user_id, (_, last_access) = next(iter(self._sessions.items()))
+            if last_access > deadline:
+                break
+            del self._sessions[user_id]
+            self.evicted_idle += 1
+
+    def user_ids(self) -> set:
+        """Users with a live session, without counting as an access."""
+        self._expire()
+        return set(self._sessions)
+
+    def bytes_held(self) -> int:
+        # Approximate: the catalog item dicts are shared and not counted.
+        total = sys.getsizeof(self._sessions)
+        for cart, _ in self._sessions.values():
+            total += sys.getsizeof(cart) + sys.getsizeof(cart._lines)
+            total += sum(sys.getsizeof(line) for line in cart)
+        return total
+
+    def stats(self) -> dict:
+        self._expire()
+        return {
+            "live_sessions": len(self._sessions),
+            "evicted_lru": self.evicted_lru,
+            "evicted_idle": self.evicted_idle,
+            "released": self.released,
+            "bytes_held": self.bytes_held(),
+        }
+
+    def __contains__(self, user_id):
+        return self.get(user_id) is not None
+
+    def __len__(self):
+        return len(self._sessions)
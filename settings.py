@@ -0,0 +1,108 @@
+# settings.py
+# Bot configuration, read from an environment mapping.
+#
+# Nothing reads the environment at import time: the entry point loads .env,
+# then builds Settings and hands it to the bot factory. That way the bot
+# module can be imported by tools and benchmarks without a token.
+import os
+
+from gateway import gateway_options
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def _flag(value: str) -> bool:
+    return value.lower() in ("1", "true", "yes")
+
+
+def _samples(value: str) -> dict:
+    # "logger=rate,logger=rate" -> {logger: rate}
+    samples = {}
+    for part in value.split(","):
+        name, _, rate = part.partition("=")
+        if name.strip():
+            samples[name.strip()] = float(rate)
+    return samples
+
+
+def _rate(value: str):
+    # "rate,burst": tokens per second and bucket size; a rate of 0 turns the limit off
+    rate, _, burst = value.partition(",")
+    rate = float(rate)
+    return rate, int(burst or max(1, rate))
+
+
+class Settings:
+    def __init__(self, env=None):
+        env = os.environ if env is None else env
+
+        self.token = env.get("DISCORD_TOKEN") or env.get("TOKEN")
+
+        # Logging runs on a background thread (see logs.py). LOG_FORMAT is json or
+        # text for stderr; LOG_FILE, if set, gets JSON lines rotated at
+        # LOG_FILE_MAX_BYTES. LOG_SAMPLE keeps a fraction of a logger's INFO/DEBUG
+        # records, e.g. "market.interaction=0.1,discord.gateway=0.5".
+        self.log_level = env.get("LOG_LEVEL", "INFO").upper()
+        self.log_format = env.get("LOG_FORMAT", "json")
+        if self.log_format not in ("json", "text"):
+            raise ValueError(f"Unknown LOG_FORMAT {self.log_format!r} (expected json or text)")
+        self.log_file = env.get("LOG_FILE") or None
+        self.log_file_max_bytes = int(env.get("LOG_FILE_MAX_BYTES", str(10 * 2**20)))
+        self.log_file_backups = int(env.get("LOG_FILE_BACKUPS", "5"))
+        self.log_sample = _samples(env.get("LOG_SAMPLE", "market.interaction=0.1"))
+        self.log_queue_size = int(env.get("LOG_QUEUE_SIZE", "10000"))
+
+        # Intents, caches and sharding (BOT_MODE=production trims them for large deployments)
+        self.gateway = gateway_options(env)
+
+        # Durable carts and order history
+        self.order_db_path = env.get("ORDER_DB_PATH", "market.db")
+
+        # Slash command sync: only when the tree changed since the last sync.
+        # SYNC_GUILD_IDS=1,2 syncs to those guilds only (instant updates while testing).
+        self.command_sync_state = env.get("COMMAND_SYNC_STATE", ".command_sync.json")
+        self.sync_guild_ids = [int(g) for g in env.get("SYNC_GUILD_IDS", "").replace(",", " ").split()]
+        self.force_command_sync = _flag(env.get("FORCE_COMMAND_SYNC", ""))
+
+        # Prometheus metrics endpoint (http://METRICS_HOST:METRICS_PORT/metrics), off when the port is 0
+        self.metrics_host = env.get("METRICS_HOST", "127.0.0.1")
+        self.metrics_port = int(env.get("METRICS_PORT", "0"))
+
+        # Market catalog, loaded from JSON and hot-reloaded when the file changes
+        self.catalog_path = env.get("CATALOG_PATH", os.path.join(_HERE, "catalog.json"))
+        self.catalog_poll_interval = float(env.get("CATALOG_POLL_INTERVAL", "5"))
+        # Optional per-guild overlays: {"guilds": {"<guild id>": <overlay>}} (see catalog.GuildCatalog)
+        self.catalog_overlays_path = env.get("CATALOG_OVERLAYS", os.path.join(_HERE, "catalog_overlays.json"))
+        # Optional discount rules: quantity tiers, bundles and promos (see pricing.py)
+        self.pricing_rules_path = env.get("PRICING_RULES", os.path.join(_HERE, "pricing_rules.json"))
+
+        # Open carts. CART_STORE=memory keeps them in this process (bounded and
+        # expiring, persisted to the order store); CART_STORE=remote shares them with
+        # other shard processes through a cart server at CART_STORE_HOST:CART_STORE_PORT.
+        self.cart_store = env.get("CART_STORE", "memory")
+        if self.cart_store not in ("memory", "remote"):
+            raise ValueError(f"Unknown CART_STORE {self.cart_store!r} (expected memory or remote)")
+        self.cart_max_sessions = int(env.get("CART_MAX_SESSIONS", "10000"))
+        self.cart_idle_ttl = float(env.get("CART_IDLE_TTL", "1800"))
+        self.cart_store_host = env.get("CART_STORE_HOST", "127.0.0.1")
+        self.cart_store_port = int(env.get("CART_STORE_PORT", "7480"))
+        self.cart_cache_ttl = float(env.get("CART_CACHE_TTL", "1"))
+
+        # Limited stock (items with a "stock" level in the catalog). Units added to a
+        # cart stay reserved for STOCK_HOLD_TTL seconds after the cart was last touched.
+        self.stock_hold_ttl = float(env.get("STOCK_HOLD_TTL", str(self.cart_idle_ttl)))
+
+        # Interaction rate limits as "tokens per second,burst" for each user, each
+        # guild and the whole bot (which shares one Discord HTTP budget). The same
+        # click, select or submit repeated within REPEAT_WINDOW seconds is dropped.
+        self.rate_limit_user = _rate(env.get("RATE_LIMIT_USER", "1,5"))
+        self.rate_limit_guild = _rate(env.get("RATE_LIMIT_GUILD", "20,60"))
+        self.rate_limit_global = _rate(env.get("RATE_LIMIT_GLOBAL", "40,50"))
+        self.repeat_window = float(env.get("REPEAT_WINDOW", "1"))
+
+        # Side effects (order ledger, audit log, order notifications) run on a bounded
+        # background queue after the user has their reply. ORDER_CHANNEL_ID, if set,
+        # gets a message for every confirmed order.
+        self.job_workers = int(env.get("JOB_WORKERS", "4"))
+        self.job_queue_size = int(env.get("JOB_QUEUE_SIZE", "1000"))
+        self.order_channel_id = int(env.get("ORDER_CHANNEL_ID", "0"))
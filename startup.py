@@ -0,0 +1,47 @@
+# startup.py
+# Cold-start timing.
+#
+# The profile is a list of named phases (how long each step took) and
+# milestones (time since the process began importing the bot). It is always
+# collected; it costs a few perf_counter() calls. `python bot.py
+# --profile-startup` logs the full breakdown at the first READY and again
+# once the first interaction has been handled.
+import time
+from contextlib import contextmanager
+
+
+class StartupProfile:
+    def __init__(self, began: float = None):
+        self.began = time.perf_counter() if began is None else began
+        # (name, seconds) in the order they finished
+        self.phases = []
+        # name -> seconds since began
+        self.milestones = {}
+
+    @contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - started))
+
+    def add_phase(self, name: str, seconds: float):
+        self.phases.append((name, seconds))
+
+    def mark(self, name: str, at: float = None) -> float:
+        """Record a milestone once; returns its time since began."""
+        if name not in self.milestones:
+            self.milestones[name] = (time.perf_counter() if at is None else at) - self.began
+        return self.milestones[name]
+
+    def report(self) -> str:
+        width = max([len(name) for name, _ in self.phases] + [len(name) for name in self.milestones] + [10])
+        lines = ["Startup profile", "  phases:"]
+        lines += [f"    {name:<{width}} {seconds * 1000:9.1f} ms" for name, seconds in self.phases]
+        lines.append("  milestones (since import began):")
+        lines += [
+            f"    {name:<{width}} {seconds * 1000:9.1f} ms"
+            for name, seconds in sorted(self.milestones.items(), key=lambda kv: kv[1])
+        ]
+        return "\n".join(lines)
@@ -0,0 +1,307 @@
+# storage.py
+# Durable carts and order ledger on SQLite.
+#
+# All database work runs on a single background thread so the event loop never
+# blocks on disk. Cart writes are write-behind: each mutation just records the
+# latest snapshot for that user, and a flusher writes every pending snapshot
+# (plus any new orders) in one transaction per batch. Limited stock counts
+# and stock holds (see inventory.LocalStock) are written behind the same way.
+# Carts nobody has written to for the idle TTL are deleted by a periodic
+# sweep (MemoryCartStore.sweep), so the table holds recent shoppers only.
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+log = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS carts (
+    user_id INTEGER PRIMARY KEY,
+    lines TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS carts_updated ON carts (updated_at);
+CREATE TABLE IF NOT EXISTS orders (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    total REAL NOT NULL,
+    lines TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS orders_user ON orders (user_id);
+CREATE TABLE IF NOT EXISTS stock (
+    item_id TEXT PRIMARY KEY,
+    available INTEGER NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS stock_holds (
+    user_id INTEGER PRIMARY KEY,
+    items TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+"""
+
+# Marks a pending cart write as a delete
+_DELETED = object()
+# Largest SQLite rowid
+MAX_ID = 2 ** 63 - 1
+
+
+def _order(row) -> dict:
+    return {"id": row[0], "user_id": row[1], "created_at": row[2], "total": row[3], "lines": json.loads(row[4])}
+
+
+def iter_order_batches(conn, batch_size: int = 500, after_id: int = 0, until_id: int = None):
+    """Orders from an open connection, oldest first, batch_size at a time.
+    Pages by id, so each query is a primary key range scan."""
+    while True:
+        rows = conn.execute(
+            "SELECT id, user_id, created_at, total, lines FROM orders WHERE id > ? AND id <= ? ORDER BY id LIMIT ?",
+            (after_id, MAX_ID if until_id is None else until_id, batch_size),
+        ).fetchall()
+        if not rows:
+            return
+        yield [_order(row) for row in rows]
+        after_id = rows[-1][0]
+
+
+class OrderStore:
+    def __init__(self, path: str, flush_interval: float = 1.0, max_batch: int = 500):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="order-store")
+        self._conn = None
+        # user id -> latest cart snapshot (or _DELETED), coalesced between flushes
+        self._pending_carts = {}
+        self._pending_orders = []
+        # item id -> units on sale, and user id -> (hold, expires at); _DELETED removes
+        self._pending_stock = {}
+        self._pending_holds = {}
+        self._wakeup = asyncio.Event()
+        self._flusher = None
+        self.flushes = 0
+        self.rows_written = 0
+        self.carts_pruned = 0
+
+    async def _run(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, fn, *args)
+
+    # --- lifecycle ---
+
+    async def start(self):
+        await self._run(self._open)
+        self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def close(self):
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+        await self.flush()
+        if self._conn is not None:
+            await self._run(self._conn.close)
+            self._conn = None
+        self._executor.shutdown(wait=True)
+
+    def _open(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+        self._conn = conn
+
+    # --- carts ---
+
+    def save_cart(self, user_id: int, snapshot: list):
+        self._pending_carts[user_id] = snapshot
+        self._nudge()
+
+    def delete_cart(self, user_id: int):
+        self._pending_carts[user_id] = _DELETED
+        self._nudge()
+
+    async def load_cart(self, user_id: int):
+        """Return the stored cart snapshot for a user, or None."""
+        pending = self._pending_carts.get(user_id)
+        if pending is not None:
+            return None if pending is _DELETED else pending
+        if self._conn is None:
+            return None
+        return await self._run(self._select_cart, user_id)
+
+    def _select_cart(self, user_id):
+        row = self._conn.execute("SELECT lines FROM carts WHERE user_id = ?", (user_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    async def prune_carts(self, older_than: float, keep=()) -> list:
+        """Delete stored carts last written before older_than (Unix time),
+        except those of users in keep or with a write still pending. Returns
+        the user ids whose carts were deleted."""
+        if self._conn is None:
+            return []
+        keep = set(keep)
+        keep.update(self._pending_carts)
+        pruned = await self._run(self._prune_carts, older_than, keep)
+        self.carts_pruned += len(pruned)
+        return pruned
+
+    def _prune_carts(self, older_than, keep):
+        rows = self._conn.execute("SELECT user_id FROM carts WHERE updated_at < ?", (older_than,)).fetchall()
+        pruned = [user_id for (user_id,) in rows if user_id not in keep]
+        with self._conn:
+            self._conn.executemany(
+                "DELETE FROM carts WHERE user_id = ? AND updated_at < ?", [(user_id, older_than) for user_id in pruned]
+            )
+        return pruned
+
+    # --- stock ---
+
+    def save_stock(self, item_id: str, available):
+        """Units on sale for a limited item; None when it is no longer limited."""
+        self._pending_stock[item_id] = _DELETED if available is None else available
+        self._nudge()
+
+    def save_hold(self, user_id: int, hold):
+        """A user's stock hold as (items, expires at); None once released."""
+        self._pending_holds[user_id] = _DELETED if hold is None else hold
+        self._nudge()
+
+    async def load_stock(self):
+        """({item id: units on sale}, {user id: (items, expires at)}) as last saved."""
+        await self.flush()
+        if self._conn is None:
+            return {}, {}
+        return await self._run(self._select_stock)
+
+    def _select_stock(self):
+        available = dict(self._conn.execute("SELECT item_id, available FROM stock").fetchall())
+        holds = {
+            user_id: (json.loads(items), expires_at)
+            for user_id, items, expires_at in self._conn.execute("SELECT user_id, items, expires_at FROM stock_holds")
+        }
+        return available, holds
+
+    # --- orders ---
+
+    def record_order(self, user_id: int, total, lines: list, created_at: float = None):
+        # The ledger is append-only. The confirmed cart was already deleted
+        # when it was checked out; this often runs later, from a background
+        # job, and by then the user may have started a new cart.
+        created_at = time.time() if created_at is None else created_at
+        self._pending_orders.append((user_id, created_at, total, json.dumps(lines)))
+        self._nudge()
+
+    async def recent_orders(self, user_id: int, limit: int = 10):
+        await self.flush()
+        return await self._run(self._select_orders, user_id, limit)
+
+    def _select_orders(self, user_id, limit):
+        rows = self._conn.execute(
+            "SELECT id, created_at, total, lines FROM orders WHERE user_id = ? ORDER BY id DESC LIMIT ?",
+            (user_id, limit),
+        ).fetchall()
+        return [
+            {"id": row[0], "created_at": row[1], "total": row[2], "lines": json.loads(row[3])}
+            for row in rows
+        ]
+
+    async def last_order_id(self) -> int:
+        await self.flush()
+        return await self._run(lambda: self._conn.execute("SELECT COALESCE(MAX(id), 0) FROM orders").fetchone()[0])
+
+    async def iter_orders(self, batch_size: int = 500, after_id: int = 0, until_id: int = None):
+        """Async generator over the whole ledger, oldest first, one batch of
+        orders at a time. Only one batch is in memory at once."""
+        await self.flush()
+        batches = iter_order_batches(self._conn, batch_size, after_id, until_id)
+        while True:
+            orders = await self._run(next, batches, None)
+            if orders is None:
+                return
+            yield orders
+
+    # --- write-behind ---
+
+    def pending(self) -> int:
+        return len(self._pending_carts) + len(self._pending_orders) + len(self._pending_stock) + len(self._pending_holds)
+
+    def _nudge(self):
+        if self.pending() >= self.max_batch:
+            self._wakeup.set()
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception:
+                log.exception("Order store flush failed")
+
+    async def flush(self):
+        if self._conn is None or not self.pending():
+            return
+        carts, self._pending_carts = self._pending_carts, {}
+        orders, self._pending_orders = self._pending_orders, []
+        stock, self._pending_stock = self._pending_stock, {}
+        holds, self._pending_holds = self._pending_holds, {}
+        try:
+            await self._run(self._write_batch, carts, orders, stock, holds)
+        except Exception:
+            # Put the batch back, without clobbering anything newer
+            for pending, batch in ((self._pending_carts, carts), (self._pending_stock, stock), (self._pending_holds, holds)):
+                for key, value in batch.items():
+                    pending.setdefault(key, value)
+            self._pending_orders[:0] = orders
+            raise
+        self.flushes += 1
+        self.rows_written += len(carts) + len(orders) + len(stock) + len(holds)
+
+    def _write_batch(self, carts, orders, stock, holds):
+        now = time.time()
+        upserts = [(user_id, json.dumps(snap), now) for user_id, snap in carts.items() if snap is not _DELETED]
+        deletes = [(user_id,) for user_id, snap in carts.items() if snap is _DELETED]
+        with self._conn:
+            if orders:
+                self._conn.executemany(
+                    "INSERT INTO orders (user_id, created_at, total, lines) VALUES (?, ?, ?, ?)", orders
+                )
+            if upserts:
+                self._conn.executemany(
+                    "INSERT INTO carts (user_id, lines, updated_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT(user_id) DO UPDATE SET lines = excluded.lines, updated_at = excluded.updated_at",
+                    upserts,
+                )
+            if deletes:
+                self._conn.executemany("DELETE FROM carts WHERE user_id = ?", deletes)
+            if stock:
+                self._conn.executemany(
+                    "INSERT INTO stock (item_id, available, updated_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT(item_id) DO UPDATE SET available = excluded.available, updated_at = excluded.updated_at",
+                    [(item_id, units, now) for item_id, units in stock.items() if units is not _DELETED],
+                )
+                self._conn.executemany(
+                    "DELETE FROM stock WHERE item_id = ?",
+                    [(item_id,) for item_id, units in stock.items() if units is _DELETED],
+                )
+            if holds:
+                self._conn.executemany(
+                    "INSERT INTO stock_holds (user_id, items, expires_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT(user_id) DO UPDATE SET items = excluded.items, expires_at = excluded.expires_at",
+                    [(user_id, json.dumps(hold[0]), hold[1]) for user_id, hold in holds.items() if hold is not _DELETED],
+                )
+                self._conn.executemany(
+                    "DELETE FROM stock_holds WHERE user_id = ?",
+                    [(user_id,) for user_id, hold in holds.items() if hold is _DELETED],
+                )
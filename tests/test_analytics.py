@@ -0,0 +1,148 @@
+# tests/test_analytics.py
+# Sales aggregates for /sales, and the order history export.
+import contextlib
+import csv
+import io
+import json
+import os
+import tempfile
+import unittest
+
+from analytics import DAY, HOUR, SalesAggregates, encode_batch, export_chunks, main
+from storage import OrderStore
+
+
+def line(item_id, quantity, price=100, category="Guns", discount=None):
+    entry = {"id": item_id, "category": category, "name": item_id.title(), "price": price, "quantity": quantity}
+    if discount:
+        entry["discount"] = discount
+    return entry
+
+
+async def batches(*groups):
+    for orders in groups:
+        yield orders
+
+
+class SalesAggregatesTest(unittest.TestCase):
+    def test_best_sellers_are_ranked_by_units_within_each_category(self):
+        sales = SalesAggregates()
+        for i in range(6):
+            sales.record(0, [line(f"gun-{i}", i + 1)])
+        sales.record(0, [line("coke", 3, category="Drugs")])
+        self.assertEqual(sales.best_sellers["Guns"], ["gun-5", "gun-4", "gun-3", "gun-2", "gun-1"])
+        # An item climbs in (and pushes the fifth out) once it sells more
+        sales.record(0, [line("gun-0", 10)])
+        self.assertEqual(sales.best_sellers["Guns"], ["gun-0", "gun-5", "gun-4", "gun-3", "gun-2"])
+        self.assertEqual(sales.best_sellers["Drugs"], ["coke"])
+
+    def test_totals_count_revenue_net_of_discounts(self):
+        sales = SalesAggregates()
+        sales.record(0, [line("pistol", 2, price=550.5, discount=100), line("coke", 1, price=10, category="Drugs")])
+        sales.record(0, [line("pistol", 1, price=550.5)])
+        self.assertEqual((sales.totals.orders, sales.totals.units, sales.totals.revenue_cents), (2, 4, 156150))
+        self.assertEqual(sales.items["pistol"], [3, 155150])
+        self.assertEqual(sales.category_revenue(), {"Guns": 155150, "Drugs": 1000})
+        # An order counts once per category however many lines it has there
+        self.assertEqual(sales.categories["Guns"].orders, 2)
+
+    def test_hourly_and_daily_buckets_keep_only_the_retention_window(self):
+        sales = SalesAggregates(retain_hours=3, retain_days=2)
+        for hour in range(6):
+            sales.record(hour * HOUR + 60, [line("pistol", 1)])
+        self.assertEqual(sorted(sales.hours), [3, 4, 5])
+        now = 5 * HOUR + 100
+        self.assertEqual(sales.window(2, now).orders, 2)
+        self.assertEqual(sales.window(24, now).orders, 3)
+        sales.record(5 * HOUR + 200, [line("coke", 4, price=50, category="Drugs")])
+        start, busiest = sales.busiest_hour(24, now)
+        self.assertEqual((start, busiest.orders, busiest.revenue_cents), (5 * HOUR, 2, 30000))
+
+        for day in (1, 2, 3):
+            sales.record(day * DAY, [line("pistol", 1)])
+        self.assertEqual(sorted(sales.days), [2, 3])
+        self.assertEqual(sales.last_order_at, 3 * DAY)
+
+
+class ReplayTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = OrderStore(os.path.join(self.tmp.name, "market.db"))
+        await self.store.start()
+
+    async def asyncTearDown(self):
+        await self.store.close()
+        self.tmp.cleanup()
+
+    async def test_orders_from_before_startup_are_replayed_once(self):
+        for i in range(7):
+            self.store.record_order(1, 1.0, [line("pistol", 1, price=1)], created_at=1000 + i)
+        await self.store.flush()
+        sales = SalesAggregates()
+
+        # As in setup_hook: live orders are recorded as they happen, older ones replayed
+        last_order_id = await self.store.last_order_id()
+        sales.record(2000, [line("coke", 2, category="Drugs")])
+        self.store.record_order(1, 2.0, [line("coke", 2, category="Drugs")], created_at=2000)
+        self.assertFalse(sales.ready)
+        await sales.replay(self.store.iter_orders(batch_size=3, until_id=last_order_id))
+
+        self.assertTrue(sales.ready)
+        self.assertEqual((sales.totals.orders, sales.totals.units), (8, 9))
+        self.assertEqual(sales.items["pistol"][0], 7)
+        self.assertEqual(sales.last_order_at, 2000)
+
+
+ORDERS = [
+    {"id": 1, "user_id": 7, "created_at": 0, "total": 1099.0,
+     "lines": [line("pistol", 2, price=550, discount=1), line("coke", 1, price=0.5, category="Drugs")]},
+    {"id": 2, "user_id": 8, "created_at": DAY, "total": 550, "lines": [line("pistol", 1, price=550)]},
+]
+
+
+class ExportTest(unittest.IsolatedAsyncioTestCase):
+    def test_csv_has_one_row_per_order_line(self):
+        rows = list(csv.reader(io.StringIO(encode_batch(ORDERS, "csv", header=True))))
+        self.assertEqual(rows[0][:3], ["order_id", "user_id", "created_at"])
+        self.assertEqual(rows[1], ["1", "7", "1970-01-01T00:00:00+00:00", "pistol", "Guns", "Pistol", "550", "2", "1", "1099"])
+        self.assertEqual(rows[2][-4:], ["0.5", "1", "0", "0.5"])
+        self.assertEqual(rows[3][:3], ["2", "8", "1970-01-02T00:00:00+00:00"])
+        self.assertEqual(len(rows), 4)
+
+    def test_jsonl_has_one_object_per_order(self):
+        lines = encode_batch(ORDERS, "jsonl").splitlines()
+        self.assertEqual(len(lines), 2)
+        first = json.loads(lines[0])
+        self.assertEqual(first["created_at"], "1970-01-01T00:00:00+00:00")
+        self.assertEqual(first["lines"], ORDERS[0]["lines"])
+
+    def test_unknown_format_is_refused(self):
+        with self.assertRaises(ValueError):
+            encode_batch(ORDERS, "xml")
+
+    async def test_chunks_have_one_header(self):
+        chunks = [chunk async for chunk in export_chunks(batches(ORDERS[:1], ORDERS[1:]), "csv")]
+        self.assertEqual(len(chunks), 2)
+        self.assertEqual("".join(chunks).count("order_id"), 1)
+        # No orders still gives a header
+        self.assertEqual([chunk async for chunk in export_chunks(batches(), "csv")], [encode_batch([], "csv", header=True)])
+        self.assertEqual([chunk async for chunk in export_chunks(batches(), "jsonl")], [])
+
+    async def test_command_line_export_reads_the_database(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "market.db")
+            store = OrderStore(path)
+            await store.start()
+            for order in ORDERS:
+                store.record_order(order["user_id"], order["total"], order["lines"], order["created_at"])
+            await store.close()
+
+            out = io.StringIO()
+            with contextlib.redirect_stdout(out):
+                main(["export", "--db", path, "--format", "jsonl", "--batch", "1"])
+        exported = [json.loads(text) for text in out.getvalue().splitlines()]
+        self.assertEqual([(order["id"], order["user_id"]) for order in exported], [(1, 7), (2, 8)])
+
+
+if __name__ == "__main__":
+    unittest.main()
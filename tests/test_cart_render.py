@@ -0,0 +1,94 @@
+# tests/test_cart_render.py
+# Cart embeds stay within Discord's limits however long the cart is.
+import unittest
+
+import discord
+
+import bot
+from benchmarks.fakes import FakeInteraction
+from cart import Cart
+from cart_render import DESCRIPTION_LIMIT, EMBED_LIMIT, FIELD_LIMIT, FIELD_VALUE_LIMIT, CartRenderer
+from pricing import Quote
+
+
+def make_cart(lines: int) -> Cart:
+    cart = Cart()
+    for i in range(lines):
+        # Long names fill fields and pages quickly
+        name = f"Item {i:05d} " + "x" * 60
+        item = {"id": f"item-{i}", "category": "Guns", "name": name, "price": 1234.56, "price_cents": 123456}
+        cart.add(item, i % 99 + 1)
+    return cart
+
+
+class CartRendererTest(unittest.TestCase):
+    def render(self, cart, quote=None):
+        return CartRenderer().render(
+            cart, "🎉 Order Confirmed!", discord.Color.green(),
+            intro="Thank you for your purchase! Here's your order summary:\n\n",
+            fields=[("📞 Order Status", "Your order has been processed successfully!")],
+            footer="Order by shopper", quote=quote,
+        )
+
+    def assert_within_limits(self, pages, cart):
+        shown = []
+        for number, embed in enumerate(pages, 1):
+            self.assertLessEqual(len(embed), EMBED_LIMIT)
+            self.assertLessEqual(len(embed.description), DESCRIPTION_LIMIT)
+            self.assertLessEqual(len(embed.fields), FIELD_LIMIT)
+            for field in embed.fields:
+                self.assertLessEqual(len(field.value), FIELD_VALUE_LIMIT)
+                self.assertTrue(field.name)
+            self.assertEqual(embed.fields[-1].name, "📞 Order Status")
+            if len(pages) > 1:
+                self.assertTrue(embed.footer.text.endswith(f"Page {number}/{len(pages)}"))
+            for text in [embed.description] + [field.value for field in embed.fields[:-1]]:
+                shown.extend(line for line in text.split("\n") if line.startswith("- "))
+        # Every line exactly once, in order, and the total on the last page
+        self.assertEqual(len(shown), len(cart))
+        self.assertEqual([line.split(" ")[3] for line in shown], [f"{i:05d}" for i in range(len(cart))])
+        self.assertIn("Total :", pages[-1].description + "".join(field.value for field in pages[-1].fields))
+
+    def test_carts_of_every_size_fit(self):
+        for lines, page_count in ((1, 1), (30, 1), (300, 5), (3000, 47)):
+            with self.subTest(lines=lines):
+                cart = make_cart(lines)
+                pages = self.render(cart)
+                self.assert_within_limits(pages, cart)
+                self.assertEqual(len(pages), page_count)
+
+    def test_discount_lines_fit_too(self):
+        cart = make_cart(300)
+        adjustments = {f"Bundle {i}": 100 for i in range(40)}
+        quote = Quote(cart.total_cents, adjustments)
+        pages = self.render(cart, quote)
+        self.assert_within_limits(pages, cart)
+        last = pages[-1].description + "\n".join(field.value for field in pages[-1].fields)
+        self.assertIn("Bundle 39 : -", last)
+
+
+class RemainingPagesTest(unittest.IsolatedAsyncioTestCase):
+    async def test_followups_are_capped(self):
+        cart = make_cart(3000)
+        quote = Quote(cart.total_cents)
+        pages = CartRenderer().render(cart, "🛒", discord.Color.green(), quote=quote)
+        interaction = FakeInteraction(1)
+
+        await bot.send_remaining_pages(interaction, pages, quote)
+
+        calls = interaction.followup.calls
+        self.assertEqual(len(calls), bot.MAX_FOLLOWUP_PAGES + 1)
+        self.assertEqual([call["embed"] for call in calls[:-1]], pages[1:bot.MAX_FOLLOWUP_PAGES + 1])
+        self.assertIn(f"{len(pages) - 1 - bot.MAX_FOLLOWUP_PAGES} more pages", calls[-1]["content"])
+
+    async def test_short_orders_send_every_page(self):
+        cart = make_cart(300)
+        quote = Quote(cart.total_cents)
+        pages = CartRenderer().render(cart, "🛒", discord.Color.green(), quote=quote)
+        interaction = FakeInteraction(1)
+        await bot.send_remaining_pages(interaction, pages, quote)
+        self.assertEqual([call["embed"] for call in interaction.followup.calls], pages[1:])
+
+
+if __name__ == "__main__":
+    unittest.main()
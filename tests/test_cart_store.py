@@ -0,0 +1,277 @@
+# tests/test_cart_store.py
+# RemoteCartStore against an in-process CartServer, and carts from guild
+# overlays coming back from persistence.
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+
+from cart_server import CartServer
+from cart_store import CartConflict, MemoryCartStore, RemoteCartStore
+from catalog import Catalog, CatalogSource
+from sessions import SessionStore
+from storage import OrderStore
+
+CATALOG_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "catalog.json")
+CATALOG = Catalog.from_file(CATALOG_PATH)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def add(item_id, quantity=1):
+    def mutate(cart):
+        cart.add(CATALOG.item(item_id), quantity)
+    return mutate
+
+
+def lookup(item_id, guild_id=None):
+    return CATALOG.item(item_id)
+
+
+def contents(cart):
+    return {line.item_id: line.quantity for line in cart} if cart is not None else None
+
+
+class RemoteCartStoreTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.server = CartServer()
+        self.port = await self.server.start("127.0.0.1", 0)
+        self.clock = FakeClock()
+        self.stores = []
+
+    async def asyncTearDown(self):
+        for store in self.stores:
+            await store.close()
+        await self.server.close()
+
+    def store(self, **kwargs):
+        store = RemoteCartStore("127.0.0.1", self.port, lookup, clock=self.clock, **kwargs)
+        self.stores.append(store)
+        return store
+
+    async def test_update_retries_after_a_conflicting_write(self):
+        first, second = self.store(), self.store()
+        await first.update(1, add("combat-pistol"))
+        # second caches the cart, then first changes it behind second's back
+        await second.load(1)
+        await first.update(1, add("micro-smg", 2))
+
+        cart = await second.update(1, add("pallet-weed"))
+
+        self.assertEqual(second.conflicts, 1)
+        self.assertEqual(contents(cart), {"combat-pistol": 1, "micro-smg": 2, "pallet-weed": 1})
+        self.assertEqual(contents(await self.store().load(1)), contents(cart))
+
+    async def test_update_gives_up_when_every_write_conflicts(self):
+        store = self.store(max_attempts=3, retry_delay=0)
+        await store.update(1, add("combat-pistol"))
+
+        def mutate(cart):
+            # Another writer gets in between every read and write
+            revision = self.server.handle({"op": "get", "user": 1})["rev"]
+            self.server.handle({"op": "put", "user": 1, "rev": revision, "cart": {"version": 0, "lines": []}})
+            cart.add(CATALOG.item("pallet-weed"), 1)
+
+        with self.assertRaises(CartConflict):
+            await store.update(1, mutate)
+        self.assertEqual(store.conflicts, 3)
+
+    async def test_discard_only_removes_the_expected_version(self):
+        store = self.store()
+        cart = await store.update(1, add("combat-pistol"))
+
+        self.assertIsNone(await store.discard(1, if_version=cart.version + 1))
+        self.assertEqual(contents(await store.load(1)), {"combat-pistol": 1})
+
+        taken = await store.discard(1, if_version=cart.version)
+        self.assertEqual(contents(taken), {"combat-pistol": 1})
+        self.assertIsNone(await store.load(1))
+        self.assertEqual(len(self.server), 0)
+
+    async def test_discard_refused_refreshes_the_cache(self):
+        first, second = self.store(), self.store()
+        cart = await first.update(1, add("combat-pistol"))
+        await second.update(1, add("micro-smg"))
+
+        # first's cached copy is out of date; the refusal brings it up to date
+        self.assertIsNone(await first.discard(1, if_version=cart.version))
+        self.assertEqual(contents(await first.load(1)), {"combat-pistol": 1, "micro-smg": 1})
+        self.assertEqual(first.cache_hits, 1)
+
+    async def test_cached_reads_expire_after_the_ttl(self):
+        reader, writer = self.store(cache_ttl=1.0), self.store()
+        await writer.update(1, add("combat-pistol"))
+        self.assertEqual(contents(await reader.load(1)), {"combat-pistol": 1})
+        await writer.update(1, add("combat-pistol"))
+
+        self.clock.now = 0.5
+        self.assertEqual(contents(await reader.load(1)), {"combat-pistol": 1})
+        self.clock.now = 1.0
+        self.assertEqual(contents(await reader.load(1)), {"combat-pistol": 2})
+        self.assertEqual((reader.cache_hits, reader.cache_misses), (1, 2))
+
+    async def test_close_keeps_acknowledged_writes_and_reconnects(self):
+        store = self.store()
+        await asyncio.gather(*(store.update(user_id, add("combat-pistol", user_id)) for user_id in range(1, 6)))
+        await store.close()
+        self.assertFalse(store.stats()["connected"])
+
+        for user_id in range(1, 6):
+            self.assertEqual(self.server.handle({"op": "get", "user": user_id})["cart"]["lines"], [["combat-pistol", user_id]])
+        # The next call opens a new connection
+        self.assertEqual(contents(await store.load(3)), {"combat-pistol": 3})
+
+    async def test_calls_in_flight_fail_when_the_server_goes_away(self):
+        store = self.store()
+        await store.load(1)
+        call = asyncio.create_task(store._call("get", user=1))
+        await asyncio.sleep(0)
+        # The connection drops before the answer arrives
+        store._reader.feed_eof()
+        with self.assertRaises(ConnectionError):
+            await call
+
+    async def test_malformed_requests_leave_the_connection_usable(self):
+        store = self.store()
+        await store.update(1, add("combat-pistol"))
+        with self.assertRaises(RuntimeError):
+            await store._call(None, user=1)
+        with self.assertRaises(RuntimeError):
+            await store._call("put", user=1)
+        # Lines that aren't requests at all are answered without an id
+        store._writer.write(b'["get"]\nnot json\n')
+        reply = await store._call("get", user=1)
+        self.assertEqual(reply["cart"]["lines"], [["combat-pistol", 1]])
+        self.assertTrue(store.stats()["connected"])
+
+    def test_request_without_op_is_an_error(self):
+        self.assertIn("error", self.server.handle({"user": 1}))
+
+
+GUILD, OTHER_GUILD = 7, 8
+OVERLAYS = {"guilds": {
+    str(GUILD): {
+        "items": {"combat-pistol": {"price": 50000}},
+        "add": [{"id": "guild-rifle", "category": "Guns", "name": "Guild Rifle", "price": 120000}],
+    },
+    str(OTHER_GUILD): {
+        "add": [{"id": "other-smg", "category": "Guns", "name": "Other SMG", "price": 30000}],
+    },
+}}
+
+
+class OverlayCartTest(unittest.IsolatedAsyncioTestCase):
+    """A cart filled from guild storefronts keeps its overlay items and
+    prices once it has left memory and is read back."""
+
+    async def asyncSetUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        overlays_path = os.path.join(self.tmp.name, "overlays.json")
+        with open(overlays_path, "w", encoding="utf-8") as f:
+            json.dump(OVERLAYS, f)
+        self.source = CatalogSource(CATALOG_PATH, overlays_path)
+
+    async def asyncTearDown(self):
+        self.tmp.cleanup()
+
+    def lookup(self, item_id, guild_id=None):
+        return self.source.storefront(guild_id).catalog.item(item_id)
+
+    def fill(self, cart):
+        guild = self.source.storefront(GUILD).catalog
+        cart.add(guild.item("combat-pistol"), 2, GUILD)
+        cart.add(guild.item("guild-rifle"), 1, GUILD)
+
+    def fill_from_another_guild(self, cart):
+        cart.add(self.source.storefront(OTHER_GUILD).catalog.item("other-smg"), 3, OTHER_GUILD)
+
+    def assert_overlay_cart(self, cart):
+        self.assertEqual(contents(cart), {"combat-pistol": 2, "guild-rifle": 1})
+        self.assertEqual({line.guild_id for line in cart}, {GUILD})
+        self.assertEqual(cart.total_cents, (2 * 50000 + 120000) * 100)
+
+    async def test_memory_cart_evicted_from_the_session_store(self):
+        path = os.path.join(self.tmp.name, "market.db")
+        order_store = OrderStore(path)
+        await order_store.start()
+        store = MemoryCartStore(SessionStore(max_size=1), order_store, self.lookup)
+        try:
+            await store.update(1, self.fill)
+            # A second shopper pushes the first cart out of memory
+            await store.update(2, add("micro-smg"))
+            self.assertEqual(len(store), 1)
+            self.assert_overlay_cart(await store.load(1))
+        finally:
+            await order_store.close()
+
+        # And after a restart, from the database
+        order_store = OrderStore(path)
+        await order_store.start()
+        try:
+            self.assert_overlay_cart(await MemoryCartStore(SessionStore(), order_store, self.lookup).load(1))
+        finally:
+            await order_store.close()
+
+    async def test_remote_cart_read_back_after_the_cache_expires(self):
+        server = CartServer()
+        port = await server.start("127.0.0.1", 0)
+        clock = FakeClock()
+        writer = RemoteCartStore("127.0.0.1", port, self.lookup, clock=clock)
+        reader = RemoteCartStore("127.0.0.1", port, self.lookup, clock=clock)
+        try:
+            await writer.update(1, self.fill)
+            clock.now = 10.0
+            self.assert_overlay_cart(await writer.load(1))
+            self.assert_overlay_cart(await reader.load(1))
+        finally:
+            await writer.close()
+            await reader.close()
+            await server.close()
+
+    async def test_cart_from_two_guilds_restores_each_line_from_its_own_guild(self):
+        path = os.path.join(self.tmp.name, "market.db")
+        order_store = OrderStore(path)
+        await order_store.start()
+        try:
+            store = MemoryCartStore(SessionStore(), order_store, self.lookup)
+            await store.update(1, self.fill)
+            await store.update(1, self.fill_from_another_guild)
+            await store.update(1, add("micro-smg"))
+        finally:
+            await order_store.close()
+
+        order_store = OrderStore(path)
+        await order_store.start()
+        try:
+            cart = await MemoryCartStore(SessionStore(), order_store, self.lookup).load(1)
+        finally:
+            await order_store.close()
+        self.assertEqual(contents(cart), {"combat-pistol": 2, "guild-rifle": 1, "other-smg": 3, "micro-smg": 1})
+        self.assertEqual(
+            {line.item_id: line.guild_id for line in cart},
+            {"combat-pistol": GUILD, "guild-rifle": GUILD, "other-smg": OTHER_GUILD, "micro-smg": None}
+        )
+        micro_smg = CATALOG.item("micro-smg")["price_cents"]
+        self.assertEqual(cart.total_cents, (2 * 50000 + 120000 + 3 * 30000) * 100 + micro_smg)
+
+    async def test_lines_saved_without_a_guild_use_the_base_catalog(self):
+        order_store = OrderStore(os.path.join(self.tmp.name, "market.db"))
+        await order_store.start()
+        order_store.save_cart(1, [["combat-pistol", 1], ["guild-rifle", 1]])
+        try:
+            cart = await MemoryCartStore(SessionStore(), order_store, self.lookup).load(1)
+        finally:
+            await order_store.close()
+        self.assertEqual(contents(cart), {"combat-pistol": 1})
+        self.assertEqual(cart.total_cents, 55000 * 100)
+
+
+if __name__ == "__main__":
+    unittest.main()
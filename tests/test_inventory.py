@@ -0,0 +1,165 @@
+# tests/test_inventory.py
+# Holds and expiry, stock kept across restarts, and stock shared through the cart server.
+import os
+import tempfile
+import unittest
+
+from cart_server import CartServer
+from cart_store import RemoteCartStore
+from catalog import Catalog
+from inventory import Inventory, LocalStock, OutOfStock, RemoteStock
+from storage import OrderStore
+
+CATALOG = Catalog.from_file(os.path.join(os.path.dirname(os.path.dirname(__file__)), "catalog.json"))
+# pallet-coke has 5 units, pallet-weed 10
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class InventoryTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.inventory = Inventory(hold_ttl=60, clock=self.clock)
+        self.inventory.load_levels(CATALOG)
+
+    def test_unlimited_items_are_not_tracked(self):
+        self.assertIsNone(self.inventory.available("combat-pistol"))
+        self.inventory.reserve(1, {"combat-pistol": 500})
+        self.assertEqual(self.inventory.stats()["holds"], 0)
+
+    def test_reserve_is_all_or_nothing(self):
+        self.inventory.reserve(1, {"pallet-coke": 3})
+        with self.assertRaises(OutOfStock) as raised:
+            self.inventory.reserve(2, {"pallet-coke": 3, "pallet-weed": 1})
+        self.assertEqual(raised.exception.shortages, {"pallet-coke": 2})
+        self.assertEqual(self.inventory.available("pallet-weed"), 10)
+        self.assertEqual(self.inventory.refused, 1)
+
+    def test_release_puts_units_back_on_sale(self):
+        self.inventory.reserve(1, {"pallet-coke": 2, "pallet-weed": 4})
+        self.assertEqual(self.inventory.release(1), {"pallet-coke": 2, "pallet-weed": 4})
+        self.assertEqual(self.inventory.stock_levels(), {"pallet-coke": 5, "pallet-weed": 10})
+        self.assertEqual(self.inventory.release(1), {})
+
+    def test_commit_sells_held_units_and_returns_the_rest(self):
+        self.inventory.reserve(1, {"pallet-coke": 3})
+        self.inventory.commit(1, {"pallet-coke": 2})
+        self.assertEqual(self.inventory.available("pallet-coke"), 3)
+        self.assertEqual(self.inventory.stats()["units_held"], 0)
+
+    def test_holds_expire_after_the_ttl_since_last_touch(self):
+        self.inventory.reserve(1, {"pallet-coke": 2})
+        self.inventory.reserve(2, {"pallet-coke": 1})
+        self.clock.now += 40
+        self.inventory.touch(1)
+
+        self.clock.now += 30
+        self.assertEqual(self.inventory.expire(), 1)
+        self.assertEqual(self.inventory.available("pallet-coke"), 3)
+        self.clock.now += 30
+        self.assertEqual(self.inventory.expire(), 1)
+        self.assertEqual(self.inventory.available("pallet-coke"), 5)
+        self.assertEqual(self.inventory.expired, 2)
+
+    def test_expired_hold_is_taken_from_the_shelf_at_commit(self):
+        self.inventory.reserve(1, {"pallet-coke": 2})
+        self.clock.now += 61
+        self.inventory.expire()
+        self.inventory.reserve(2, {"pallet-coke": 4})
+        with self.assertRaises(OutOfStock):
+            self.inventory.commit(1, {"pallet-coke": 2})
+        self.inventory.commit(1, {"pallet-coke": 1})
+        self.assertEqual(self.inventory.available("pallet-coke"), 0)
+
+
+class LocalStockTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "market.db")
+
+    async def asyncTearDown(self):
+        self.tmp.cleanup()
+
+    async def started(self, clock):
+        store = OrderStore(self.path)
+        await store.start()
+        stock = LocalStock(Inventory(hold_ttl=60, clock=clock), store, expire_interval=0)
+        await stock.start(CATALOG)
+        return store, stock
+
+    async def test_counts_and_holds_survive_a_restart(self):
+        clock = FakeClock()
+        store, stock = await self.started(clock)
+        await stock.reserve(1, {"pallet-coke": 2})
+        await stock.reserve(2, {"pallet-weed": 3})
+        await stock.commit(2, {"pallet-weed": 3})
+        await stock.restock({"pallet-weed": 1})
+        stock.stop()
+        await store.close()
+
+        store, stock = await self.started(FakeClock())
+        self.assertEqual(stock.stock_levels(), {"pallet-coke": 3, "pallet-weed": 8})
+        self.assertEqual(stock.stats()["units_held"], 2)
+        # The hold still expires on its original schedule, and is saved as gone
+        stock.inventory.clock.now += 61
+        stock.inventory.expire()
+        stock._save()
+        self.assertEqual(stock.available("pallet-coke"), 5)
+        stock.stop()
+        await store.close()
+
+        store, stock = await self.started(FakeClock())
+        self.assertEqual(stock.stats()["holds"], 0)
+        self.assertEqual(stock.available("pallet-coke"), 5)
+        stock.stop()
+        await store.close()
+
+
+class RemoteStockTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.server = CartServer()
+        port = await self.server.start("127.0.0.1", 0)
+        self.carts = [RemoteCartStore("127.0.0.1", port, lambda item_id, guild_id=None: CATALOG.item(item_id)) for _ in range(2)]
+        self.shards = [RemoteStock(carts.request, poll_interval=0) for carts in self.carts]
+        for shard in self.shards:
+            await shard.start(CATALOG)
+
+    async def asyncTearDown(self):
+        for shard, carts in zip(self.shards, self.carts):
+            shard.stop()
+            await carts.close()
+        await self.server.close()
+
+    async def test_shards_sell_from_the_same_counts(self):
+        first, second = self.shards
+        await first.reserve(1, {"pallet-coke": 4})
+        with self.assertRaises(OutOfStock) as raised:
+            await second.reserve(2, {"pallet-coke": 2})
+        self.assertEqual(raised.exception.shortages, {"pallet-coke": 1})
+        self.assertEqual(second.available("pallet-coke"), 1)
+
+        # A hold made through one shard is released through the other
+        self.assertEqual(await second.release(1), {"pallet-coke": 4})
+        await second.reserve(2, {"pallet-coke": 5})
+        await first.commit(2, {"pallet-coke": 5})
+        self.assertEqual(self.server.inventory.available("pallet-coke"), 0)
+
+    async def test_levels_from_another_shard_keep_current_counts(self):
+        await self.shards[0].reserve(1, {"pallet-weed": 6})
+        await self.shards[1].start(CATALOG)
+        self.assertEqual(self.shards[1].available("pallet-weed"), 4)
+
+    async def test_bad_restock_raises_key_error(self):
+        with self.assertRaises(KeyError):
+            await self.shards[0].restock({"combat-pistol": 3})
+        self.assertEqual(await self.shards[0].restock({"pallet-coke": 2}, "set"), {"pallet-coke": 2})
+
+
+if __name__ == "__main__":
+    unittest.main()
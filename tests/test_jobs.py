@@ -0,0 +1,66 @@
+# tests/test_jobs.py
+import asyncio
+import unittest
+
+import bot
+import metrics
+from benchmarks.bench_interactions import offline_settings
+from jobs import JobQueue
+
+
+class JobQueueTest(unittest.IsolatedAsyncioTestCase):
+    async def test_jobs_are_recorded_apart_from_interactions(self):
+        registry = metrics.Registry()
+        queue = JobQueue(workers=1, registry=registry)
+
+        async def fail():
+            raise RuntimeError("boom")
+
+        async def ok():
+            pass
+
+        await queue.submit("audit", ok)
+        await queue.submit("audit", fail)
+        await queue.join()
+        await queue.close()
+
+        self.assertEqual(registry.handlers, {})
+        self.assertEqual((registry.jobs["audit"].runs, registry.jobs["audit"].errors), (2, 1))
+        self.assertEqual(metrics.summary(registry), "No interactions recorded yet.")
+        text = metrics.render_prometheus(registry)
+        self.assertIn('market_job_runs_total{kind="audit"} 2', text)
+        self.assertIn('market_job_wait_seconds_count{kind="audit"} 2', text)
+        self.assertNotIn("audit", "".join(line for line in text.splitlines() if line.startswith("market_handler")))
+
+
+class FakeClient:
+    closed = False
+
+    async def close(self):
+        self.closed = True
+
+
+class ShutdownBot(bot.MarketBotMixin, FakeClient):
+    pass
+
+
+class ShutdownTest(unittest.IsolatedAsyncioTestCase):
+    async def test_queued_jobs_run_before_the_client_closes(self):
+        bot.create_bot(offline_settings())
+        await bot.order_store.start()
+        client = ShutdownBot()
+        ran = []
+
+        async def announce():
+            await asyncio.sleep(0.01)
+            ran.append(client.closed)
+
+        await bot.jobs.submit("notify_order", announce)
+        await client.close()
+        # The job saw an open client
+        self.assertEqual(ran, [False])
+        self.assertTrue(client.closed)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,128 @@
+# tests/test_locks.py
+# Per-user locks, the idempotency cache, and a double-clicked Confirm.
+import asyncio
+import unittest
+
+import bot
+from benchmarks.bench_interactions import offline_settings
+from benchmarks.fakes import FakeUser
+from locks import IdempotencyCache, UserLocks
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class UserLocksTest(unittest.IsolatedAsyncioTestCase):
+    async def test_lock_is_dropped_once_nobody_holds_or_waits(self):
+        locks = UserLocks()
+        async with locks.hold(1):
+            self.assertEqual(len(locks), 1)
+        self.assertEqual(len(locks), 0)
+
+    async def test_same_user_is_serialized_and_others_are_not(self):
+        locks = UserLocks()
+        order = []
+        release = asyncio.Event()
+
+        async def first():
+            async with locks.hold(1):
+                order.append("first")
+                await release.wait()
+                order.append("first done")
+
+        async def second():
+            async with locks.hold(1):
+                order.append("second")
+
+        async def other_user():
+            async with locks.hold(2):
+                order.append("other")
+
+        tasks = [asyncio.create_task(first()), asyncio.create_task(second())]
+        await asyncio.sleep(0)
+        await other_user()
+        # The waiter keeps the lock entry alive
+        self.assertEqual(len(locks), 1)
+        release.set()
+        await asyncio.gather(*tasks)
+
+        self.assertEqual(order, ["first", "other", "first done", "second"])
+        self.assertEqual(locks.contended, 1)
+        self.assertEqual(len(locks), 0)
+
+    async def test_cancelled_waiter_does_not_leak_the_lock(self):
+        locks = UserLocks()
+        async with locks.hold(1):
+            waiter = asyncio.create_task(locks.hold(1).__aenter__())
+            await asyncio.sleep(0)
+            waiter.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await waiter
+        self.assertEqual(len(locks), 0)
+
+
+class IdempotencyCacheTest(unittest.TestCase):
+    def test_entries_expire_after_the_ttl(self):
+        clock = FakeClock()
+        cache = IdempotencyCache(ttl=10, clock=clock)
+        cache.put("a", 1)
+        clock.now = 5
+        cache.put("b", 2)
+        clock.now = 9.9
+        self.assertEqual((cache.get("a"), cache.get("b")), (1, 2))
+        clock.now = 10
+        self.assertEqual((cache.get("a"), cache.get("b")), (None, 2))
+        clock.now = 15
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual((len(cache), cache.hits), (0, 3))
+
+    def test_oldest_entries_are_evicted_past_max_size(self):
+        cache = IdempotencyCache(max_size=2, clock=FakeClock())
+        for key in ("a", "b", "c"):
+            cache.put(key, key)
+        self.assertEqual([cache.get(key) for key in ("a", "b", "c")], [None, "b", "c"])
+        # Putting a key again makes it the newest
+        cache.put("b", "b2")
+        cache.put("d", "d")
+        self.assertEqual([cache.get(key) for key in ("b", "c", "d")], ["b2", None, "d"])
+
+
+class CheckoutRaceTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        bot.create_bot(offline_settings())
+        await bot.order_store.start()
+        await bot.cart_store.start()
+        await bot.inventory.start(bot.catalog_source.catalog)
+
+    async def asyncTearDown(self):
+        bot.inventory.stop()
+        await bot.jobs.close()
+        await bot.cart_store.close()
+        await bot.order_store.close()
+
+    async def test_double_confirm_records_one_order(self):
+        user = FakeUser(4242)
+        catalog = bot.catalog_source.catalog
+        cart = await bot.add_to_cart(user.id, None, [(catalog.item("pallet-coke"), 2)])
+        version = str(cart.version)
+
+        results = await asyncio.gather(
+            bot.checkout(user, version, catalog), bot.checkout(user, version, catalog)
+        )
+
+        self.assertEqual(sorted(status for status, _ in results), ["confirmed", "duplicate"])
+        await bot.jobs.join()
+        await bot.order_store.flush()
+        orders = await bot.order_store.recent_orders(user.id)
+        self.assertEqual(len(orders), 1)
+        self.assertEqual(orders[0]["lines"][0]["quantity"], 2)
+        self.assertIsNone(await bot.get_cart(user.id))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,26 @@
+# tests/test_logs.py
+import io
+import logging
+import unittest
+
+from logs import LogPipeline
+
+
+class LogPipelineTest(unittest.TestCase):
+    def test_stop_restores_the_record_flags(self):
+        srcfile = logging._srcfile
+        stream = io.StringIO()
+        pipeline = LogPipeline(fmt="text", stream=stream).start()
+        try:
+            self.assertFalse(logging.logThreads)
+            logging.getLogger("market").info("hello")
+        finally:
+            pipeline.stop()
+        self.assertIn("hello", stream.getvalue())
+        self.assertTrue(logging.logThreads and logging.logProcesses)
+        # Caller file and line stay available to every other logger
+        self.assertIs(logging._srcfile, srcfile)
+
+
+if __name__ == "__main__":
+    unittest.main()
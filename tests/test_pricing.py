@@ -0,0 +1,217 @@
+# tests/test_pricing.py
+# What the rules take off a cart, memoized quotes, and loading the rules at
+# startup and reloading them.
+import json
+import os
+import tempfile
+import unittest
+
+from cart import Cart
+from catalog import Catalog
+from pricing import Pricing, PricingPlan, Quote, parse_rules
+
+CATALOG = Catalog.from_file(os.path.join(os.path.dirname(os.path.dirname(__file__)), "catalog.json"))
+# In cents: ammo-pistol 150000, fleeca-heist-pack 6000000, bijoux-heist-pack
+# 10000000, pallet-coke 105000000
+
+HEIST_KIT = {"id": "heist-kit", "type": "bundle", "label": "Heist kit", "percent_off": 15,
+             "requires": [{"category": "Heist Pack", "quantity": 1}, {"item": "ammo-pistol", "quantity": 2}]}
+
+
+def tiers(percent_off, minimum=2):
+    return {"rules": [{"id": "bulk", "type": "tiers", "items": ["combat-pistol"],
+                       "tiers": [{"min": minimum, "percent_off": percent_off}]}]}
+
+
+def compile_plan(*rules):
+    return PricingPlan(CATALOG, parse_rules({"rules": list(rules)}), "test")
+
+
+def cart_of(**quantities):
+    cart = Cart()
+    for item_id, quantity in quantities.items():
+        cart.add(CATALOG.item(item_id.replace("_", "-")), quantity)
+    return cart
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 500.0
+
+    def __call__(self):
+        return self.now
+
+
+class PricingPlanTest(unittest.TestCase):
+    def test_line_gets_the_best_tier_its_quantity_reaches(self):
+        plan = compile_plan(
+            {"id": "bulk-guns", "type": "tiers", "categories": ["Guns"],
+             "tiers": [{"min": 25, "percent_off": 10}, {"min": 10, "percent_off": 5}]},
+            {"id": "ammo-promo", "type": "promo", "items": ["ammo-pistol"], "percent_off": 7},
+        )
+        # The promo covers every quantity; the tiers beat it from 25 units
+        for quantity, percent in ((1, 7), (9, 7), (10, 7), (24, 7), (25, 10), (67, 10)):
+            quote = plan.quote(cart_of(ammo_pistol=quantity), 0)
+            self.assertEqual(quote.discount_cents, 150000 * quantity * percent // 100, quantity)
+        self.assertEqual(plan.quote(cart_of(ammo_pistol=67), 0).line_discounts, {"ammo-pistol": 1005000})
+
+        plan = compile_plan({"id": "bulk-guns", "type": "tiers", "categories": ["Guns"],
+                             "tiers": [{"min": 10, "percent_off": 5}, {"min": 25, "percent_off": 10}]})
+        for quantity, percent in ((9, 0), (10, 5), (24, 5), (25, 10)):
+            self.assertEqual(plan.quote(cart_of(ammo_pistol=quantity), 0).discount_cents,
+                             150000 * quantity * percent // 100, quantity)
+
+    def test_bundle_sets_are_limited_by_the_scarcest_requirement(self):
+        plan = compile_plan(
+            HEIST_KIT,
+            {"id": "bijoux-ammo", "type": "bundle", "label": "Bijoux and ammo", "percent_off": 10,
+             "requires": [{"item": "bijoux-heist-pack"}, {"item": "ammo-pistol"}]},
+            {"id": "ammo-pair", "type": "bundle", "label": "Ammo pair", "percent_off": 50,
+             "requires": [{"item": "ammo-pistol", "quantity": 2}]},
+        )
+        # 3 heist packs but only 5 rounds: 2 kits, taking fleeca, one bijoux and 4 rounds
+        quote = plan.quote(cart_of(fleeca_heist_pack=1, bijoux_heist_pack=2, ammo_pistol=5), 0)
+        kit = 900000 + 20000000 * 1 // 2 * 15 // 100 + 750000 * 4 // 5 * 15 // 100
+        # The second bundle gets the bijoux and the round the kits left over,
+        # and leaves no pair of rounds for the third
+        pair = 20000000 * 1 // 2 * 10 // 100 + 750000 * 1 // 5 * 10 // 100
+        self.assertEqual(quote.adjustments, (("Heist kit", kit), ("Bijoux and ammo", pair)))
+        self.assertEqual((kit, pair), (2490000, 1015000))
+        self.assertEqual(quote.line_discounts, {"fleeca-heist-pack": 900000, "bijoux-heist-pack": 2500000,
+                                                "ammo-pistol": 105000})
+
+        self.assertEqual(plan.quote(cart_of(fleeca_heist_pack=3, ammo_pistol=1), 0).discount_cents, 0)
+
+    def test_bundle_discounts_the_price_left_after_the_tier(self):
+        plan = compile_plan(
+            {"id": "bulk-ammo", "type": "tiers", "items": ["ammo-pistol"], "tiers": [{"min": 10, "percent_off": 10}]},
+            HEIST_KIT,
+        )
+        quote = plan.quote(cart_of(fleeca_heist_pack=1, ammo_pistol=10), 0)
+        # 10 rounds less 10% is 1350000; the kit takes 15% off 2 of them
+        self.assertEqual(quote.line_discounts, {"ammo-pistol": 150000 + 40500, "fleeca-heist-pack": 900000})
+        self.assertEqual(quote.adjustments, (("bulk-ammo", 150000), ("Heist kit", 940500)))
+        self.assertEqual(quote.total_cents, 7500000 - 1090500)
+
+    def test_total_never_goes_below_zero(self):
+        plan = compile_plan(
+            {"id": "free-packs", "type": "promo", "categories": ["Heist Pack"], "percent_off": 100},
+            dict(HEIST_KIT, percent_off=100),
+        )
+        quote = plan.quote(cart_of(fleeca_heist_pack=1, ammo_pistol=2), 0)
+        self.assertEqual(quote.line_discounts, {"fleeca-heist-pack": 6000000, "ammo-pistol": 300000})
+        self.assertEqual((quote.discount_cents, quote.total_cents), (6300000, 0))
+
+        quote = Quote(10000, {"first": 8000, "second": 8000})
+        self.assertEqual((quote.discount_cents, quote.total_cents), (10000, 0))
+
+    def test_promo_counts_only_inside_its_window(self):
+        plan = compile_plan({"id": "coke-sale", "type": "promo", "items": ["pallet-coke"], "percent_off": 20,
+                             "starts": 1000, "ends": 2000})
+        cart = cart_of(pallet_coke=1)
+        for now, discount, valid_until in ((999, 0, 1000), (1000, 21000000, 2000),
+                                           (1999.5, 21000000, 2000), (2000, 0, None)):
+            quote = plan.quote(cart, now)
+            self.assertEqual((quote.discount_cents, quote.valid_until), (discount, valid_until), now)
+
+    def test_rules_naming_unknown_items_or_categories_are_dropped(self):
+        with self.assertLogs("pricing", "WARNING") as logged:
+            plan = compile_plan(
+                {"id": "mixed", "type": "promo", "items": ["no-such-gun", "ammo-pistol"], "percent_off": 10},
+                {"id": "ghost", "type": "promo", "categories": ["No Such Category"], "percent_off": 50},
+                {"id": "ghost-kit", "type": "bundle", "percent_off": 50,
+                 "requires": [{"item": "fleeca-heist-pack"}, {"item": "no-such-gun"}]},
+                {"id": "double-count", "type": "bundle", "percent_off": 50,
+                 "requires": [{"category": "Heist Pack"}, {"item": "fleeca-heist-pack"}]},
+            )
+        self.assertEqual(len(logged.records), 4)
+        # Only the known item of the first rule is left
+        quote = plan.quote(cart_of(ammo_pistol=1, fleeca_heist_pack=2, combat_pistol=1), 0)
+        self.assertEqual(quote.line_discounts, {"ammo-pistol": 15000})
+        self.assertEqual(set(plan._line_rules), {"ammo-pistol"})
+        self.assertEqual(plan._bundles, {})
+
+
+class PricingMemoTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.pricing = Pricing(clock=self.clock)
+        self.pricing.load({"rules": [
+            {"id": "bulk-ammo", "type": "tiers", "items": ["ammo-pistol"], "tiers": [{"min": 10, "percent_off": 10}]},
+            {"id": "ammo-sale", "type": "promo", "items": ["ammo-pistol"], "percent_off": 20,
+             "starts": 1000, "ends": 2000},
+        ]})
+        self.cart = cart_of(ammo_pistol=10)
+
+    def test_same_cart_and_plan_reuse_the_quote(self):
+        quote = self.pricing.quote(self.cart, CATALOG)
+        self.assertIs(self.pricing.quote(self.cart, CATALOG), quote)
+        self.assertEqual((self.pricing.hits, self.pricing.misses), (1, 1))
+
+        # A changed cart is a new version and quoted again
+        self.cart.add(CATALOG.item("ammo-pistol"), 1)
+        self.assertEqual(self.pricing.quote(self.cart, CATALOG).discount_cents, 1650000 // 10)
+        self.assertEqual((self.pricing.hits, self.pricing.misses), (1, 2))
+        self.assertEqual(self.pricing.compiles, 1)
+
+    def test_quote_expires_at_the_next_rule_boundary(self):
+        quote = self.pricing.quote(self.cart, CATALOG)
+        self.assertEqual((quote.discount_cents, quote.valid_until), (150000, 1000))
+        self.clock.now = 999.9
+        self.assertIs(self.pricing.quote(self.cart, CATALOG), quote)
+
+        self.clock.now = 1000
+        quote = self.pricing.quote(self.cart, CATALOG)
+        self.assertEqual((quote.discount_cents, quote.valid_until), (300000, 2000))
+        self.clock.now = 2000
+        quote = self.pricing.quote(self.cart, CATALOG)
+        self.assertEqual((quote.discount_cents, quote.valid_until), (150000, None))
+        self.assertEqual((self.pricing.hits, self.pricing.misses), (1, 3))
+
+
+class PricingLoadTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "pricing_rules.json")
+        self.pricing = Pricing(self.path)
+        self.cart = Cart()
+        self.cart.add(CATALOG.item("combat-pistol"), 2)
+
+    async def asyncTearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, data):
+        with open(self.path, "w", encoding="utf-8") as f:
+            f.write(data if isinstance(data, str) else json.dumps(data))
+
+    async def test_malformed_file_fails_at_startup(self):
+        self.write(tiers(10, minimum=0))
+        with self.assertRaises(ValueError):
+            await self.pricing.warm()
+
+    async def test_no_file_means_no_discounts(self):
+        await self.pricing.warm()
+        self.assertEqual(self.pricing.quote(self.cart, CATALOG).total_cents, self.cart.total_cents)
+
+    async def test_bad_reload_keeps_the_last_good_rules(self):
+        self.write(tiers(10))
+        await self.pricing.warm()
+        plan = self.pricing.plan(CATALOG)
+        discounted = self.cart.total_cents * 9 // 10
+        self.assertEqual(self.pricing.quote(self.cart, CATALOG).total_cents, discounted)
+
+        for broken in (tiers(10, minimum=0), "{not json"):
+            self.write(broken)
+            with self.assertLogs("pricing", "ERROR"):
+                self.assertFalse(await self.pricing.reload())
+            self.assertIs(self.pricing.plan(CATALOG), plan)
+            self.assertEqual(self.pricing.quote(self.cart, CATALOG).total_cents, discounted)
+        self.assertEqual(self.pricing.stats()["reload_errors"], 2)
+
+        self.write(tiers(20))
+        self.assertTrue(await self.pricing.reload())
+        self.assertEqual(self.pricing.quote(self.cart, CATALOG).total_cents, self.cart.total_cents * 8 // 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
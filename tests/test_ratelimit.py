@@ -0,0 +1,128 @@
+# tests/test_ratelimit.py
+# Token bucket refill and duplicate suppression in the interaction gate.
+import unittest
+
+import discord
+
+from benchmarks.fakes import FakeInteraction
+from ratelimit import BucketLimiter, InteractionGate, RateLimiter, repeat_key
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def command(user_id, name, options=(), **kwargs):
+    interaction = FakeInteraction(user_id, data={"type": 1, "name": name, "options": list(options)}, **kwargs)
+    interaction.type = discord.InteractionType.application_command
+    return interaction
+
+
+class BucketLimiterTest(unittest.TestCase):
+    def test_bucket_refills_at_the_rate_up_to_the_burst(self):
+        limiter = BucketLimiter("user", rate=2.0, burst=3)
+        for _ in range(3):
+            self.assertEqual(limiter.retry_after(1, now=0.0), 0.0)
+            limiter.take(1, now=0.0)
+        self.assertAlmostEqual(limiter.retry_after(1, now=0.0), 0.5)
+        self.assertAlmostEqual(limiter.retry_after(1, now=0.25), 0.25)
+        self.assertEqual(limiter.retry_after(1, now=0.5), 0.0)
+
+        # A long idle spell refills only up to the burst
+        limiter.take(1, now=0.5)
+        limiter.retry_after(1, now=100.0)
+        for _ in range(3):
+            limiter.take(1, now=100.0)
+        self.assertGreater(limiter.retry_after(1, now=100.0), 0)
+
+    def test_rate_zero_turns_the_scope_off(self):
+        limiter = BucketLimiter("guild", rate=0, burst=0)
+        limiter.take(1)
+        self.assertEqual(limiter.retry_after(1), 0.0)
+        self.assertEqual(len(limiter), 0)
+
+    def test_least_recently_used_buckets_are_dropped(self):
+        limiter = BucketLimiter("user", rate=1.0, burst=1, max_keys=2)
+        for key in (1, 2, 1, 3):
+            limiter.retry_after(key, now=0.0)
+        self.assertEqual(list(limiter._buckets), [1, 3])
+
+
+class RateLimiterTest(unittest.TestCase):
+    def test_denied_scope_takes_no_token_from_the_others(self):
+        clock = FakeClock()
+        limiter = RateLimiter(user=(1.0, 2), guild=(1.0, 3), global_=(0, 0), clock=clock)
+        self.assertIsNone(limiter.check(1, guild_id=9))
+        self.assertIsNone(limiter.check(1, guild_id=9))
+        self.assertEqual(limiter.check(1, guild_id=9), ("user", 1.0))
+
+        # The refused call left the guild's third token for someone else
+        self.assertIsNone(limiter.check(2, guild_id=9))
+        self.assertEqual(limiter.check(3, guild_id=9)[0], "guild")
+        clock.now = 1.0
+        self.assertIsNone(limiter.check(1, guild_id=9))
+        self.assertEqual(limiter.stats()["user"], {"allowed": 4, "denied": 1, "buckets": 3})
+
+
+class RepeatKeyTest(unittest.TestCase):
+    def test_command_options_are_part_of_the_key(self):
+        first = command(1, "restock", [{"name": "item", "value": "pallet-coke"}, {"name": "quantity", "value": 5}])
+        same = command(1, "restock", [{"name": "item", "value": "pallet-coke"}, {"name": "quantity", "value": 5}])
+        other = command(1, "restock", [{"name": "item", "value": "pallet-weed"}, {"name": "quantity", "value": 5}])
+        self.assertEqual(repeat_key(first), repeat_key(same))
+        self.assertNotEqual(repeat_key(first), repeat_key(other))
+
+    def test_subcommand_options_are_part_of_the_key(self):
+        def pricing(code):
+            return command(1, "promo", [{"name": "add", "type": 1, "options": [{"name": "code", "value": code}]}])
+        self.assertNotEqual(repeat_key(pricing("SPRING")), repeat_key(pricing("SUMMER")))
+        self.assertEqual(repeat_key(pricing("SPRING")), repeat_key(pricing("SPRING")))
+
+    def test_modal_inputs_are_part_of_the_key(self):
+        def submit(quantity):
+            rows = [{"type": 1, "components": [{"type": 4, "custom_id": "quantity", "value": quantity}]}]
+            return FakeInteraction(1, data={"custom_id": "market:qty", "components": rows})
+        self.assertNotEqual(repeat_key(submit("2")), repeat_key(submit("3")))
+
+
+class InteractionGateTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        limiter = RateLimiter(user=(0, 0), guild=(0, 0), global_=(0, 0), clock=self.clock)
+        self.gate = InteractionGate(limiter, repeat_window=1.0, clock=self.clock)
+
+    async def test_redelivered_interaction_is_dropped_silently(self):
+        interaction = command(1, "market")
+        self.assertTrue(await self.gate.admit(interaction))
+        self.assertFalse(await self.gate.admit(interaction))
+        self.assertEqual(self.gate.duplicates, {"interaction": 1, "repeat": 0})
+
+    async def test_same_command_and_options_within_the_window_is_a_repeat(self):
+        options = [{"name": "item", "value": "pallet-coke"}]
+        self.assertTrue(await self.gate.admit(command(1, "stock", options)))
+        repeated = command(1, "stock", options)
+        self.assertFalse(await self.gate.admit(repeated))
+        self.assertEqual(repeated.response.last["content"], "⏳ Already working on that.")
+
+        # Different options, a different user, or a later try all go through
+        self.assertTrue(await self.gate.admit(command(1, "stock", [{"name": "item", "value": "pallet-weed"}])))
+        self.assertTrue(await self.gate.admit(command(2, "stock", options)))
+        self.clock.now = 1.0
+        self.assertTrue(await self.gate.admit(command(1, "stock", options)))
+        self.assertEqual(self.gate.duplicates["repeat"], 1)
+
+    async def test_repeated_click_is_only_acknowledged(self):
+        def click():
+            return FakeInteraction(1, data={"custom_id": "market:cart", "component_type": 2})
+        self.assertTrue(await self.gate.admit(click()))
+        repeated = click()
+        self.assertFalse(await self.gate.admit(repeated))
+        self.assertEqual(repeated.response.calls, [("defer", {})])
+
+
+if __name__ == "__main__":
+    unittest.main()
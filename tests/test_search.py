@@ -0,0 +1,83 @@
+# tests/test_search.py
+# Autocomplete search over catalog.json, and over a guild overlay.
+import os
+import unittest
+
+from catalog import Catalog, GuildCatalog
+from search import OverlaySearch, SearchIndex
+
+CATALOG = Catalog.from_file(os.path.join(os.path.dirname(os.path.dirname(__file__)), "catalog.json"))
+
+
+def ids(items):
+    return [item["id"] for item in items]
+
+
+class SearchIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.index = SearchIndex(CATALOG)
+
+    def test_empty_query_lists_items_in_catalog_order(self):
+        self.assertEqual(ids(self.index.search("", 3)), ["combat-pistol", "mk2-pistol", "glock18c"])
+
+    def test_prefixes_match_names_and_later_words_in_name_order(self):
+        # "Pistol" is the second word of each of these names
+        self.assertEqual(ids(self.index.search("pi")), ["ammo-pistol", "combat-pistol", "mk2-pistol"])
+        self.assertEqual(ids(self.index.search("Heist")), ["bijoux-heist-pack", "fleeca-heist-pack", "paleto-heist-pack"])
+        self.assertEqual(ids(self.index.search("  SMG ")), ["ammo-smg", "micro-smg"])
+
+    def test_one_and_two_character_queries_use_prefixes_only(self):
+        self.assertEqual(ids(self.index.search("mk")), ["mk2-pistol"])
+        self.assertEqual(
+            ids(self.index.search("p")),
+            ["bijoux-heist-pack", "fleeca-heist-pack", "paleto-heist-pack", "pallet-coke", "pallet-weed",
+             "combat-pdw", "ammo-pistol", "combat-pistol", "mk2-pistol"],
+        )
+        self.assertEqual(ids(self.index.search("p", 2)), ["bijoux-heist-pack", "fleeca-heist-pack"])
+        self.assertEqual(ids(self.index.search("zz")), [])
+
+    def test_trigrams_fill_in_after_prefix_matches(self):
+        # Glock18c only mentions a pistol in its description
+        self.assertEqual(ids(self.index.search("pis")), ["ammo-pistol", "combat-pistol", "mk2-pistol", "glock18c"])
+        self.assertEqual(ids(self.index.search("leeca")), ["fleeca-heist-pack"])
+        self.assertEqual(ids(self.index.search("cocaine")), ["pallet-coke"])
+        self.assertEqual(ids(self.index.search("xyz")), [])
+
+    def test_typos_are_tolerated(self):
+        self.assertEqual(ids(self.index.search("shotgn")), ["shotgun", "ammo-shotgun"])
+        self.assertEqual(ids(self.index.search("pistle")), ["ammo-pistol", "combat-pistol", "glock18c", "mk2-pistol"])
+        self.assertEqual(ids(self.index.search("hiest pack")), ["bijoux-heist-pack", "fleeca-heist-pack", "paleto-heist-pack"])
+
+    def test_padding_trigrams_alone_are_not_a_match(self):
+        # "pis" shares only padded trigrams (a word starting with "p", one
+        # ending in "is") with Pallet Weed
+        self.assertNotIn("pallet-weed", ids(self.index.search("pis")))
+        self.assertNotIn("bijoux-heist-pack", ids(self.index.search("pistol")))
+
+
+class OverlaySearchTest(unittest.TestCase):
+    def setUp(self):
+        guild = GuildCatalog(CATALOG, {
+            "items": {"combat-pistol": {"name": "Service Pistol"}, "mk2-pistol": None},
+            "add": [{"id": "pink-pistol", "category": "Guns", "name": "Pink Pistol", "price": 1000}],
+        })
+        self.search = OverlaySearch(SearchIndex(CATALOG), guild)
+
+    def test_guild_entries_replace_hide_and_add_items(self):
+        found = self.search.search("pis")
+        self.assertEqual(ids(found), ["combat-pistol", "pink-pistol", "ammo-pistol", "glock18c"])
+        self.assertEqual(found[0]["name"], "Service Pistol")
+
+    def test_renamed_item_appears_once_with_its_new_name(self):
+        self.assertEqual(ids(self.search.search("service")), ["combat-pistol"])
+        # Still found by its description, but never as the base "Combat Pistol"
+        found = self.search.search("combat")
+        self.assertEqual(ids(found), ["combat-pistol", "combat-pdw", "shotgun"])
+        self.assertEqual(found[0]["name"], "Service Pistol")
+
+    def test_limit_counts_guild_and_base_items(self):
+        self.assertEqual(ids(self.search.search("p", 3)), ["pink-pistol", "combat-pistol", "bijoux-heist-pack"])
+
+
+if __name__ == "__main__":
+    unittest.main()
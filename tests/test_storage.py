@@ -0,0 +1,85 @@
+# tests/test_storage.py
+import os
+import tempfile
+import time
+import unittest
+
+from cart_store import MemoryCartStore
+from catalog import Catalog
+from inventory import Inventory, LocalStock
+from sessions import SessionStore
+from storage import OrderStore
+
+CATALOG = Catalog.from_file(os.path.join(os.path.dirname(os.path.dirname(__file__)), "catalog.json"))
+
+
+class OrderStoreTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = OrderStore(os.path.join(self.tmp.name, "market.db"), flush_interval=60)
+        await self.store.start()
+
+    async def asyncTearDown(self):
+        await self.store.close()
+        self.tmp.cleanup()
+
+    async def test_recording_an_order_keeps_a_cart_started_since(self):
+        self.store.save_cart(1, [["combat-pistol", 1]])
+        # Checkout removes the confirmed cart; the order is recorded later,
+        # after the user has started another one
+        self.store.delete_cart(1)
+        self.store.save_cart(1, [["micro-smg", 3]])
+        self.store.record_order(1, 550.0, [{"id": "combat-pistol", "quantity": 1}])
+        await self.store.flush()
+
+        self.assertEqual(await self.store.load_cart(1), [["micro-smg", 3]])
+        orders = await self.store.recent_orders(1)
+        self.assertEqual([order["total"] for order in orders], [550.0])
+
+    async def age_carts(self, seconds, *user_ids):
+        def backdate():
+            with self.store._conn:
+                self.store._conn.executemany(
+                    "UPDATE carts SET updated_at = updated_at - ? WHERE user_id = ?",
+                    [(seconds, user_id) for user_id in user_ids]
+                )
+        await self.store._run(backdate)
+
+    async def test_prune_deletes_only_old_carts_nobody_is_using(self):
+        for user_id in (1, 2, 3, 4):
+            self.store.save_cart(user_id, [["combat-pistol", user_id]])
+        await self.store.flush()
+        await self.age_carts(3600, 1, 2, 3)
+        # 3 has a newer write waiting to be flushed
+        self.store.save_cart(3, [["micro-smg", 1]])
+
+        pruned = await self.store.prune_carts(time.time() - 1800, keep={2})
+
+        self.assertEqual(pruned, [1])
+        self.assertIsNone(await self.store.load_cart(1))
+        for user_id in (2, 3, 4):
+            self.assertIsNotNone(await self.store.load_cart(user_id))
+        self.assertEqual(self.store.carts_pruned, 1)
+
+    async def test_sweep_releases_the_stock_of_abandoned_carts(self):
+        stock = LocalStock(Inventory(hold_ttl=7200), self.store, expire_interval=0)
+        await stock.start(CATALOG)
+        carts = MemoryCartStore(SessionStore(idle_ttl=1800), self.store, lambda item_id, guild_id=None: CATALOG.item(item_id))
+        carts.on_expire.append(stock.release)
+        for user_id in (1, 2):
+            await stock.reserve(user_id, {"pallet-coke": 2})
+            await carts.update(user_id, lambda cart: cart.add(CATALOG.item("pallet-coke"), 2))
+        await self.store.flush()
+        await self.age_carts(3600, 1, 2)
+        # 1's session has gone (a restart, or the idle TTL); 2 is still shopping
+        carts.sessions.discard(1)
+
+        self.assertEqual(await carts.sweep(), 1)
+        self.assertIsNone(await carts.load(1))
+        self.assertIsNotNone(await carts.load(2))
+        self.assertEqual(stock.available("pallet-coke"), 3)
+        stock.stop()
+
+
+if __name__ == "__main__":
+    unittest.main()